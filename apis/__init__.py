@@ -1 +1 @@
-from .mgc import MGCAPI
\ No newline at end of file
+from .mgc import MGCAPI, MGCError
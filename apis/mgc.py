@@ -1,22 +1,180 @@
-from dotenv import load_dotenv
-from typing import Optional, Dict, Any
-import os
-load_dotenv()
-base_url = os.getenv("MGC_API_URL")
+from typing import Optional, Dict, Any, Callable, List
+import logging
+import threading
+import time
+from core.config import settings
+base_url = settings.mgc_api_url
+MGC_POOL_SIZE = settings.mgc_pool_size
+MGC_TIMEOUT = settings.mgc_timeout
 import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class MGCError(Exception):
+    """ O MGC não respondeu (timeout, erro de conexão ou resposta de erro): a ausência da política não foi confirmada. """
+
+
+class _InFlightRequest:
+    """ Requisição ao MGC em andamento, compartilhada por todos que aguardam o mesmo titular. """
 
-class MGCAPI:
     def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[Dict[str, Dict[str, Any]]] = None
+
+
+class MGCAPI:
+    def __init__(
+        self,
+        base_url: Optional[str] = base_url,
+        on_consentimentos: Optional[Callable[[str, Dict[str, Dict[str, Any]]], None]] = None,
+        pool_size: int = MGC_POOL_SIZE,
+        timeout: float = MGC_TIMEOUT,
+    ):
+        """
+        Args:
+            base_url: URL base da API do MGC.
+            on_consentimentos: Callback chamado uma única vez por busca com todos os
+                consentimentos do titular ({dispositivo_id: consentimento}), usado para
+                popular o cache de uma só vez.
+            pool_size: Número máximo de conexões keep-alive mantidas com o MGC.
+            timeout: Timeout (em segundos) de cada requisição.
+        """
         self.base_url = base_url
+        self.on_consentimentos = on_consentimentos
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._session: Optional[requests.Session] = None
+        self._in_flight: Dict[str, _InFlightRequest] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "coalesced": 0,
+            "errors": 0,
+            "consents_received": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+        }
+
+    @property
+    def session(self) -> requests.Session:
+        """ Sessão com pool de conexões reaproveitadas entre as requisições, criada na primeira busca. """
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
 
     def get_politica_privacidade(self, titular_id: str, dispositivo_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca a política ativa de um dispositivo, reaproveitando a busca de todo o titular.
+        Returns:
+            - A política, ou None se o MGC respondeu que o dispositivo não tem consentimento.
+        Raises:
+            MGCError: se a busca falhou (a ausência não deve ser cacheada).
+        """
+        consentimentos = self.get_consentimentos_titular(titular_id)
+        if consentimentos is None:
+            raise MGCError(f"falha ao buscar os consentimentos do titular {titular_id}.")
+        return consentimentos.get(str(dispositivo_id))
+
+    def get_consentimentos_titular(self, titular_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Busca todos os consentimentos de um titular, indexados por dispositivo.
+        Buscas concorrentes para o mesmo titular são agrupadas em uma única requisição HTTP.
+        Returns:
+            - Os consentimentos ({} se o titular não tem nenhum) ou None em caso de erro.
+        """
+        with self._lock:
+            in_flight = self._in_flight.get(titular_id)
+            leader = in_flight is None
+            if leader:
+                in_flight = _InFlightRequest()
+                self._in_flight[titular_id] = in_flight
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            in_flight.done.wait(self.timeout * 2)
+            return in_flight.result
+
+        try:
+            in_flight.result = self._fetch_consentimentos(titular_id)
+            if in_flight.result is not None and self.on_consentimentos:
+                self.on_consentimentos(titular_id, in_flight.result)
+        finally:
+            with self._lock:
+                del self._in_flight[titular_id]
+            in_flight.done.set()
+        return in_flight.result
+
+    def list_consentimentos(self, pagina: int, tamanho: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Busca uma página de todos os consentimentos ativos (GET /consentimentos?pagina=&tamanho=),
+        usada no warm-up. A resposta pode ser uma lista ou um objeto com a lista em "itens".
+        Returns:
+            - A lista de consentimentos da página (vazia após a última) ou None em caso de erro.
+        """
+        start = time.perf_counter()
+        try:
+            response = self.session.get(
+                f"{self.base_url}/consentimentos", params={"pagina": pagina, "tamanho": tamanho}, timeout=self.timeout,
+            )
+            response.raise_for_status()
+            body = response.json()
+            itens = body.get("itens", []) if isinstance(body, dict) else body
+            self._record(start, consents=len(itens))
+            return itens
+        except (requests.RequestException, ValueError, AttributeError) as e:
+            self._record(start, error=True)
+            logger.warning("Erro ao listar consentimentos (página %d): %s", pagina, e)
+            return None
+
+    def get_stats(self) -> Dict[str, float]:
+        """ Retorna as estatísticas de uso do cliente do MGC. """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["latency_avg"] = stats["latency_total"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
+
+    def _fetch_consentimentos(self, titular_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        start = time.perf_counter()
         try:
             url = f"{self.base_url}/consentimentos/titular/{titular_id}"
-            response = requests.get(url, timeout=5)
+            response = self.session.get(url, timeout=self.timeout)
+            consentimentos = {}
+            if response.status_code == 404:
+                # Titular desconhecido no MGC: resposta explícita de que não há consentimento.
+                self._record(start)
+                return consentimentos
             response.raise_for_status() # Lança um erro para status HTTP 4xx/5xx
-            consentimentos = response.json()
-            politica_ativa = next((c for c in consentimentos if c.get("dispositivo_id") == dispositivo_id), None)
-            return politica_ativa
-        except requests.RequestException as e:
-            print(f"Erro ao buscar políticas de privacidade para o titular {titular_id}: {e}")
-            return None
\ No newline at end of file
+            itens = response.json()
+            if not isinstance(itens, list):
+                raise ValueError(f"resposta inesperada do MGC: {type(itens).__name__}")
+            for c in itens:
+                if not isinstance(c, dict) or c.get("dispositivo_id") is None:
+                    logger.warning("Consentimento inválido ignorado para o titular %s: %r", titular_id, c)
+                    continue
+                # Mantém apenas o primeiro consentimento de cada dispositivo.
+                consentimentos.setdefault(str(c["dispositivo_id"]), c)
+            self._record(start, consents=len(consentimentos))
+            return consentimentos
+        except (requests.RequestException, ValueError) as e:
+            self._record(start, error=True)
+            logger.warning("Erro ao buscar políticas de privacidade para o titular %s: %s", titular_id, e)
+            return None
+
+    def _record(self, start: float, consents: int = 0, error: bool = False):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["consents_received"] += consents
+            self._stats["latency_total"] += elapsed
+            self._stats["latency_max"] = max(self._stats["latency_max"], elapsed)
+            if error:
+                self._stats["errors"] += 1
@@ -0,0 +1,83 @@
+"""
+Compara os codecs de payload (tamanho e CPU por mensagem) com mensagens típicas de dispositivos.
+
+Exemplo:
+    python -m benchmarks.codec_benchmark --messages 100000
+"""
+import argparse
+import json
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+
+def sample_payloads(count: int, seed: int) -> Dict[str, List[Dict[str, Any]]]:
+    """ Mensagens escalares (um valor) e compostas (vários sensores aninhados). """
+    rng = random.Random(seed)
+    scalar = [
+        {"dispositivo_id": f"dev{i}", "titular_id": f"tit{i % 50}", "value": rng.uniform(0, 100), "timestamp": time.time()}
+        for i in range(count)
+    ]
+    nested = [
+        {
+            "dispositivo_id": f"dev{i}",
+            "titular_id": f"tit{i % 50}",
+            "timestamp": time.time(),
+            "sensores": {
+                "temperatura": rng.uniform(-10, 40),
+                "umidade": rng.uniform(0, 100),
+                "aceleracao": [rng.gauss(0, 1) for _ in range(3)],
+            },
+            "bateria": rng.randint(0, 100),
+            "online": True,
+        }
+        for i in range(count)
+    ]
+    return {"escalar": scalar, "aninhada": nested}
+
+
+def cpu_per_message(fn: Callable[[Any], Any], items: List[Any]) -> float:
+    """ Tempo de CPU (microssegundos) por item. """
+    start = time.process_time()
+    for item in items:
+        fn(item)
+    return (time.process_time() - start) / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos codecs de payload.")
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    from core.codecs import CODECS, StorageSerializer
+
+    codecs: Dict[str, Any] = dict(CODECS)
+    # Referência: o módulo json da biblioteca padrão, usado antes da camada de codecs.
+    codecs["json (stdlib)"] = type("StdlibJson", (), {
+        "encode": staticmethod(lambda obj: json.dumps(obj).encode()),
+        "decode": staticmethod(json.loads),
+    })()
+
+    for kind, payloads in sample_payloads(args.messages, args.seed).items():
+        print(f"\nMensagem {kind} ({args.messages} mensagens)")
+        print(f"  {'codec':16s} {'bytes/msg':>10s} {'encode µs':>10s} {'decode µs':>10s}")
+        for name, codec in codecs.items():
+            encoded = [codec.encode(p) for p in payloads]
+            views = [memoryview(e) for e in encoded] if name != "json (stdlib)" else encoded
+            size = sum(len(e) for e in encoded) / len(encoded)
+            encode_us = cpu_per_message(codec.encode, payloads)
+            decode_us = cpu_per_message(codec.decode, views)
+            print(f"  {name:16s} {size:10.1f} {encode_us:10.2f} {decode_us:10.2f}")
+
+        print("  Armazenamento no Redis (valor prefixado pelo codec):")
+        for name in CODECS:
+            serializer = StorageSerializer(name)
+            stored = [serializer.dumps(p) for p in payloads]
+            size = sum(len(s) for s in stored) / len(stored)
+            roundtrip_us = cpu_per_message(lambda p: serializer.loads(serializer.dumps(p)), payloads)
+            print(f"  {name:16s} {size:10.1f} {'ida e volta':>10s} {roundtrip_us:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Benchmark reprodutível do gateway com substitutos locais (Redis em memória, MGC stub e
+cliente MQTT que captura as publicações).
+
+Exemplo:
+    python -m benchmarks.run_benchmark --devices 500 --titulars 50 --messages 50000 \
+        --mix RAW=0.4,GNOISE=0.4,AVG=0.2 --rate 0 --batch-size 100
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.standins import REDIS_OPS, CapturingMqttClient, StubMGCServer, install_fake_redis
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+# Métricas comparadas com --compare, e se "maior é melhor".
+COMPARED_METRICS = {
+    "throughput_msgs_per_sec": True,
+    "latency_p50_ms": False,
+    "latency_p99_ms": False,
+    "redis_round_trips_per_msg": False,
+    "redis_commands_per_msg": False,
+    "emission_jitter_p99_ms": False,
+}
+
+
+def parse_mix(mix: str) -> List[Tuple[str, float]]:
+    """ Converte "RAW=0.5,GNOISE=0.3,AVG=0.2" em [(ação, peso), ...]. """
+    weights = []
+    for item in mix.split(","):
+        action, weight = item.split("=")
+        weights.append((action.strip().upper(), float(weight)))
+    return weights
+
+
+def build_fleet(args) -> Tuple[List[Tuple[str, str]], Dict[str, List[Dict[str, Any]]]]:
+    """ Gera os dispositivos simulados e os consentimentos que o MGC stub vai servir. """
+    rng = random.Random(args.seed)
+    actions, weights = zip(*parse_mix(args.mix))
+    chaves = {
+        "RAW": "RAW",
+        "GNOISE": f"GNOISE:sigma={args.sigma}",
+        # Pipeline de campo: arredonda, adiciona ruído (sem alterar o horário) e agrega.
+        "PIPELINE": f"ROUND:campos=value,casas=2|GNOISE:sigma={args.sigma},sigma.timestamp=0|AVG:none:{args.interval}:{args.interval}",
+    }
+    devices = []
+    consentimentos: Dict[str, List[Dict[str, Any]]] = {}
+    for i in range(args.devices):
+        dispositivo_id = f"dev{i}"
+        titular_id = f"tit{i % args.titulars}"
+        action = rng.choices(actions, weights)[0]
+        chave = chaves.get(action, f"{action}:none:{args.interval}:{args.interval}")
+        devices.append((dispositivo_id, titular_id))
+        consentimentos.setdefault(titular_id, []).append({
+            "dispositivo_id": dispositivo_id,
+            "titular_id": titular_id,
+            "opcao_tratamento": {"chave_politica": chave},
+        })
+    return devices, consentimentos
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def aggregate_emissions(messages: List[Tuple[float, str, Any]]) -> Dict[str, List[float]]:
+    """ Horários de publicação dos agregados emitidos pelo scheduler, por dispositivo. """
+    emissions: Dict[str, List[float]] = {}
+    for published_at, _, payload in messages:
+        body = json.loads(payload)
+        # Com PUBLISHER_COALESCE, cada mensagem é um envelope com vários resultados.
+        for result in body.get("mensagens", [body]):
+            if set(result) == {"dispositivo_id", "titular_id", "value", "janela"}:
+                emissions.setdefault(result["dispositivo_id"], []).append(published_at)
+    return emissions
+
+
+def emission_jitter(emissions: Dict[str, List[float]], interval_seconds: int) -> List[float]:
+    """
+    Desvio (em segundos) entre emissões consecutivas de um mesmo tópico e o intervalo configurado,
+    um valor por par de emissões consecutivas (vazio se nenhum dispositivo emitiu duas vezes).
+    """
+    jitter = []
+    for times in emissions.values():
+        jitter.extend(abs((b - a) - interval_seconds) for a, b in zip(times, times[1:]))
+    return jitter
+
+
+def run(args) -> Dict[str, Any]:
+    devices, consentimentos = build_fleet(args)
+    mgc = StubMGCServer(consentimentos, latency=args.mgc_latency_ms / 1000)
+    os.environ["MGC_API_URL"] = mgc.start()
+    os.environ.setdefault("METRICS_PORT", "0")
+    os.environ["PAYLOAD_CODEC"] = args.codec
+    # O warm-up do benchmark usa apenas o MGC stub, nunca um snapshot local.
+    os.environ["WARMUP_SOURCES"] = "mgc"
+    install_fake_redis()
+
+    # Importados depois de ajustar o ambiente, que os módulos de `core` leem na importação.
+    from core.codecs import get_codec
+    from core.gateway import PrivacyGateway
+    from core.policy_parser import parse_time_string
+    from core.policy_plan import get_policy_plan
+    from core.windowing import WINDOW_ALLOWED_LATENESS
+    from treatments.noise_engine import noise_engine
+
+    noise_engine.reseed(args.seed)
+    gateway = PrivacyGateway()
+    client = CapturingMqttClient()
+    gateway.mqtt_client = client
+    if args.warmup:
+        gateway.warmup.run()
+    gateway.publisher.start()
+    gateway.scheduler.start()
+
+    codec = get_codec(args.codec)
+    rng = random.Random(args.seed + 1)
+    latencies: List[float] = []
+    ops_before = REDIS_OPS.snapshot()
+    start = time.perf_counter()
+    batch: List[Tuple[str, bytes, Optional[str]]] = []
+    batch_scheduled: List[float] = []
+    for i in range(args.messages):
+        scheduled = start + i / args.rate if args.rate else time.perf_counter()
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        dispositivo_id, titular_id = devices[rng.randrange(len(devices))]
+        payload = codec.encode({
+            "dispositivo_id": dispositivo_id,
+            "titular_id": titular_id,
+            "value": rng.uniform(0, 100),
+            "timestamp": time.time(),
+        })
+        topic = f"dispositivos/{dispositivo_id}/dados"
+        if args.batch_size > 1:
+            batch.append((topic, payload, None))
+            batch_scheduled.append(scheduled)
+            if len(batch) >= args.batch_size or i == args.messages - 1:
+                gateway.handle_received_batch(batch)
+                finished = time.perf_counter()
+                latencies.extend(finished - s for s in batch_scheduled)
+                batch, batch_scheduled = [], []
+        else:
+            gateway.handle_received_data(topic, payload)
+            latencies.append(time.perf_counter() - scheduled)
+    elapsed = time.perf_counter() - start
+    ops_after = REDIS_OPS.snapshot()
+    gateway.publisher.flush()
+    published_during_ingestion = client.count()
+
+    # Janelas vazias não são publicadas: para que cada dispositivo agregado emita em janelas
+    # consecutivas (e o jitter tenha pares para medir), a ingestão continua por --jitter-intervals
+    # intervalos, com uma mensagem por dispositivo agregado em cada um.
+    interval_seconds = parse_time_string(args.interval)
+    accumulated = [
+        (c["dispositivo_id"], c["titular_id"])
+        for politicas in consentimentos.values() for c in politicas
+        if get_policy_plan(c).accumulated
+    ]
+    for _ in range(args.jitter_intervals if accumulated else 0):
+        next_interval = (int(time.time()) // interval_seconds + 1) * interval_seconds
+        gateway.handle_received_batch([
+            (f"dispositivos/{d}/dados", codec.encode({"dispositivo_id": d, "titular_id": t, "value": rng.uniform(0, 100), "timestamp": time.time()}), None)
+            for d, t in accumulated
+        ])
+        time.sleep(max(next_interval - time.time(), 0.0) + 0.01)
+
+    # Espera as próximas emissões do scheduler para medir o jitter.
+    # Cada janela só é emitida WINDOW_ALLOWED_LATENESS segundos depois do seu fim.
+    time.sleep(args.drain if args.drain is not None else 2 * interval_seconds + WINDOW_ALLOWED_LATENESS + 0.5)
+    gateway.scheduler.stop()
+    gateway.publisher.stop()
+    mgc.stop()
+
+    emissions = aggregate_emissions(client.messages)
+    jitter = emission_jitter(emissions, interval_seconds)
+    # Sem pares de emissões consecutivas, o jitter não é medido (None, e não 0).
+    jitter_p50 = percentile(jitter, 0.50) * 1000 if jitter else None
+    jitter_p99 = percentile(jitter, 0.99) * 1000 if jitter else None
+    scheduler_stats = gateway.scheduler.stats()
+    return {
+        "messages": args.messages,
+        "elapsed_sec": elapsed,
+        "throughput_msgs_per_sec": args.messages / elapsed if elapsed else 0.0,
+        "latency_p50_ms": percentile(latencies, 0.50) * 1000,
+        "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+        "latency_max_ms": max(latencies, default=0.0) * 1000,
+        "redis_round_trips_per_msg": (ops_after[0] - ops_before[0]) / args.messages,
+        "redis_commands_per_msg": (ops_after[1] - ops_before[1]) / args.messages,
+        "published_during_ingestion": published_during_ingestion,
+        "mgc_requests": mgc.requests,
+        "warmup_sec": gateway.warmup.stats()["duration"],
+        "aggregate_emissions": sum(len(times) for times in emissions.values()),
+        "emission_pairs": len(jitter),
+        "emission_jitter_p50_ms": jitter_p50,
+        "emission_jitter_p99_ms": jitter_p99,
+        "scheduler_lag_avg_ms": scheduler_stats["lag_avg"] * 1000,
+        "scheduler_lag_max_ms": scheduler_stats["lag_max"] * 1000,
+    }
+
+
+def compare(results: Dict[str, Any], baseline_path: Path):
+    report = json.loads(baseline_path.read_text())
+    baseline = report["results"]
+    print(f"\nComparação com {baseline_path} (commit {report.get('git_commit')}):")
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        old, new = baseline.get(metric), results.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        better = (change > 0) == higher_is_better
+        print(f"  {metric:30s} {old:12.3f} -> {new:12.3f} ({change:+.1f}%{'' if abs(change) < 1 else ' melhor' if better else ' pior'})")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark do Gateway de Privacidade com substitutos locais.")
+    parser.add_argument("--devices", type=int, default=200, help="Número de dispositivos simulados.")
+    parser.add_argument("--titulars", type=int, default=20, help="Número de titulares.")
+    parser.add_argument("--messages", type=int, default=20000, help="Total de mensagens enviadas.")
+    parser.add_argument("--rate", type=float, default=0, help="Mensagens/s (0 = o mais rápido possível).")
+    parser.add_argument("--mix", default="RAW=0.4,GNOISE=0.4,AVG=0.2", help="Proporção de políticas por ação.")
+    parser.add_argument("--interval", default="1S", help="Intervalo das políticas acumuladas (ex: 1S, 10S).")
+    parser.add_argument("--sigma", type=float, default=1.0, help="Sigma das políticas GNOISE.")
+    parser.add_argument("--codec", default="json", help="Codec dos payloads dos dispositivos (json, msgpack, cbor).")
+    parser.add_argument("--batch-size", type=int, default=1, help="> 1 usa handle_received_batch com lotes deste tamanho.")
+    parser.add_argument("--mgc-latency-ms", type=float, default=0, help="Latência artificial do MGC stub.")
+    parser.add_argument("--warmup", action="store_true", help="Executa o warm-up de políticas (via MGC stub) antes do envio.")
+    parser.add_argument(
+        "--jitter-intervals", type=int, default=3,
+        help="Intervalos seguintes ao envio com uma mensagem por dispositivo agregado, para medir o jitter das emissões (0 desativa).",
+    )
+    parser.add_argument("--drain", type=float, default=None, help="Segundos aguardando emissões do scheduler ao final.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, default=None, help="Arquivo JSON de resultados (padrão: benchmarks/results/).")
+    parser.add_argument("--compare", type=Path, default=None, help="Resultado anterior (JSON) para comparação.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    results = run(args)
+    commit = git_commit()
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": sys.version.split()[0],
+        "config": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+        "results": results,
+    }
+    output = args.output
+    if output is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        output = RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit or 'nogit'}.json"
+    output.write_text(json.dumps(report, indent=2))
+
+    for metric, value in results.items():
+        print(f"{metric:30s} {value:.3f}" if isinstance(value, float) else f"{metric:30s} {value}")
+    print(f"\nResultados salvos em {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Substitutos locais das dependências externas do gateway, usados pelo benchmark:
+Redis em memória (fakeredis) com contagem de operações, um servidor HTTP que imita
+a API do MGC e um cliente MQTT que apenas captura as publicações.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import redis
+from redis.client import Pipeline
+
+# fakeredis (extra "bench") só é importado por install_fake_redis: os testes usam o MGC
+# substituto deste módulo sem instalá-lo.
+if TYPE_CHECKING:
+    import fakeredis
+
+
+class RedisOpsCounter:
+    """ Conta idas ao Redis (round trips) e comandos executados. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.round_trips = 0
+        self.commands = 0
+
+    def record(self, commands: int):
+        with self._lock:
+            self.round_trips += 1
+            self.commands += commands
+
+    def snapshot(self) -> Tuple[int, int]:
+        with self._lock:
+            return self.round_trips, self.commands
+
+
+REDIS_OPS = RedisOpsCounter()
+
+
+class _CountingPipeline(Pipeline):
+    def execute(self, raise_on_error: bool = True):
+        if self.command_stack:
+            REDIS_OPS.record(len(self.command_stack))
+        return super().execute(raise_on_error)
+
+
+def install_fake_redis() -> "fakeredis.FakeServer":
+    """
+    Substitui `redis.Redis` por um FakeRedis em memória que conta as operações.
+    Deve ser chamado antes do primeiro uso do `cache_manager`, que conecta ao Redis nesse momento.
+    """
+    import fakeredis
+
+    server = fakeredis.FakeServer()
+
+    class CountingFakeRedis(fakeredis.FakeRedis):
+        def __init__(self, *args, **kwargs):
+            kwargs.pop("host", None)
+            kwargs.pop("port", None)
+            super().__init__(*args, server=server, **kwargs)
+
+        def execute_command(self, *args, **options):
+            REDIS_OPS.record(1)
+            return super().execute_command(*args, **options)
+
+        def pipeline(self, transaction=True, shard_hint=None):
+            return _CountingPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+    redis.Redis = CountingFakeRedis
+    return server
+
+
+class StubMGCServer:
+    """
+    Servidor HTTP local que responde como o MGC a /consentimentos/titular/{id} e à listagem
+    paginada /consentimentos?pagina=&tamanho= usada no warm-up.
+    """
+
+    def __init__(self, consentimentos: Dict[str, List[Dict[str, Any]]], latency: float = 0.0):
+        """
+        Args:
+            consentimentos: Consentimentos por titular, no formato retornado pelo MGC.
+            latency: Atraso artificial (segundos) de cada resposta.
+        """
+        self.consentimentos = consentimentos
+        self.latency = latency
+        self.requests = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                prefix = "/consentimentos/titular/"
+                url = urlsplit(self.path)
+                if url.path.startswith(prefix):
+                    result = stub.consentimentos.get(url.path[len(prefix):], [])
+                elif url.path == "/consentimentos":
+                    params = parse_qs(url.query)
+                    pagina, tamanho = int(params["pagina"][0]), int(params["tamanho"][0])
+                    todos = [c for consentimentos in stub.consentimentos.values() for c in consentimentos]
+                    result = todos[(pagina - 1) * tamanho:pagina * tamanho]
+                else:
+                    self.send_error(404)
+                    return
+                stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                body = json.dumps(result).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, name="stub-mgc", daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+
+
+class _PublishInfo:
+    """ Imita o MQTTMessageInfo retornado por paho.mqtt.client.Client.publish. """
+
+    rc = 0
+    mid = 0
+
+    def is_published(self) -> bool:
+        return True
+
+    def wait_for_publish(self, timeout: Optional[float] = None):
+        return None
+
+
+class CapturingMqttClient:
+    """ Cliente MQTT que registra (horário, tópico, payload) de cada publicação em vez de enviá-la. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.messages: List[Tuple[float, str, Any]] = []
+
+    def publish(self, topic: str, payload: Any = None, qos: int = 0, retain: bool = False, properties=None) -> _PublishInfo:
+        with self._lock:
+            self.messages.append((time.time(), topic, payload))
+        return _PublishInfo()
+
+    def is_connected(self) -> bool:
+        return True
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self.messages)
@@ -0,0 +1,103 @@
+"""
+Mede o cold start do gateway: do início do processo até a primeira mensagem processada,
+com a duração de cada fase (importações, construção, backend de estado, warm-up) e os
+módulos pesados carregados por política. Cada execução é um processo Python novo, com o
+MGC stub e o backend de estado em memória (sem broker: a publicação fica na fila).
+
+Exemplo:
+    python -m benchmarks.startup_benchmark --runs 10 --policies RAW,GNOISE:sigma=1,AVG:none:10S:10S
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Dependências cuja importação domina o cold start, reportadas por execução.
+HEAVY_MODULES = ("numpy", "redis", "requests")
+
+
+def child(policy_key: str):
+    """ Processo medido: mesma sequência do main.py, até a primeira mensagem processada. """
+    from core.startup import startup
+    from core.gateway import PrivacyGateway
+    from core.cache_manager import cache_manager
+    startup.mark("imports")
+
+    gateway = PrivacyGateway()
+    cache_manager.connect()
+    startup.mark("state_backend")
+    gateway.warmup.run()
+    startup.mark("warmup")
+    payload = json.dumps({"dispositivo_id": "dev0", "titular_id": "tit0", "value": 42.0, "timestamp": time.time()}).encode()
+    gateway.handle_received_batch([("dispositivos/dev0/dados", payload, None)])
+    first_message_at = time.time()
+    print(json.dumps({
+        "policy": policy_key,
+        "first_message_at": first_message_at,
+        "phases": startup.report(),
+        "modules": len(sys.modules),
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules],
+        "publisher": gateway.publisher.stats()["submitted"],
+    }))
+    cache_manager.close()
+
+
+def run_once(policy_key: str, env: Dict[str, str]) -> Dict[str, Any]:
+    spawned_at = time.time()
+    output = subprocess.check_output([sys.executable, "-m", "benchmarks.startup_benchmark", "--child", policy_key], env=env, text=True)
+    result = json.loads(output.strip().splitlines()[-1])
+    result["cold_start_ms"] = (result.pop("first_message_at") - spawned_at) * 1000
+    return result
+
+
+def median(values: List[float]) -> float:
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2] if ordered else 0.0
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark de cold start do Gateway de Privacidade.")
+    parser.add_argument("--runs", type=int, default=5, help="Processos medidos por política.")
+    parser.add_argument("--policies", default="RAW,GNOISE:sigma=1,AVG:none:10S:10S", help="chave_politica de cada cenário.")
+    parser.add_argument("--output", type=Path, default=None, help="Arquivo JSON com todas as execuções.")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        child(args.child)
+        return
+
+    from benchmarks.standins import StubMGCServer
+
+    report: Dict[str, List[Dict[str, Any]]] = {}
+    for policy_key in args.policies.split(","):
+        consentimentos = {"tit0": [{
+            "dispositivo_id": "dev0", "titular_id": "tit0", "opcao_tratamento": {"chave_politica": policy_key},
+        }]}
+        mgc = StubMGCServer(consentimentos)
+        env = dict(
+            os.environ, MGC_API_URL=mgc.start(), STATE_BACKEND="memory", MEMORY_SNAPSHOT_PATH="",
+            WARMUP_SOURCES="mgc", WARMUP_SNAPSHOT_PATH="", METRICS_PORT="0", LOG_LEVEL="WARNING",
+        )
+        try:
+            report[policy_key] = [run_once(policy_key, env) for _ in range(args.runs)]
+        finally:
+            mgc.stop()
+
+    print(f"{'política':24s} {'cold start':>11s} {'imports':>9s} {'init':>7s} {'backend':>8s} {'warm-up':>8s} {'1ª msg':>7s}  módulos pesados")
+    for policy_key, runs in report.items():
+        phases = {phase: median([r["phases"][phase] * 1000 for r in runs]) for phase in runs[0]["phases"]}
+        print(
+            f"{policy_key:24s} {median([r['cold_start_ms'] for r in runs]):9.0f}ms {phases['imports']:7.0f}ms {phases['init']:5.0f}ms "
+            f"{phases['state_backend']:6.0f}ms {phases['warmup']:6.0f}ms {phases['first_message']:5.0f}ms  {', '.join(runs[0]['heavy_modules']) or '-'}"
+        )
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\nResultados salvos em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
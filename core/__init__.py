@@ -1,2 +1,12 @@
-from .gateway import PrivacyGateway
-from .cache_manager import cache_manager
\ No newline at end of file
+from typing import Any
+
+
+def __getattr__(name: str) -> Any:
+    # Importados só no primeiro uso: importar um submódulo de `core` não carrega o gateway inteiro.
+    if name == "PrivacyGateway":
+        from .gateway import PrivacyGateway
+        return PrivacyGateway
+    if name == "cache_manager":
+        from .cache_manager import cache_manager
+        return cache_manager
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
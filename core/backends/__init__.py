@@ -0,0 +1,20 @@
+import importlib
+from .base import StateBackend, StateBackendError
+
+__all__ = ["StateBackend", "StateBackendError", "create_backend"]
+
+# Backends disponíveis: nome -> (módulo, classe). O módulo só é importado quando o backend
+# é escolhido, então o backend em memória não exige o cliente do Redis.
+BACKENDS = {
+    "redis": ("core.backends.redis_backend", "RedisBackend"),
+    "memory": ("core.backends.memory_backend", "MemoryBackend"),
+}
+
+
+def create_backend(name: str) -> StateBackend:
+    """ Instancia (sem conectar) o backend de estado com o nome informado. """
+    try:
+        module_name, class_name = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Backend de estado desconhecido: {name} (disponíveis: {', '.join(BACKENDS)})") from None
+    return getattr(importlib.import_module(module_name), class_name)()
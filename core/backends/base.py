@@ -0,0 +1,139 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from core.config import settings
+from core.windowing import WindowSpec
+CACHE_MAX_AGE = settings.cache_ttl_time
+
+Pair = Tuple[str, str]
+Consentimentos = Dict[str, Dict[str, Dict[str, Any]]]
+
+
+class StateBackendError(ConnectionError):
+    """ O backend de estado não pôde ser inicializado (ex: Redis inacessível). """
+
+
+class StateBackend(ABC):
+    """
+    Interface do armazenamento de estado do gateway: políticas cacheadas (com os índices por
+    titular e por dispositivo), estado de agregação (anéis de panes e listas de pontos brutos)
+    e a fila de tarefas de agregação. As operações são em lote, para que backends remotos
+    façam uma única ida ao servidor por chamada.
+    """
+
+    # Rótulo do backend nas métricas de busca de políticas.
+    name = ""
+
+    @abstractmethod
+    def connect(self):
+        """ Abre as conexões (ou carrega o estado persistido); levanta StateBackendError em caso de falha. """
+        pass
+
+    def close(self):
+        """ Libera os recursos do backend (ex: grava o último snapshot). """
+        pass
+
+    @contextmanager
+    def pipelined(self):
+        """ Agrupa as escritas de acumulação feitas pela thread atual até o fim do bloco. """
+        yield
+
+    # Políticas
+
+    @abstractmethod
+    def get_policies(self, pairs: List[Pair]) -> List[Optional[Dict[str, Any]]]:
+        """ Retorna as políticas dos pares, na mesma ordem (None para os ausentes). """
+        pass
+
+    @abstractmethod
+    def set_policies(self, consentimentos: Consentimentos, ttl: int = CACHE_MAX_AGE, only_if_absent: bool = False) -> int:
+        """
+        Grava as políticas ({titular: {dispositivo: política}}) e os índices de invalidação.
+        Args:
+            only_if_absent: Se True, mantém as políticas já cacheadas (ex: warm-up de um snapshot
+                            antigo, que não pode sobrescrever políticas mais novas).
+        Returns:
+            - O número de políticas gravadas.
+        """
+        pass
+
+    @abstractmethod
+    def has_policies(self) -> bool:
+        """ Indica se há alguma política cacheada (ex: outra réplica já aquecida no mesmo Redis). """
+        pass
+
+    @abstractmethod
+    def export_policies(self, chunk_size: int = 1000) -> Consentimentos:
+        """ Exporta todas as políticas ainda válidas ({titular: {dispositivo: política}}). """
+        pass
+
+    @abstractmethod
+    def invalidate_policies(self, titulares: List[str], dispositivos: List[str], pairs: Iterable[Pair], purge: bool) -> List[Pair]:
+        """
+        Apaga as políticas de titulares inteiros, de dispositivos inteiros e/ou dos pares, e os
+        índices correspondentes. Com purge, também descarta o estado de agregação e as tarefas.
+        Returns:
+            - Os pares (dispositivo, titular) invalidados.
+        """
+        pass
+
+    # Estado de agregação
+
+    @abstractmethod
+    def update_window_pane(self, dispositivo_id: str, titular_id: str, window: WindowSpec, pane: int, value: float, sketch_bucket: Optional[str] = None, strategy: str = ""):
+        """
+        Incorpora um valor ao resumo parcial do pane no anel de janelas do par, com a mesma
+        semântica do anel do Redis (posição reaproveitada por panes mais novos e layout
+        descartado quando a janela muda). Um ponto de um pane que já saiu do anel é recusado
+        e contado em LATE_POINTS com o rótulo `strategy`.
+        """
+        pass
+
+    @abstractmethod
+    def get_window_states(self, pairs: List[Pair]) -> List[Dict[str, Any]]:
+        """ Lê, sem apagar, o anel de panes de cada par no formato de campos "posição|campo". """
+        pass
+
+    # Fila de tarefas de agregação
+
+    @abstractmethod
+    def schedule_tasks(self, tasks: Dict[Pair, float], only_if_absent: bool = False, only_if_earlier: bool = False):
+        """
+        Agenda as tarefas. Com only_if_absent, tarefas já agendadas são mantidas; com
+        only_if_earlier, só são antecipadas (as ausentes são criadas nos dois casos).
+        """
+        pass
+
+    @abstractmethod
+    def claim_due_tasks(self, limit: int, lease_until: float, slots: Iterable[int]) -> List[Tuple[str, str, float]]:
+        """ Reserva atomicamente até `limit` tarefas vencidas, movendo-as para o fim da reserva. """
+        pass
+
+    @abstractmethod
+    def release_tasks(self, pairs: Iterable[Pair], lease_until: float):
+        """ Remove as tarefas que ainda estão com a reserva `lease_until`. """
+        pass
+
+    @abstractmethod
+    def next_due(self, slots: Iterable[int]) -> Optional[float]:
+        pass
+
+    def listen_remote_schedules(self, callback: Callable[[float], None]):
+        """ Recebe os avisos de tarefas agendadas por outras réplicas (apenas backends compartilhados). """
+        pass
+
+    def migrate_unsharded_tasks(self) -> int:
+        """
+        Move as tarefas da fila única (anterior ao cluster) para as filas dos slots e retorna
+        quantas foram movidas. Backends locais não são compartilhados e não têm fila anterior.
+        """
+        return 0
+
+    # Cluster
+
+    def cluster_heartbeat(self, members_key: str, node_id: str, now: float, node_ttl: float) -> List[str]:
+        """ Backends locais não são compartilhados: a réplica é sempre a única do cluster. """
+        return [node_id]
+
+    def cluster_leave(self, members_key: str, node_id: str):
+        pass
@@ -0,0 +1,275 @@
+import heapq
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from core.codecs import storage
+from core.config import settings
+from core.metrics import LATE_POINTS
+from core.state_files import state_path, write_state_file
+from core.windowing import WindowSpec
+from .base import CACHE_MAX_AGE, Consentimentos, Pair, StateBackend, StateBackendError
+# Arquivo de snapshot do estado em memória (vazio desativa) e intervalo entre gravações.
+MEMORY_SNAPSHOT_PATH = state_path(settings.memory_snapshot_path)
+MEMORY_SNAPSHOT_INTERVAL = settings.memory_snapshot_interval
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend(StateBackend):
+    """
+    Estado no próprio processo, para gateways de nó único (ex: borda) sem o salto até o
+    Redis. Todas as operações são protegidas por um único lock; a fila de tarefas é um heap
+    com remoção preguiçosa (entradas cujo horário não confere com o atual são ignoradas).
+    Com MEMORY_SNAPSHOT_PATH, o estado é gravado periodicamente em disco e recarregado ao
+    iniciar. Não pode ser usado em cluster: o estado não é compartilhado entre réplicas.
+    """
+
+    name = "memory"
+
+    def __init__(self, snapshot_path: str = MEMORY_SNAPSHOT_PATH, snapshot_interval: float = MEMORY_SNAPSHOT_INTERVAL):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._lock = threading.RLock()
+        # (dispositivo, titular) -> (expira em, política)
+        self._policies: Dict[Pair, Tuple[float, Dict[str, Any]]] = {}
+        self._titular_index: Dict[str, Set[str]] = {}
+        self._device_index: Dict[str, Set[str]] = {}
+        # (dispositivo, titular) -> [expira em, layout da janela, {posição: campos do pane}]
+        self._windows: Dict[Pair, List[Any]] = {}
+        self._task_due: Dict[Pair, float] = {}
+        self._task_heap: List[Tuple[float, Pair]] = []
+        self._stop_event = threading.Event()
+        self._snapshot_thread: Optional[threading.Thread] = None
+
+    def connect(self):
+        if self.snapshot_path:
+            self._load_snapshot()
+            self._snapshot_thread = threading.Thread(target=self._run_snapshots, name="memory-snapshot", daemon=True)
+            self._snapshot_thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        if self.snapshot_path:
+            self.write_snapshot()
+
+    # Políticas
+
+    def get_policies(self, pairs: List[Pair]) -> List[Optional[Dict[str, Any]]]:
+        now = time.time()
+        with self._lock:
+            result = []
+            for pair in pairs:
+                entry = self._policies.get(pair)
+                if entry is not None and entry[0] <= now:
+                    self._drop_policy(pair)
+                    entry = None
+                result.append(entry[1] if entry else None)
+            return result
+
+    def set_policies(self, consentimentos: Consentimentos, ttl: int = CACHE_MAX_AGE, only_if_absent: bool = False) -> int:
+        now = time.time()
+        expires_at = now + ttl
+        written = 0
+        with self._lock:
+            for titular_id, policies in consentimentos.items():
+                for dispositivo_id, policy in policies.items():
+                    current = self._policies.get((dispositivo_id, titular_id))
+                    if only_if_absent and current and current[0] > now:
+                        continue
+                    self._policies[(dispositivo_id, titular_id)] = (expires_at, policy)
+                    written += 1
+                    self._titular_index.setdefault(titular_id, set()).add(dispositivo_id)
+                    self._device_index.setdefault(dispositivo_id, set()).add(titular_id)
+        return written
+
+    def has_policies(self) -> bool:
+        now = time.time()
+        with self._lock:
+            return any(expires_at > now for expires_at, _ in self._policies.values())
+
+    def export_policies(self, chunk_size: int = 1000) -> Consentimentos:
+        now = time.time()
+        exported: Consentimentos = {}
+        with self._lock:
+            for (dispositivo_id, titular_id), (expires_at, policy) in list(self._policies.items()):
+                if expires_at <= now:
+                    self._drop_policy((dispositivo_id, titular_id))
+                    continue
+                exported.setdefault(titular_id, {})[dispositivo_id] = policy
+        return exported
+
+    def invalidate_policies(self, titulares: List[str], dispositivos: List[str], pairs: Iterable[Pair], purge: bool) -> List[Pair]:
+        with self._lock:
+            targets = dict.fromkeys(pairs)
+            for titular_id in titulares:
+                targets.update(dict.fromkeys((d, titular_id) for d in self._titular_index.get(titular_id, ())))
+            for dispositivo_id in dispositivos:
+                targets.update(dict.fromkeys((dispositivo_id, t) for t in self._device_index.get(dispositivo_id, ())))
+            for pair in targets:
+                self._drop_policy(pair)
+                if purge:
+                    self._windows.pop(pair, None)
+                    self._task_due.pop(pair, None)
+            return list(targets)
+
+    def _drop_policy(self, pair: Pair):
+        dispositivo_id, titular_id = pair
+        self._policies.pop(pair, None)
+        _discard(self._titular_index, titular_id, dispositivo_id)
+        _discard(self._device_index, dispositivo_id, titular_id)
+
+    # Estado de agregação
+
+    def update_window_pane(self, dispositivo_id: str, titular_id: str, window: WindowSpec, pane: int, value: float, sketch_bucket: Optional[str] = None, strategy: str = ""):
+        now = time.time()
+        value = float(value)
+        pair = (dispositivo_id, titular_id)
+        slot = pane % window.ring
+        with self._lock:
+            entry = self._windows.get(pair)
+            if entry is None or entry[0] <= now or entry[1] != window.signature:
+                entry = self._windows[pair] = [0.0, window.signature, {}]
+            entry[0] = now + window.ring * window.pane
+            fields = entry[2].get(slot)
+            if fields is None or fields["pane"] != pane:
+                if fields is not None and fields["pane"] > pane:
+                    # O pane já saiu do anel.
+                    LATE_POINTS.labels(strategy).inc()
+                    return
+                fields = entry[2][slot] = {"pane": pane, "count": 0, "sum": 0.0, "mean": 0.0, "m2": 0.0}
+            # Mesma lógica (Welford) do script do Redis.
+            count = fields["count"] = fields["count"] + 1
+            fields["sum"] += value
+            fields["min"] = min(fields.get("min", value), value)
+            fields["max"] = max(fields.get("max", value), value)
+            delta = value - fields["mean"]
+            fields["mean"] += delta / count
+            fields["m2"] += delta * (value - fields["mean"])
+            if sketch_bucket:
+                fields[sketch_bucket] = fields.get(sketch_bucket, 0) + 1
+
+    def get_window_states(self, pairs: List[Pair]) -> List[Dict[str, Any]]:
+        now = time.time()
+        states = []
+        with self._lock:
+            for pair in pairs:
+                entry = self._windows.get(pair)
+                if entry is None or entry[0] <= now:
+                    self._windows.pop(pair, None)
+                    states.append({})
+                    continue
+                state: Dict[str, Any] = {"spec": entry[1]}
+                for slot, fields in entry[2].items():
+                    for name, value in fields.items():
+                        state[f"{slot}|{name}"] = str(value) if name == "pane" else value
+                states.append(state)
+        return states
+
+    # Fila de tarefas de agregação (slots são ignorados: o backend não é compartilhado)
+
+    def schedule_tasks(self, tasks: Dict[Pair, float], only_if_absent: bool = False, only_if_earlier: bool = False):
+        with self._lock:
+            for pair, due in tasks.items():
+                current = self._task_due.get(pair)
+                if current is not None and (only_if_absent or (only_if_earlier and current <= due)):
+                    continue
+                self._push_task(pair, due)
+
+    def _push_task(self, pair: Pair, due: float):
+        self._task_due[pair] = due
+        heapq.heappush(self._task_heap, (due, pair))
+        # Compacta o heap quando as entradas obsoletas passam a dominar.
+        if len(self._task_heap) > 2 * len(self._task_due) + 1024:
+            self._task_heap = [(d, p) for p, d in self._task_due.items()]
+            heapq.heapify(self._task_heap)
+
+    def _pop_stale(self):
+        """ Descarta do topo do heap as entradas de tarefas removidas ou reagendadas. """
+        heap = self._task_heap
+        while heap and self._task_due.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def claim_due_tasks(self, limit: int, lease_until: float, slots: Iterable[int]) -> List[Tuple[str, str, float]]:
+        now = time.time()
+        claimed: List[Tuple[str, str, float]] = []
+        with self._lock:
+            while len(claimed) < limit:
+                self._pop_stale()
+                if not self._task_heap or self._task_heap[0][0] > now:
+                    break
+                due, pair = heapq.heappop(self._task_heap)
+                self._push_task(pair, lease_until)
+                claimed.append((pair[0], pair[1], due))
+        return claimed
+
+    def release_tasks(self, pairs: Iterable[Pair], lease_until: float):
+        with self._lock:
+            for pair in pairs:
+                if self._task_due.get(pair) == lease_until:
+                    del self._task_due[pair]
+
+    def next_due(self, slots: Iterable[int]) -> Optional[float]:
+        with self._lock:
+            self._pop_stale()
+            return self._task_heap[0][0] if self._task_heap else None
+
+    # Snapshots
+
+    def write_snapshot(self, path: Optional[str] = None) -> int:
+        """
+        Grava o estado em disco de forma atômica (arquivo temporário + rename), legível só pelo gateway.
+        Returns:
+            - O número de políticas gravadas.
+        """
+        path = path or self.snapshot_path
+        with self._lock:
+            state = {
+                "criado_em": time.time(),
+                "politicas": [[d, t, expires_at, policy] for (d, t), (expires_at, policy) in self._policies.items()],
+                "janelas": [
+                    [d, t, expires_at, signature, [[slot, fields] for slot, fields in panes.items()]]
+                    for (d, t), (expires_at, signature, panes) in self._windows.items()
+                ],
+                "tarefas": [[d, t, due] for (d, t), due in self._task_due.items()],
+            }
+        write_state_file(path, storage.dumps(state))
+        return len(state["politicas"])
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                state = storage.loads(f.read())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            raise StateBackendError(f"Snapshot do estado ilegível ({self.snapshot_path}): {e}") from e
+        now = time.time()
+        with self._lock:
+            for d, t, expires_at, policy in state.get("politicas", []):
+                if expires_at > now:
+                    self.set_policies({t: {d: policy}}, expires_at - now)
+            for d, t, expires_at, signature, panes in state.get("janelas", []):
+                if expires_at > now:
+                    self._windows[(d, t)] = [expires_at, signature, {slot: fields for slot, fields in panes}]
+            for d, t, due in state.get("tarefas", []):
+                self._push_task((d, t), due)
+        logger.info(
+            "Estado em memória restaurado de %s: %d políticas, %d tarefas.",
+            self.snapshot_path, len(self._policies), len(self._task_due),
+        )
+
+    def _run_snapshots(self):
+        while not self._stop_event.wait(self.snapshot_interval):
+            try:
+                self.write_snapshot()
+            except Exception as e:
+                logger.warning("Erro ao gravar o snapshot do estado em %s: %s", self.snapshot_path, e)
+
+
+def _discard(index: Dict[str, Set[str]], key: str, member: str):
+    members = index.get(key)
+    if members is not None:
+        members.discard(member)
+        if not members:
+            del index[key]
@@ -0,0 +1,381 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import redis
+from core.cluster import CLUSTER_ENABLED, CLUSTER_SLOTS, slot_for
+from core.codecs import CodecError, storage
+from core.config import settings
+from core.metrics import LATE_POINTS, STORAGE_DECODE_ERRORS
+from core.windowing import WindowSpec
+from .base import CACHE_MAX_AGE, Consentimentos, Pair, StateBackend, StateBackendError
+redis_host = settings.redis_host
+redis_port = settings.redis_port
+AGGREGATION_QUEUE_KEY = settings.aggregation_task_queue
+AGGREGATION_WAKE_CHANNEL = f"{AGGREGATION_QUEUE_KEY}:wake"
+# Conjunto com todos os titulares que possuem políticas cacheadas.
+TITULARS_INDEX_KEY = "idx:titulares"
+
+# Reserva atomicamente as tarefas vencidas (score <= ARGV[1]) das filas em KEYS, no máximo
+# ARGV[2] no total, movendo-as para o fim da reserva (ARGV[3]).
+CLAIM_DUE_TASKS_SCRIPT = """
+local claimed = {}
+local remaining = tonumber(ARGV[2])
+for _, key in ipairs(KEYS) do
+    if remaining <= 0 then break end
+    local due = redis.call('ZRANGEBYSCORE', key, '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, remaining)
+    for i = 1, #due, 2 do
+        redis.call('ZADD', key, ARGV[3], due[i])
+        claimed[#claimed + 1] = due[i]
+        claimed[#claimed + 1] = due[i + 1]
+    end
+    remaining = remaining - #due / 2
+end
+return claimed
+"""
+
+# Remove de KEYS[1] as tarefas em ARGV[2..] que ainda estão com a reserva ARGV[1]; tarefas
+# reagendadas por outro caminho (ex: nova política) são mantidas.
+RELEASE_TASKS_SCRIPT = """
+local removed = 0
+for i = 2, #ARGV do
+    local score = redis.call('ZSCORE', KEYS[1], ARGV[i])
+    if score and tonumber(score) == tonumber(ARGV[1]) then
+        removed = removed + redis.call('ZREM', KEYS[1], ARGV[i])
+    end
+end
+return removed
+"""
+
+# Atualiza atomicamente o resumo parcial (contagem/soma/mín/máx/média/M2) de um pane no anel
+# de panes de uma janela (KEYS[1]) e, se informado, incrementa o bucket do sketch de quantis
+# (ARGV[2]). Os campos do pane ficam prefixados pela posição no anel (ARGV[4]); quando a
+# posição é reaproveitada por um pane mais novo (ARGV[5]), o resumo anterior é apagado. Um
+# anel gravado com outro layout de janela (ARGV[3]) é descartado. Retorna -1 se o pane já
+# saiu do anel. O resumo tem tamanho constante, então o número de pontos por pane não é limitado.
+UPDATE_WINDOW_PANE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'spec') ~= ARGV[3] then
+    redis.call('DEL', KEYS[1])
+    redis.call('HSET', KEYS[1], 'spec', ARGV[3])
+end
+local p = ARGV[4] .. '|'
+local pane = redis.call('HGET', KEYS[1], p .. 'pane')
+if pane ~= ARGV[5] then
+    if pane and tonumber(pane) > tonumber(ARGV[5]) then return -1 end
+    if redis.call('HEXISTS', KEYS[1], p .. 'sketch') == 1 then
+        for _, field in ipairs(redis.call('HKEYS', KEYS[1])) do
+            if string.sub(field, 1, #p) == p then redis.call('HDEL', KEYS[1], field) end
+        end
+    else
+        redis.call('HDEL', KEYS[1], p .. 'count', p .. 'sum', p .. 'min', p .. 'max', p .. 'mean', p .. 'm2')
+    end
+    redis.call('HSET', KEYS[1], p .. 'pane', ARGV[5])
+end
+local v = tonumber(ARGV[1])
+local n = redis.call('HINCRBY', KEYS[1], p .. 'count', 1)
+redis.call('HINCRBYFLOAT', KEYS[1], p .. 'sum', ARGV[1])
+local current = redis.call('HMGET', KEYS[1], p .. 'min', p .. 'max', p .. 'mean', p .. 'm2')
+if not current[1] or v < tonumber(current[1]) then redis.call('HSET', KEYS[1], p .. 'min', ARGV[1]) end
+if not current[2] or v > tonumber(current[2]) then redis.call('HSET', KEYS[1], p .. 'max', ARGV[1]) end
+local mean = tonumber(current[3] or '0')
+local delta = v - mean
+mean = mean + delta / n
+local m2 = tonumber(current[4] or '0') + delta * (v - mean)
+redis.call('HSET', KEYS[1], p .. 'mean', string.format('%.17g', mean), p .. 'm2', string.format('%.17g', m2))
+if ARGV[2] ~= '' then
+    redis.call('HINCRBY', KEYS[1], p .. ARGV[2], 1)
+    redis.call('HSET', KEYS[1], p .. 'sketch', 1)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+return n
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class RedisBackend(StateBackend):
+    """
+    Estado no Redis, compartilhado entre as réplicas: políticas com SETEX e índices em
+    conjuntos, anéis de panes em hashes atualizados por script Lua e a fila de tarefas em
+    sorted sets (um por slot em cluster). As escritas de acumulação de um micro-lote vão em
+    um único pipeline (pipelined()).
+    """
+
+    name = "redis"
+
+    def __init__(self, host: Optional[str] = redis_host, port: int = redis_port):
+        self.host = host
+        self.port = port
+        self.redis_client = None
+        self.binary_client = None
+        # Pipeline ativo por thread (ver pipelined()).
+        self._local = threading.local()
+
+    def connect(self):
+        try:
+            self.redis_client = redis.Redis(host=self.host, port=self.port, decode_responses=True, db=0)
+            self.redis_client.ping()
+            # Cliente sem decodificação para os valores binários (políticas).
+            self.binary_client = redis.Redis(host=self.host, port=self.port, decode_responses=False, db=0)
+        except redis.exceptions.ConnectionError as e:
+            raise StateBackendError(f"Erro ao conectar ao Redis em {self.host}:{self.port}: {e}") from e
+        self._update_window_pane = self.redis_client.register_script(UPDATE_WINDOW_PANE_SCRIPT)
+        self._claim_due_tasks = self.redis_client.register_script(CLAIM_DUE_TASKS_SCRIPT)
+        self._release_tasks = self.redis_client.register_script(RELEASE_TASKS_SCRIPT)
+        logger.info("Conexão com Redis estabelecida com sucesso!")
+
+    def close(self):
+        if self.redis_client is not None:
+            self.redis_client.close()
+            self.binary_client.close()
+
+    @contextmanager
+    def pipelined(self):
+        """
+        Agrupa as escritas feitas pela thread atual (ex: update_window_pane) em um único
+        pipeline do Redis, executado ao final do bloco (e descartado se o bloco falhar).
+        """
+        if getattr(self._local, "pipe", None) is not None:
+            yield
+            return
+        pipe = self.redis_client.pipeline(transaction=False)
+        self._local.pipe = pipe
+        self._local.late_checks = []
+        self._local.schedule_checks = []
+        try:
+            yield
+        except BaseException:
+            # O bloco falhou: as escritas enfileiradas são descartadas, não executadas pela metade.
+            pipe.reset()
+            raise
+        finally:
+            self._local.pipe = None
+        results = pipe.execute()
+        _count_late((results[i], strategy) for i, strategy in self._local.late_checks)
+        added = [due for i, due in self._local.schedule_checks if results[i]]
+        if added:
+            # Tarefas novas (ou antecipadas) podem pertencer a slots de outra réplica, que precisa ser acordada.
+            self.redis_client.publish(AGGREGATION_WAKE_CHANNEL, repr(min(added)))
+
+    def _writer(self):
+        """ Retorna o pipeline ativo da thread, ou o cliente Redis se não houver nenhum. """
+        return getattr(self._local, "pipe", None) or self.redis_client
+
+    # Políticas
+
+    def get_policies(self, pairs: List[Pair]) -> List[Optional[Dict[str, Any]]]:
+        if not pairs:
+            return []
+        values = self.binary_client.mget([f"policy:{d}:{t}" for d, t in pairs])
+        policies, errors = [], 0
+        for value in values:
+            try:
+                policies.append(storage.loads(value) if value else None)
+            except CodecError as e:
+                # Um valor ilegível (ex: gravado com um codec que esta réplica não tem) vale como ausente.
+                policies.append(None)
+                errors += 1
+                error = e
+        if errors:
+            STORAGE_DECODE_ERRORS.labels("policy").inc(errors)
+            logger.warning("%d políticas ilegíveis no Redis tratadas como ausentes: %s", errors, error)
+        return policies
+
+    def set_policies(self, consentimentos: Consentimentos, ttl: int = CACHE_MAX_AGE, only_if_absent: bool = False) -> int:
+        pipe = self.redis_client.pipeline(transaction=False)
+        writes = []
+        for titular_id, policies in consentimentos.items():
+            if not policies:
+                continue
+            titular_index = f"idx:titular:{titular_id}"
+            for dispositivo_id, policy in policies.items():
+                device_index = f"idx:device:{dispositivo_id}"
+                # Com only_if_absent, SET NX: uma política já cacheada (mais nova) nunca é sobrescrita.
+                writes.append(len(pipe))
+                pipe.set(f"policy:{dispositivo_id}:{titular_id}", storage.dumps(policy), ex=ttl, nx=only_if_absent)
+                pipe.sadd(device_index, titular_id)
+                pipe.expire(device_index, CACHE_MAX_AGE)
+            pipe.sadd(titular_index, *policies)
+            pipe.expire(titular_index, CACHE_MAX_AGE)
+            pipe.sadd(TITULARS_INDEX_KEY, titular_id)
+        if not len(pipe):
+            return 0
+        results = pipe.execute()
+        return sum(1 for position in writes if results[position])
+
+    def has_policies(self) -> bool:
+        return bool(self.redis_client.exists(TITULARS_INDEX_KEY))
+
+    def export_policies(self, chunk_size: int = 1000) -> Consentimentos:
+        titulares = sorted(self.redis_client.smembers(TITULARS_INDEX_KEY))
+        exported: Consentimentos = {}
+        for i in range(0, len(titulares), chunk_size):
+            chunk = titulares[i:i + chunk_size]
+            pipe = self.redis_client.pipeline(transaction=False)
+            for titular_id in chunk:
+                pipe.smembers(f"idx:titular:{titular_id}")
+            indexes = pipe.execute()
+            pairs = [(d, t) for t, devices in zip(chunk, indexes) for d in devices]
+            expired = [t for t, devices in zip(chunk, indexes) if not devices]
+            if expired:
+                self.redis_client.srem(TITULARS_INDEX_KEY, *expired)
+            for (dispositivo_id, titular_id), policy in zip(pairs, self.get_policies(pairs)):
+                if policy:
+                    exported.setdefault(titular_id, {})[dispositivo_id] = policy
+        return exported
+
+    def invalidate_policies(self, titulares: List[str], dispositivos: List[str], pairs: Iterable[Pair], purge: bool) -> List[Pair]:
+        """
+        Resolve os pares pelos índices mantidos em set_policies (sem KEYS/SCAN), com uma ida
+        ao Redis, e apaga tudo em um único pipeline.
+        """
+        targets = dict.fromkeys(pairs)
+        if titulares or dispositivos:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for titular_id in titulares:
+                pipe.smembers(f"idx:titular:{titular_id}")
+            for dispositivo_id in dispositivos:
+                pipe.smembers(f"idx:device:{dispositivo_id}")
+            results = pipe.execute()
+            for titular_id, devices in zip(titulares, results):
+                targets.update(dict.fromkeys((d, titular_id) for d in devices))
+            for dispositivo_id, owners in zip(dispositivos, results[len(titulares):]):
+                targets.update(dict.fromkeys((dispositivo_id, t) for t in owners))
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        tasks_by_slot: Dict[int, List[str]] = {}
+        for dispositivo_id, titular_id in targets:
+            pipe.delete(f"policy:{dispositivo_id}:{titular_id}")
+            pipe.srem(f"idx:titular:{titular_id}", dispositivo_id)
+            pipe.srem(f"idx:device:{dispositivo_id}", titular_id)
+            if purge:
+                pipe.delete(f"win:{dispositivo_id}:{titular_id}")
+                tasks_by_slot.setdefault(slot_for(dispositivo_id), []).append(f"{dispositivo_id}:{titular_id}")
+        for slot, members in tasks_by_slot.items():
+            pipe.zrem(self._task_queue_key(slot), *members)
+        for titular_id in titulares:
+            pipe.delete(f"idx:titular:{titular_id}")
+            pipe.srem(TITULARS_INDEX_KEY, titular_id)
+        for dispositivo_id in dispositivos:
+            pipe.delete(f"idx:device:{dispositivo_id}")
+        if len(pipe):
+            pipe.execute()
+        return list(targets)
+
+    # Estado de agregação
+
+    def update_window_pane(self, dispositivo_id: str, titular_id: str, window: WindowSpec, pane: int, value: float, sketch_bucket: Optional[str] = None, strategy: str = ""):
+        window_key = f"win:{dispositivo_id}:{titular_id}"
+        args = [repr(float(value)), sketch_bucket or "", window.signature, pane % window.ring, pane, window.ring * window.pane]
+        writer = self._writer()
+        result = self._update_window_pane(keys=[window_key], args=args, client=writer)
+        if writer is self.redis_client:
+            _count_late([(result, strategy)])
+        else:
+            # No pipeline, o resultado só é conhecido ao fim do bloco pipelined().
+            self._local.late_checks.append((len(writer.command_stack) - 1, strategy))
+
+    def get_window_states(self, pairs: List[Pair]) -> List[Dict[str, Any]]:
+        pipe = self.redis_client.pipeline(transaction=False)
+        for dispositivo_id, titular_id in pairs:
+            pipe.hgetall(f"win:{dispositivo_id}:{titular_id}")
+        return pipe.execute()
+
+    # Fila de tarefas de agregação
+
+    @staticmethod
+    def _task_queue_key(slot: int) -> str:
+        return AGGREGATION_QUEUE_KEY if CLUSTER_SLOTS == 1 else f"{AGGREGATION_QUEUE_KEY}:{slot}"
+
+    def schedule_tasks(self, tasks: Dict[Pair, float], only_if_absent: bool = False, only_if_earlier: bool = False):
+        """ Uma única ida ao Redis (um ZADD por slot); dentro de pipelined(), vai no pipeline do bloco. """
+        by_slot: Dict[int, Dict[str, float]] = {}
+        for (device_id, titular_id), due in tasks.items():
+            by_slot.setdefault(slot_for(device_id), {})[f"{device_id}:{titular_id}"] = due
+        block = getattr(self._local, "pipe", None)
+        pipe = block or self.redis_client.pipeline(transaction=False)
+        for slot, members in by_slot.items():
+            # Com only_if_earlier (LT), a contagem de alterações (CH) indica se alguma tarefa foi criada ou antecipada.
+            pipe.zadd(self._task_queue_key(slot), members, nx=only_if_absent, lt=only_if_earlier, ch=only_if_earlier)
+            if block is not None and CLUSTER_ENABLED:
+                self._local.schedule_checks.append((len(pipe.command_stack) - 1, min(members.values())))
+        if block is not None:
+            return
+        if CLUSTER_ENABLED and (only_if_absent or only_if_earlier):
+            # Tarefas novas podem pertencer a slots de outra réplica, que precisa ser acordada.
+            pipe.publish(AGGREGATION_WAKE_CHANNEL, repr(min(tasks.values())))
+        pipe.execute()
+
+    def claim_due_tasks(self, limit: int, lease_until: float, slots: Iterable[int]) -> List[Tuple[str, str, float]]:
+        """ Reserva por script no servidor: cada tarefa é entregue a um único consumidor, mesmo entre réplicas. """
+        keys = [self._task_queue_key(slot) for slot in slots]
+        if not keys:
+            return []
+        claimed = self._claim_due_tasks(keys=keys, args=[time.time(), limit, repr(lease_until)])
+        tasks = []
+        for member, score in zip(claimed[::2], claimed[1::2]):
+            device_id, titular_id = member.split(":", 1)
+            tasks.append((device_id, titular_id, float(score)))
+        return tasks
+
+    def release_tasks(self, pairs: Iterable[Pair], lease_until: float):
+        by_slot: Dict[int, List[str]] = {}
+        for device_id, titular_id in pairs:
+            by_slot.setdefault(slot_for(device_id), []).append(f"{device_id}:{titular_id}")
+        if not by_slot:
+            return
+        pipe = self.redis_client.pipeline(transaction=False)
+        for slot, members in by_slot.items():
+            self._release_tasks(keys=[self._task_queue_key(slot)], args=[repr(lease_until), *members], client=pipe)
+        pipe.execute()
+
+    def next_due(self, slots: Iterable[int]) -> Optional[float]:
+        pipe = self.redis_client.pipeline(transaction=False)
+        for slot in slots:
+            pipe.zrange(self._task_queue_key(slot), 0, 0, withscores=True)
+        heads = [head[0][1] for head in pipe.execute() if head]
+        return min(heads) if heads else None
+
+    def listen_remote_schedules(self, callback: Callable[[float], None]):
+        pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{AGGREGATION_WAKE_CHANNEL: lambda message: callback(float(message["data"]))})
+        pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def migrate_unsharded_tasks(self, chunk_size: int = 1000) -> int:
+        if CLUSTER_SLOTS == 1:
+            return 0
+        moved = 0
+        while True:
+            entries = self.redis_client.zrange(AGGREGATION_QUEUE_KEY, 0, chunk_size - 1, withscores=True)
+            if not entries:
+                return moved
+            by_slot: Dict[int, Dict[str, float]] = {}
+            for member, due in entries:
+                by_slot.setdefault(slot_for(member.split(":", 1)[0]), {})[member] = due
+            pipe = self.redis_client.pipeline(transaction=False)
+            for slot, members in by_slot.items():
+                # Uma tarefa já agendada na fila do slot fica com o horário mais cedo.
+                pipe.zadd(self._task_queue_key(slot), members, lt=True)
+            pipe.zrem(AGGREGATION_QUEUE_KEY, *[member for member, _ in entries])
+            pipe.execute()
+            moved += len(entries)
+
+    # Cluster
+
+    def cluster_heartbeat(self, members_key: str, node_id: str, now: float, node_ttl: float) -> List[str]:
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.zadd(members_key, {node_id: now})
+        pipe.zremrangebyscore(members_key, "-inf", now - node_ttl)
+        pipe.zrange(members_key, 0, -1)
+        return pipe.execute()[2]
+
+    def cluster_leave(self, members_key: str, node_id: str):
+        self.redis_client.zrem(members_key, node_id)
+
+
+def _count_late(results: Iterable[Tuple[Any, str]]):
+    """ Conta como atrasados os pontos recusados pelo script porque o pane já saiu do anel. """
+    for result, strategy in results:
+        if result == -1:
+            LATE_POINTS.labels(strategy).inc()
@@ -1,85 +1,278 @@
-import redis
-import json
-from typing import Optional, Dict, Any, List
-import os
-from dotenv import load_dotenv
+from typing import Optional, Dict, Any, List, Iterable, Tuple, Callable
+import threading
+import logging
 import time
-load_dotenv()
-redis_host = os.getenv("REDIS_HOST")
-redis_port = int(os.getenv("REDIS_PORT"))
-CACHE_MAX_AGE = int(os.getenv("CACHE_TTL_TIME"))
-AGGREGATION_QUEUE_KEY = os.getenv("AGGREGATION_TASK_QUEUE")
+from core.backends import StateBackend, StateBackendError, create_backend
+from core.backends.base import CACHE_MAX_AGE
+from core.cluster import CLUSTER_ENABLED, CLUSTER_SLOTS
+from core.config import settings
+from core.local_cache import LocalPolicyCache
+from core.metrics import POLICY_LOOKUP_LATENCY, debug_sampled
+from core.windowing import WindowSpec
+# Armazenamento do estado compartilhado: "redis" (padrão) ou "memory" (nó único, sem Redis).
+STATE_BACKEND = settings.state_backend.lower()
+L1_CACHE_MAX_SIZE = settings.l1_cache_max_size
+L1_CACHE_TTL = min(settings.l1_cache_ttl_time, CACHE_MAX_AGE)
+L1_NEGATIVE_TTL = settings.l1_negative_ttl_time
+
+logger = logging.getLogger(__name__)
+
+L1_LOOKUP_LATENCY = POLICY_LOOKUP_LATENCY.labels("l1")
 
 class CacheManager:
-    def __init__(self):
-        try:
-            self.redis_client = redis.Redis(
-                host=redis_host,
-                port=redis_port,
-                decode_responses=True,
-                db=0
-            )
-            self.redis_client.ping()
-            print("Conexão com Redis estabelecida com sucesso!")
-        except redis.exceptions.ConnectionError as e:
-            print(f"Erro ao conectar ao Redis: {e}")
-            exit(1)
+    """
+    Fachada do estado do gateway: cache L1 de políticas em memória na frente do backend de
+    estado (STATE_BACKEND), que guarda as políticas, o estado de agregação e a fila de
+    tarefas. O backend só é criado e conectado no primeiro uso (ou em connect()).
+    """
+
+    def __init__(self, backend_name: str = STATE_BACKEND):
+        self.backend_name = backend_name
+        self._backend: Optional[StateBackend] = None
+        self._backend_lock = threading.Lock()
+        self._backend_latency = POLICY_LOOKUP_LATENCY.labels(backend_name)
+        # Cache L1 em memória na frente do backend (LRU + TTL, com entradas negativas).
+        self.local_policies = LocalPolicyCache(L1_CACHE_MAX_SIZE, L1_CACHE_TTL, L1_NEGATIVE_TTL)
+        self._schedule_listeners: List[Callable[[float], None]] = []
+
+    @property
+    def backend(self) -> StateBackend:
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    if CLUSTER_ENABLED and self.backend_name == "memory":
+                        raise StateBackendError("O backend de estado em memória não pode ser usado com CLUSTER_ENABLED.")
+                    backend = create_backend(self.backend_name)
+                    backend.connect()
+                    self._backend = backend
+        return self._backend
+
+    def connect(self):
+        """ Cria e conecta o backend de estado; levanta StateBackendError se ele estiver indisponível. """
+        return self.backend
+
+    def close(self):
+        """ Encerra o backend de estado, se já tiver sido criado. """
+        with self._backend_lock:
+            backend, self._backend = self._backend, None
+        if backend is not None:
+            backend.close()
+
+    def pipelined(self):
+        """
+        Agrupa as escritas de acumulação feitas pela thread atual (ex: update_window_pane)
+        em uma única ida ao backend, ao final do bloco.
+        """
+        return self.backend.pipelined()
     
     def get_policy(self, dispositivo_id: str, titular_id: str) -> Optional[Dict[str, Any]]:
-        """ Busca no cache uma política de privacidade para o dispositivo. """
-        key = f"policy:{dispositivo_id}:{titular_id}"
-        policy = self.redis_client.get(key)
+        """ Busca no cache (L1 e depois no backend) uma política de privacidade para o dispositivo. """
+        start = time.perf_counter()
+        found, policy = self.local_policies.lookup((dispositivo_id, titular_id))
+        L1_LOOKUP_LATENCY.observe(time.perf_counter() - start)
+        if found:
+            return policy
+        start = time.perf_counter()
+        policy = self.backend.get_policies([(dispositivo_id, titular_id)])[0]
+        self._backend_latency.observe(time.perf_counter() - start)
         if policy:
-            print(f"Política de privacidade encontrada no cache para o dispositivo {dispositivo_id} para o titular {titular_id}")
-            return json.loads(policy)
-        print(f"Política de privacidade não encontrada no cache para o dispositivo {dispositivo_id}")
+            debug_sampled(logger, "Política de privacidade encontrada no cache para o dispositivo %s para o titular %s", dispositivo_id, titular_id)
+            self.local_policies.put((dispositivo_id, titular_id), policy)
+            return policy
+        debug_sampled(logger, "Política de privacidade não encontrada no cache para o dispositivo %s", dispositivo_id)
         return None
+
+    def get_policies(self, pairs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Optional[Dict[str, Any]]]:
+        """
+        Busca as políticas de vários pares (dispositivo, titular) de uma só vez: primeiro no
+        cache L1 e depois no backend, em uma única chamada (um MGET no Redis).
+        Returns:
+            - Um dicionário {(dispositivo, titular): política}. Pares sabidamente sem política
+              mapeiam para None; pares não encontrados em nenhum cache ficam de fora.
+        """
+        found: Dict[Tuple[str, str], Optional[Dict[str, Any]]] = {}
+        missing: List[Tuple[str, str]] = []
+        start = time.perf_counter()
+        unique_pairs = list(dict.fromkeys(pairs))
+        for pair in unique_pairs:
+            hit, policy = self.local_policies.lookup(pair)
+            if hit:
+                found[pair] = policy
+            else:
+                missing.append(pair)
+        if unique_pairs:
+            L1_LOOKUP_LATENCY.observe((time.perf_counter() - start) / len(unique_pairs), len(unique_pairs))
+        if missing:
+            start = time.perf_counter()
+            policies = self.backend.get_policies(missing)
+            self._backend_latency.observe((time.perf_counter() - start) / len(missing), len(missing))
+            for pair, policy in zip(missing, policies):
+                if policy:
+                    self.local_policies.put(pair, policy)
+                    found[pair] = policy
+        return found
+
+    def is_policy_absent(self, dispositivo_id: str, titular_id: str) -> bool:
+        """ Indica se o cache L1 sabe que não existe política para o par dispositivo/titular. """
+        return self.local_policies.is_negative((dispositivo_id, titular_id))
     
     def set_policy(self, dispositivo_id: str, titular_id: str, policy: Dict[str, Any]):
         """ Cacheia uma política de privacidade para o dispositivo. """
-        key = f"policy:{dispositivo_id}:{titular_id}"
-        self.redis_client.setex(key, CACHE_MAX_AGE, json.dumps(policy))
-        print(f"Política de privacidade cacheada para o dispositivo {dispositivo_id}")
+        self.set_policies(titular_id, {dispositivo_id: policy})
+
+    def set_policies(self, titular_id: str, policies: Dict[str, Dict[str, Any]]):
+        """
+        Cacheia, em uma única ida ao backend, as políticas de vários dispositivos de um titular
+        e atualiza os índices por titular e por dispositivo usados na invalidação em massa.
+        """
+        if not policies:
+            return
+        self.backend.set_policies({titular_id: policies}, CACHE_MAX_AGE)
+        for dispositivo_id, policy in policies.items():
+            self.local_policies.put((dispositivo_id, titular_id), policy)
+        logger.debug("%d políticas de privacidade cacheadas para o titular %s", len(policies), titular_id)
+
+    def set_policies_bulk(self, consentimentos: Dict[str, Dict[str, Dict[str, Any]]], ttl: int = CACHE_MAX_AGE, only_if_absent: bool = False) -> int:
+        """
+        Cacheia em uma única ida ao backend as políticas de vários titulares ({titular: {dispositivo: política}}),
+        usado no warm-up. O cache L1 não é preenchido, para não despejar as entradas em uso.
+        Args:
+            only_if_absent: Se True, as políticas já cacheadas são mantidas (carga de um snapshot).
+        Returns:
+            - O número de políticas gravadas.
+        """
+        consentimentos = {t: policies for t, policies in consentimentos.items() if policies}
+        if not consentimentos:
+            return 0
+        return self.backend.set_policies(consentimentos, ttl, only_if_absent)
+
+    def has_policies(self) -> bool:
+        """ Indica se o backend já tem políticas cacheadas (ex: reinício de uma réplica com o Redis aquecido). """
+        return self.backend.has_policies()
+
+    def export_policies(self, chunk_size: int = 1000) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Exporta todas as políticas cacheadas ({titular: {dispositivo: política}}) a partir dos
+        índices, em lotes de `chunk_size` titulares (usado no snapshot do warm-up).
+        """
+        return self.backend.export_policies(chunk_size)
+
+    def set_policy_absent(self, dispositivo_id: str, titular_id: str):
+        """ Registra no cache L1 que o MGC não possui política para o par dispositivo/titular. """
+        self.local_policies.put_negative((dispositivo_id, titular_id))
     
     def invalidate_policy(self, dispositivo_id: str, titular_id: str):
-        """ Invalida a política de privacidade do dispositivo. """
-        key = f"policy:{dispositivo_id}:{titular_id}"
-        deleted_count =self.redis_client.delete(key)
-        if deleted_count > 0:
-            print(f"Política de privacidade invalidada para o dispositivo {dispositivo_id}")
-    
-    def add_data_point(self, dispositivo_id: str, titular_id: str, data_point: Any):
-        """Adiciona um novo ponto de dado a uma lista para agregação futura."""
-        data_key = f"data:{dispositivo_id}:{titular_id}"
-        self.redis_client.lpush(data_key, json.dumps(data_point))
-        print(f"Ponto de dado adicionado para agregação no dispositivo {dispositivo_id} para o titular {titular_id}.")
-
-    def get_and_clear_data_points(self, dispositivo_id: str, titular_id: str) -> List[Any]:
-        """Busca todos os pontos de dados de um dispositivo para um titular e limpa a lista."""
-        data_key = f"data:{dispositivo_id}:{titular_id}"
-        # A operação 'pipeline' garante que as duas operações (get e delete)
-        # sejam executadas de forma atômica, evitando race conditions.
-        pipe = self.redis_client.pipeline()
-        pipe.lrange(data_key, 0, -1) # Pega todos os elementos da lista
-        pipe.delete(data_key)       # Apaga a lista
-        results, _ = pipe.execute()
-        
-        return [json.loads(item) for item in results]
+        """ Invalida a política de privacidade do dispositivo (L1 e backend). """
+        self.invalidate_policies(pairs=[(dispositivo_id, titular_id)])
+        logger.info("Política de privacidade invalidada para o dispositivo %s", dispositivo_id)
+
+    def invalidate_policies(
+        self,
+        titulares: Iterable[str] = (),
+        dispositivos: Iterable[str] = (),
+        pairs: Iterable[Tuple[str, str]] = (),
+        purge: bool = False,
+    ) -> List[Tuple[str, str]]:
+        """
+        Invalida de uma só vez as políticas de titulares inteiros, de dispositivos inteiros e/ou
+        de uma lista de pares, usando os índices mantidos por set_policies (sem KEYS/SCAN).
+        Args:
+            purge: Também descarta os dados pendentes de agregação e as tarefas agendadas dos
+                pares (revogação de consentimento).
+        Returns:
+            - Os pares (dispositivo, titular) invalidados.
+        """
+        titulares, dispositivos = list(titulares), list(dispositivos)
+        targets = self.backend.invalidate_policies(titulares, dispositivos, pairs, purge)
+
+        # O L1 pode ter entradas (inclusive negativas) que não estão nos índices do backend.
+        for pair in targets:
+            self.local_policies.invalidate(pair)
+        titular_set, device_set = set(titulares), set(dispositivos)
+        if titular_set or device_set:
+            self.local_policies.invalidate_where(lambda key: key[1] in titular_set or key[0] in device_set)
+        return targets
+
+    def get_policy_cache_stats(self) -> Dict[str, int]:
+        """ Retorna os contadores de acerto/falta/despejo do cache L1 de políticas. """
+        return self.local_policies.stats()
     
-    def schedule_aggregation_task(self, device_id: str, titular_id: str, due_timestamp: float):
+    def update_window_pane(self, dispositivo_id: str, titular_id: str, window: WindowSpec, pane: int, value: float, sketch_bucket: Optional[str] = None, strategy: str = ""):
+        """
+        Incorpora um valor ao resumo parcial (O(1) em memória) do pane no anel de janelas do dispositivo.
+        Args:
+            pane: Índice do pane (horário do ponto // window.pane).
+            sketch_bucket: Campo do bucket do sketch de quantis a incrementar, se houver.
+            strategy: Rótulo de gateway_late_points_total se o pane já tiver saído do anel.
+        """
+        self.backend.update_window_pane(dispositivo_id, titular_id, window, pane, value, sketch_bucket, strategy)
+
+    def get_window_states(self, pairs: List[Tuple[str, str]]) -> List[Dict[str, str]]:
+        """
+        Lê o anel de panes de cada par, sem apagá-lo: os panes continuam valendo para as
+        próximas janelas deslizantes e saem do anel quando a posição é reaproveitada.
+        """
+        return self.backend.get_window_states(pairs)
+
+    def add_schedule_listener(self, listener: Callable[[float], None]):
+        """ Registra um callback chamado com o horário de cada tarefa agendada (por esta ou, em cluster, por outra réplica). """
+        self._schedule_listeners.append(listener)
+
+    def _notify_schedule_listeners(self, due_timestamp: float):
+        for listener in self._schedule_listeners:
+            listener(due_timestamp)
+
+    def listen_remote_schedules(self):
+        """ Passa a receber (no Redis, via pub/sub) os avisos de tarefas novas agendadas pelas outras réplicas. """
+        self.backend.listen_remote_schedules(self._notify_schedule_listeners)
+
+    def schedule_aggregation_task(self, device_id: str, titular_id: str, due_timestamp: float, only_if_absent: bool = False):
         """ 
         Agenda uma tarefa de agregação de dados para um dispositivo. 
+        Com only_if_absent=True, uma tarefa já agendada não tem o horário alterado.
+        """
+        self.schedule_aggregation_tasks({(device_id, titular_id): due_timestamp}, only_if_absent)
+        debug_sampled(logger, "Tarefa de agregação agendada para o dispositivo %s.", device_id)
+
+    def schedule_aggregation_tasks(self, tasks: Dict[Tuple[str, str], float], only_if_absent: bool = False, only_if_earlier: bool = False):
+        """
+        Agenda várias tarefas de agregação em uma única ida ao backend (dentro de pipelined(),
+        no pipeline do bloco). Com only_if_earlier, uma tarefa já agendada só é antecipada.
+        """
+        if not tasks:
+            return
+        self.backend.schedule_tasks(tasks, only_if_absent, only_if_earlier)
+        self._notify_schedule_listeners(min(tasks.values()))
+
+    def claim_due_aggregation_tasks(self, limit: int, lease_until: float, slots: Iterable[int] = range(CLUSTER_SLOTS)) -> List[Tuple[str, str, float]]:
+        """ 
+        Reserva atomicamente até `limit` tarefas vencidas dos slots informados. Cada tarefa é
+        entregue a um único consumidor, mesmo com várias réplicas do gateway, e fica reservada
+        até `lease_until`: se não for reagendada ou liberada até lá (ex: a réplica caiu),
+        volta a ficar disponível.
+        Returns:
+            - Uma lista de (dispositivo_id, titular_id, horário previsto).
         """
-        self.redis_client.zadd(AGGREGATION_QUEUE_KEY, {f"{device_id}:{titular_id}": due_timestamp})
-        print(f"Tarefa de agregação agendada para o dispositivo {device_id}.")
+        return self.backend.claim_due_tasks(limit, lease_until, slots)
+
+    def release_aggregation_tasks(self, pairs: Iterable[Tuple[str, str]], lease_until: float):
+        """ Remove da fila tarefas ainda reservadas até `lease_until` que não devem mais ser executadas (ex: política sem agregação). """
+        self.backend.release_tasks(pairs, lease_until)
+
+    def get_next_due_timestamp(self, slots: Iterable[int] = range(CLUSTER_SLOTS)) -> Optional[float]:
+        """ Retorna o horário da próxima tarefa de agregação das filas dos slots informados, se houver. """
+        return self.backend.next_due(slots)
+
+    def migrate_unsharded_tasks(self) -> int:
+        """ Move as tarefas da fila única, gravadas antes do modo cluster, para as filas dos slots. """
+        return self.backend.migrate_unsharded_tasks()
+
+    def cluster_heartbeat(self, members_key: str, node_id: str, now: float, node_ttl: float) -> List[str]:
+        """ Renova o heartbeat da réplica, descarta réplicas sem heartbeat há node_ttl segundos e retorna as vivas. """
+        return self.backend.cluster_heartbeat(members_key, node_id, now, node_ttl)
 
-    def get_due_aggregation_tasks(self) -> List[str]:
-        """ Retorna as tarefas de agregação que estão vencidas. """
-        now = time.time()
-        due_tasks = self.redis_client.zrangebyscore(AGGREGATION_QUEUE_KEY, 0, now)
-        if due_tasks:
-            self.redis_client.zrem(AGGREGATION_QUEUE_KEY, *due_tasks)
-        return [task.split(":") for task in due_tasks]
+    def cluster_leave(self, members_key: str, node_id: str):
+        self.backend.cluster_leave(members_key, node_id)
 
 # Singleton
-cache_manager = CacheManager()
\ No newline at end of file
+cache_manager = CacheManager()
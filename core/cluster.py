@@ -0,0 +1,161 @@
+import bisect
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
+from core.config import settings
+CLUSTER_ENABLED = settings.cluster_enabled
+# Sem cluster, todas as tarefas ficam em uma única fila (um único slot).
+CLUSTER_SLOTS = settings.cluster_slots if CLUSTER_ENABLED else 1
+CLUSTER_NODE_ID = settings.cluster_node_id or f"{socket.gethostname()}-{os.getpid()}"
+CLUSTER_MEMBERS_KEY = settings.cluster_members_key
+CLUSTER_HEARTBEAT_INTERVAL = settings.cluster_heartbeat_interval
+CLUSTER_NODE_TTL = settings.cluster_node_ttl
+CLUSTER_VIRTUAL_NODES = settings.cluster_virtual_nodes
+CLUSTER_SHARE_GROUP = settings.cluster_share_group
+
+logger = logging.getLogger(__name__)
+
+
+def slot_for(device_id: str) -> int:
+    """ Slot (partição das tarefas de agregação) ao qual o dispositivo pertence. """
+    return zlib.crc32(str(device_id).encode()) % CLUSTER_SLOTS
+
+
+def shared_topic(topic: str) -> str:
+    """ Tópico de assinatura compartilhada: o broker entrega cada mensagem a uma única réplica do grupo. """
+    return f"$share/{CLUSTER_SHARE_GROUP}/{topic}" if CLUSTER_ENABLED else topic
+
+
+def _ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Anel de hash consistente com nós virtuais: quando uma réplica entra ou sai, apenas os
+    slots vizinhos aos seus pontos no anel mudam de dono.
+    """
+
+    def __init__(self, nodes: Sequence[str], virtual_nodes: int = CLUSTER_VIRTUAL_NODES):
+        points = sorted((_ring_hash(f"{node}#{i}"), node) for node in nodes for i in range(virtual_nodes))
+        self._hashes = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def owner(self, slot: int) -> str:
+        if not self._nodes:
+            return ""
+        index = bisect.bisect(self._hashes, _ring_hash(f"slot:{slot}")) % len(self._nodes)
+        return self._nodes[index]
+
+    def slots_of(self, node: str, num_slots: int = CLUSTER_SLOTS) -> FrozenSet[int]:
+        return frozenset(slot for slot in range(num_slots) if self.owner(slot) == node)
+
+
+class ClusterMembership(threading.Thread):
+    """
+    Participação desta réplica no cluster: publica heartbeats no Redis, acompanha as réplicas
+    vivas e recalcula (pelo anel de hash) os slots de tarefas pelos quais ela é responsável.
+    Em cluster, a réplica não é dona de nenhum slot até o primeiro heartbeat e perde todos se
+    ficar CLUSTER_NODE_TTL segundos sem heartbeat (as demais réplicas já os assumiram).
+    Sem CLUSTER_ENABLED, a réplica é dona de todos os slots e a thread não precisa ser iniciada.
+    """
+
+    def __init__(self, cache, node_id: str = CLUSTER_NODE_ID):
+        """
+        Args:
+            cache: CacheManager usado para os heartbeats e avisos de agendamento entre réplicas.
+            node_id: Identificador único da réplica.
+        """
+        super().__init__(name="cluster-membership")
+        self.daemon = True
+        self.cache = cache
+        self.node_id = node_id
+        self._stop_event = threading.Event()
+        self._members: Tuple[str, ...] = () if CLUSTER_ENABLED else (node_id,)
+        self._owned_slots: FrozenSet[int] = frozenset() if CLUSTER_ENABLED else frozenset(range(CLUSTER_SLOTS))
+        # Horário (epoch) do último heartbeat aceito pelo backend.
+        self._last_heartbeat: Optional[float] = None
+        self._listeners: List[Callable[[FrozenSet[int]], None]] = []
+        self._lock = threading.Lock()
+        self._stats = {
+            "heartbeats": 0,
+            "heartbeat_errors": 0,
+            "rebalances": 0,
+        }
+
+    def add_rebalance_listener(self, listener: Callable[[FrozenSet[int]], None]):
+        """ Registra um callback chamado com os novos slots desta réplica a cada rebalanceamento. """
+        self._listeners.append(listener)
+
+    def owned_slots(self) -> FrozenSet[int]:
+        return self._owned_slots
+
+    def members(self) -> Tuple[str, ...]:
+        return self._members
+
+    def stop(self):
+        """ Sai do cluster imediatamente, para que as demais réplicas assumam os slots sem esperar o TTL. """
+        self._stop_event.set()
+        if CLUSTER_ENABLED:
+            self.cache.cluster_leave(CLUSTER_MEMBERS_KEY, self.node_id)
+            logger.info("Réplica %s saiu do cluster.", self.node_id)
+
+    def run(self):
+        self.cache.listen_remote_schedules()
+        logger.info("Réplica %s participando do cluster (%d slots no total).", self.node_id, CLUSTER_SLOTS)
+        try:
+            moved = self.cache.migrate_unsharded_tasks()
+            if moved:
+                logger.info("%d tarefas da fila anterior ao cluster movidas para as filas dos slots.", moved)
+        except Exception as e:
+            logger.warning("Erro ao migrar a fila de tarefas anterior ao cluster: %s", e)
+        while not self._stop_event.is_set():
+            self.heartbeat()
+            self._stop_event.wait(CLUSTER_HEARTBEAT_INTERVAL)
+
+    def heartbeat(self):
+        """ Renova a presença desta réplica e rebalanceia os slots se o conjunto de réplicas mudou. """
+        now = time.time()
+        try:
+            members = self.cache.cluster_heartbeat(CLUSTER_MEMBERS_KEY, self.node_id, now, CLUSTER_NODE_TTL)
+        except Exception as e:
+            with self._lock:
+                self._stats["heartbeat_errors"] += 1
+            logger.warning("Erro ao enviar heartbeat do cluster: %s", e)
+            if self._owned_slots and (self._last_heartbeat is None or now - self._last_heartbeat >= CLUSTER_NODE_TTL):
+                # As demais réplicas já consideram esta fora do cluster: seus slots não são mais dela.
+                logger.warning("Réplica %s sem heartbeat há %ss: liberando seus slots.", self.node_id, CLUSTER_NODE_TTL)
+                self._rebalance(())
+            return
+        self._last_heartbeat = now
+        with self._lock:
+            self._stats["heartbeats"] += 1
+        members = tuple(sorted(members))
+        if members != self._members:
+            self._rebalance(members)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["members"] = len(self._members)
+        stats["owned_slots"] = len(self._owned_slots)
+        return stats
+
+    def _rebalance(self, members: Tuple[str, ...]):
+        owned = HashRing(members).slots_of(self.node_id, CLUSTER_SLOTS)
+        gained, lost = owned - self._owned_slots, self._owned_slots - owned
+        self._members = members
+        self._owned_slots = owned
+        with self._lock:
+            self._stats["rebalances"] += 1
+        logger.info(
+            "Cluster com %d réplicas: %d slots nesta réplica (+%d, -%d).",
+            len(members), len(owned), len(gained), len(lost),
+        )
+        for listener in self._listeners:
+            listener(owned)
@@ -0,0 +1,196 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple, Union
+import paho.mqtt.client as mqtt
+from core.config import settings
+# Codec padrão das mensagens dos dispositivos e regras por tópico ("filtro=codec,...").
+PAYLOAD_CODEC = settings.payload_codec
+PAYLOAD_CODEC_RULES = settings.payload_codec_rules
+# Codec das mensagens publicadas no tópico de dados processados.
+OUTPUT_CODEC = settings.output_codec
+# Codec dos valores guardados no Redis (políticas e pontos de dados).
+STORAGE_CODEC = settings.storage_codec
+
+# Dependências opcionais: sem elas, o codec correspondente não fica disponível.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+logger = logging.getLogger(__name__)
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class CodecError(ValueError):
+    """ Payload que não pôde ser decodificado (ou objeto que não pôde ser codificado). """
+
+
+class Codec:
+    name = ""
+    content_type = ""
+    # Prefixo de 1 byte que identifica o formato dos valores guardados no Redis.
+    tag = b""
+
+    def encode(self, obj: Any) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: Buffer) -> Any:
+        """ Decodifica diretamente do buffer recebido (bytes ou memoryview), sem cópias intermediárias. """
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    """ JSON com orjson, quando instalado, ou com o módulo json da biblioteca padrão. """
+
+    name = "json"
+    content_type = "application/json"
+
+    def encode(self, obj: Any) -> bytes:
+        if orjson is not None:
+            try:
+                # Chaves não textuais (ex: números) são convertidas para texto, como no json.dumps.
+                return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+            except TypeError as e:
+                raise CodecError(e) from e
+        try:
+            return json.dumps(obj).encode()
+        except (TypeError, ValueError) as e:
+            raise CodecError(e) from e
+
+    def decode(self, data: Buffer) -> Any:
+        try:
+            if orjson is not None:
+                return orjson.loads(data)
+            return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise CodecError(e) from e
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+    content_type = "application/msgpack"
+    tag = b"\x01"
+
+    def encode(self, obj: Any) -> bytes:
+        try:
+            return msgpack.packb(obj, default=_to_builtin)
+        except (TypeError, ValueError) as e:
+            raise CodecError(e) from e
+
+    def decode(self, data: Buffer) -> Any:
+        try:
+            return msgpack.unpackb(data)
+        except (ValueError, TypeError) as e:
+            raise CodecError(e) from e
+
+
+class CborCodec(Codec):
+    name = "cbor"
+    content_type = "application/cbor"
+    tag = b"\x02"
+
+    def encode(self, obj: Any) -> bytes:
+        try:
+            return cbor2.dumps(obj, default=lambda encoder, value: encoder.encode(_to_builtin(value)))
+        except (cbor2.CBOREncodeError, TypeError, ValueError) as e:
+            raise CodecError(e) from e
+
+    def decode(self, data: Buffer) -> Any:
+        try:
+            return cbor2.loads(data)
+        except (cbor2.CBORDecodeError, ValueError, TypeError) as e:
+            raise CodecError(e) from e
+
+
+def _to_builtin(value: Any) -> Any:
+    """ Converte escalares/arrays do numpy (ex: saída do GNOISE) para tipos nativos. """
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Tipo não serializável: {type(value).__name__}")
+
+
+CODECS: Dict[str, Codec] = {"json": JsonCodec()}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+if cbor2 is not None:
+    CODECS["cbor"] = CborCodec()
+
+CONTENT_TYPES = {codec.content_type: codec for codec in CODECS.values()}
+if "msgpack" in CODECS:
+    CONTENT_TYPES["application/x-msgpack"] = CODECS["msgpack"]
+
+
+def get_codec(name: str, fallback: str = "json") -> Codec:
+    """ Retorna o codec pelo nome; se ele não estiver disponível (dependência ausente), usa o fallback. """
+    codec = CODECS.get(name.strip().lower())
+    if codec is None:
+        logger.warning("Codec '%s' indisponível (dependência não instalada?); usando '%s'.", name, fallback)
+        codec = CODECS[fallback]
+    return codec
+
+
+class CodecSelector:
+    """ Escolhe o codec de cada mensagem pelo content type (MQTT 5) ou, na falta dele, pelo tópico. """
+
+    def __init__(self, default: str = PAYLOAD_CODEC, rules: str = PAYLOAD_CODEC_RULES):
+        """
+        Args:
+            default: Codec usado quando nenhuma regra casa com o tópico.
+            rules: Regras "filtro=codec" separadas por vírgula (ex: "dispositivos/+/cbor=cbor"),
+                avaliadas em ordem, com a sintaxe de filtros de tópico do MQTT.
+        """
+        self.default = get_codec(default)
+        self.rules: List[Tuple[str, Codec]] = []
+        for rule in filter(None, (r.strip() for r in rules.split(","))):
+            topic_filter, name = rule.rsplit("=", 1)
+            self.rules.append((topic_filter.strip(), get_codec(name)))
+        self._by_topic: Dict[str, Codec] = {}
+
+    def select(self, topic: str, content_type: Optional[str] = None) -> Codec:
+        if content_type:
+            codec = CONTENT_TYPES.get(content_type.split(";")[0].strip().lower())
+            if codec is not None:
+                return codec
+        codec = self._by_topic.get(topic)
+        if codec is None:
+            codec = next((c for f, c in self.rules if mqtt.topic_matches_sub(f, topic)), self.default)
+            if len(self._by_topic) < 100000:
+                self._by_topic[topic] = codec
+        return codec
+
+
+class StorageSerializer:
+    """
+    Serializa os valores guardados no Redis no formato binário configurado, prefixado por um
+    byte que identifica o codec. Valores sem prefixo são lidos como JSON (formato anterior),
+    o que permite atualizar as réplicas sem limpar o Redis.
+    """
+
+    def __init__(self, codec: str = STORAGE_CODEC):
+        self.codec = get_codec(codec)
+        self._by_tag = {c.tag: c for c in CODECS.values() if c.tag}
+
+    def dumps(self, obj: Any) -> bytes:
+        return self.codec.tag + self.codec.encode(obj)
+
+    def loads(self, data: Buffer) -> Any:
+        view = memoryview(data)
+        codec = self._by_tag.get(bytes(view[:1]))
+        if codec is None:
+            return CODECS["json"].decode(data)
+        return codec.decode(view[1:])
+
+
+# Singletons
+payload_codecs = CodecSelector()
+output_codec = get_codec(OUTPUT_CODEC)
+storage = StorageSerializer()
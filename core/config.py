@@ -0,0 +1,165 @@
+import os
+import threading
+import typing
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Mapping, Optional
+from dotenv import load_dotenv
+
+
+class ConfigError(ValueError):
+    """ Variável de ambiente com valor inválido para o seu tipo. """
+
+
+def _parse_bool(raw: str) -> bool:
+    return raw.strip().lower() in ("1", "true", "yes")
+
+
+_PARSERS = {int: int, float: float, bool: _parse_bool, str: str}
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Configuração tipada do gateway. Cada campo é lido da variável de ambiente de mesmo nome
+    em maiúsculas (ex: `mqtt_port` <- MQTT_PORT); variáveis ausentes (ou vazias, nos campos
+    não textuais) ficam com o valor padrão. Os módulos derivam dela suas constantes (ex:
+    milissegundos convertidos para segundos).
+    """
+
+    # Broker MQTT e tópicos.
+    mqtt_host: str = "localhost"
+    mqtt_port: int = 1883
+    mqtt_protocol: str = "3.1.1"
+    topico_notificacoes_mgc: str = "politicas/atualizacoes"
+    topico_dados_dispositivos: str = "dispositivos/+/dados"
+    topico_dados_processados: str = "dados_processados"
+    # MGC.
+    mgc_api_url: str = "http://localhost:8000"
+    mgc_pool_size: int = 10
+    mgc_timeout: float = 5.0
+    policy_fetch_max_pending: int = 1000
+    # Estado (backend, Redis e cache L1).
+    state_backend: str = "redis"
+    cache_ttl_time: int = 3600
+    redis_host: str = "localhost"
+    redis_port: int = 6379
+    aggregation_task_queue: str = "tasks:aggregation_due"
+    data_dir: str = "/var/lib/gateway-privacidade"
+    memory_snapshot_path: str = ""
+    memory_snapshot_interval: float = 30.0
+    l1_cache_max_size: int = 10000
+    l1_cache_ttl_time: int = 60
+    l1_negative_ttl_time: int = 30
+    policy_plan_cache_size: int = 1024
+    # Janelas de agregação.
+    window_allowed_lateness: int = 5
+    window_retention: int = 60
+    window_max_panes: int = 1024
+    # Ingestão e proteção contra sobrecarga.
+    ingestion_workers: int = 4
+    ingestion_queue_size: int = 10000
+    ingestion_batch_size: int = 100
+    ingestion_batch_linger_ms: float = 0.0
+    ingestion_enqueue_timeout_ms: float = 100.0
+    ingestion_priority_rules: str = ""
+    ingestion_shed_low_watermark: float = 0.5
+    ingestion_shed_normal_watermark: float = 0.9
+    rate_limit_device: float = 0.0
+    rate_limit_device_burst: float = 0.0
+    rate_limit_titular: float = 0.0
+    rate_limit_titular_burst: float = 0.0
+    rate_limit_max_keys: int = 100000
+    # Scheduler.
+    scheduler_workers: int = 4
+    scheduler_batch_size: int = 200
+    scheduler_max_sleep: float = 5.0
+    scheduler_task_lease: float = 60.0
+    # Publicador.
+    publisher_queue_size: int = 10000
+    publisher_batch_size: int = 500
+    publisher_linger_ms: float = 0.0
+    publisher_enqueue_timeout_ms: float = 1000.0
+    publisher_coalesce: str = ""
+    publisher_max_envelope: int = 100
+    publisher_qos: int = 0
+    publisher_qos_rules: str = ""
+    publisher_max_inflight: int = 1000
+    publisher_spill_size: int = 100000
+    publisher_overflow_size: int = 10000
+    publisher_max_retries: int = 3
+    publisher_retry_interval_ms: float = 200.0
+    # Cluster.
+    cluster_enabled: bool = False
+    cluster_slots: int = 64
+    cluster_node_id: Optional[str] = None
+    cluster_members_key: str = "cluster:members"
+    cluster_heartbeat_interval: float = 2.0
+    cluster_node_ttl: float = 6.0
+    cluster_virtual_nodes: int = 64
+    cluster_share_group: str = "gateway_privacidade"
+    # Codecs.
+    payload_codec: str = "json"
+    payload_codec_rules: str = ""
+    output_codec: str = "json"
+    storage_codec: str = "msgpack"
+    # Warm-up de políticas.
+    warmup_sources: str = "snapshot,mgc"
+    warmup_blocking: bool = True
+    warmup_page_size: int = 1000
+    warmup_snapshot_path: str = ""
+    warmup_snapshot_interval: float = 300.0
+    warmup_snapshot_max_age: float = 900.0
+    # Tratamentos.
+    sketch_relative_accuracy: float = 0.01
+    gnoise_seed: Optional[int] = None
+    gnoise_buffer_size: int = 65536
+    pseudonym_key: str = ""
+    pipeline_profile_sample_rate: float = 0.01
+    # Observabilidade.
+    log_level: str = "INFO"
+    log_sample_rate: float = 1.0
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int = 0
+    # Replay offline.
+    replay_chunk_size: int = 100000
+
+    @classmethod
+    def from_env(cls, environ: Optional[Mapping[str, str]] = None) -> "Settings":
+        """ Monta a configuração a partir do ambiente (por padrão, os.environ). """
+        environ = os.environ if environ is None else environ
+        hints = typing.get_type_hints(cls)
+        values: Dict[str, Any] = {}
+        for field in fields(cls):
+            name = field.name.upper()
+            raw = environ.get(name)
+            # Optional[X] -> X
+            kind = next((arg for arg in typing.get_args(hints[field.name]) if arg is not type(None)), hints[field.name])
+            if raw is None or (raw == "" and kind is not str):
+                continue
+            try:
+                values[field.name] = _PARSERS[kind](raw)
+            except ValueError:
+                raise ConfigError(f"Valor inválido para {name} ({kind.__name__}): {raw!r}") from None
+        return cls(**values)
+
+
+_settings: Optional[Settings] = None
+_settings_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    """ Configuração do processo, lida do ambiente (e do .env) uma única vez, no primeiro uso. """
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                load_dotenv()
+                _settings = Settings.from_env()
+    return _settings
+
+
+def __getattr__(name: str) -> Any:
+    # `from core.config import settings` carrega a configuração só quando é de fato usada.
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,162 +1,408 @@
+import logging
 import paho.mqtt.client as mqtt
 import json
-import requests
 import time
-from typing import Dict, Any, Optional
-from dotenv import load_dotenv
-import os
-from apis import MGCAPI
+from typing import Dict, Any, List, Optional, Tuple
+from apis import MGCAPI, MGCError
+from core.backends import StateBackendError
 from core.cache_manager import cache_manager
-from core.policy_parser import parse_policy_key, parse_time_string
-from treatments.factory import get_treatment_strategy, is_accumulated_strategy
+from core.cluster import CLUSTER_ENABLED, ClusterMembership, shared_topic
+from core.codecs import CodecError, payload_codecs
+from core.config import settings
+from core.ingestion import IngestionPipeline, Message
+from core.overload import PrioritySelector, RateLimiter
+from core.policy_fetcher import Decoded, PolicyFetcher
+from core.policy_plan import PolicyPlan, get_policy_plan, policy_plans
+from core.publisher import OutboundPublisher
 from core.scheduler import Scheduler
-load_dotenv()
+from core.startup import startup
+from core.warmup import WARMUP_BLOCKING, WARMUP_SNAPSHOT_PATH, PolicyWarmup, SnapshotWriter
+from core.windowing import parse_timestamp
+from core.metrics import (
+    FAILED_CLOSED, LATE_POINTS, MESSAGES_IN, MESSAGES_OUT, POLICY_LOOKUP_LATENCY, REVOCATION_LATENCY, REVOKED_PAIRS, STAGE_LATENCY, THROTTLED, debug_sampled, registry,
+    start_metrics_server,
+)
 
-MQTT_HOST = os.getenv("MQTT_HOST")
-MQTT_PORT = int(os.getenv("MQTT_PORT"))
-NOTIFICATIONS_TOPIC = os.getenv("TOPICO_NOTIFICACOES_MGC")
-RECEIVED_DATA_TOPIC  = os.getenv("TOPICO_DADOS_DISPOSITIVOS")
-SEND_DATA_TOPIC = os.getenv("TOPICO_DADOS_PROCESSADOS")
-CACHE_MAX_AGE = int(os.getenv("CACHE_TTL_TIME"))
+MQTT_HOST = settings.mqtt_host
+MQTT_PORT = settings.mqtt_port
+# "5" habilita o MQTT 5, cujo content type das mensagens também seleciona o codec do payload.
+MQTT_PROTOCOL = mqtt.MQTTv5 if settings.mqtt_protocol == "5" else mqtt.MQTTv311
+NOTIFICATIONS_TOPIC = settings.topico_notificacoes_mgc
+RECEIVED_DATA_TOPIC  = settings.topico_dados_dispositivos
+SEND_DATA_TOPIC = settings.topico_dados_processados
+CACHE_MAX_AGE = settings.cache_ttl_time
+
+logger = logging.getLogger(__name__)
+
+DECODE_LATENCY = STAGE_LATENCY.labels("decode")
+STRATEGY_LATENCY = STAGE_LATENCY.labels("strategy")
+PUBLISH_LATENCY = STAGE_LATENCY.labels("publish")
+INVALIDATE_LATENCY = STAGE_LATENCY.labels("invalidate")
+MGC_LOOKUP_LATENCY = POLICY_LOOKUP_LATENCY.labels("mgc")
 
-politicas_cache: Dict[str, Dict[str, Any]] = {}
 
 class PrivacyGateway:
     def __init__(self):
-        self.mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-        self.mqtt_client.on_connect = self.on_connect
-        self.mqtt_client.on_message = self.on_message
-        self.mgc = MGCAPI()
-        self.scheduler = Scheduler(self.mqtt_client)
+        self._mqtt_client: Optional[mqtt.Client] = None
+        self.mgc = MGCAPI(on_consentimentos=self._store_consentimentos)
+        self.cluster = ClusterMembership(cache_manager)
+        self.publisher = OutboundPublisher(None)
+        self.scheduler = Scheduler(self.publisher, self.mgc, self.cluster)
+        self.ingestion = IngestionPipeline(self.handle_received_batch)
+        self.policy_fetcher = PolicyFetcher(self._get_or_fetch_policy, self._process_fetched)
+        self.priorities = PrioritySelector()
+        self.rate_limiter = RateLimiter()
+        self.warmup = PolicyWarmup(self.mgc)
+        self.snapshots = SnapshotWriter() if WARMUP_SNAPSHOT_PATH else None
+        self._register_metrics()
+        startup.mark("init")
+
+    @property
+    def mqtt_client(self) -> mqtt.Client:
+        """ Cliente MQTT, criado no primeiro uso (normalmente em start()). """
+        if self._mqtt_client is None:
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, protocol=MQTT_PROTOCOL)
+            client.on_connect = self.on_connect
+            client.on_message = self.on_message
+            self.mqtt_client = client
+        return self._mqtt_client
+
+    @mqtt_client.setter
+    def mqtt_client(self, client: mqtt.Client):
+        self._mqtt_client = client
+        self.publisher.client = client
 
-    
     def start(self):
         """Inicia o cliente MQTT e o loop de escuta."""
-        print("Iniciando o Gateway de Privacidade...")
+        logger.info("Iniciando o Gateway de Privacidade...")
+        try:
+            cache_manager.connect()
+        except StateBackendError as e:
+            logger.error("Erro fatal: backend de estado '%s' indisponível: %s", cache_manager.backend_name, e)
+            return
+        startup.mark("state_backend")
+        start_metrics_server()
+        if WARMUP_BLOCKING:
+            # Só aceita mensagens com o cache já aquecido.
+            self.warmup.run()
+        else:
+            self.warmup.start()
+        if self.snapshots:
+            self.snapshots.start()
+        startup.mark("warmup")
         try:
             self.mqtt_client.connect(MQTT_HOST, MQTT_PORT, 60)
+            startup.mark("mqtt_connect")
+            if CLUSTER_ENABLED:
+                # Entra no cluster antes do scheduler, para já começar com os slots rebalanceados.
+                self.cluster.heartbeat()
+                self.cluster.start()
+            self.publisher.start()
             self.scheduler.start()
+            self.ingestion.start()
             # loop_forever() é uma chamada bloqueante que mantém o cliente rodando e ouvindo por mensagens.
             self.mqtt_client.loop_forever()
         except ConnectionRefusedError:
-            print("Erro fatal: Conexão com o broker MQTT foi recusada. Verifique o host e a porta.")
+            logger.error("Erro fatal: Conexão com o broker MQTT foi recusada. Verifique o host e a porta.")
         except KeyboardInterrupt:
-            print("\nGateway de Privacidade encerrado pelo usuário.")
+            logger.info("Gateway de Privacidade encerrado pelo usuário.")
             self.scheduler.stop()
+            self.cluster.stop()
+            self.ingestion.stop()
+            self.policy_fetcher.stop()
+            # Publica os resultados ainda na fila antes de desconectar do broker.
+            self.publisher.stop()
             self.mqtt_client.disconnect()
+            if self.snapshots:
+                self.snapshots.stop()
+            cache_manager.close()
     
     def on_connect(self, client, userdata, flags, reason_code, properties):
         """Callback executado quando a conexão com o broker é estabelecida."""
         if reason_code == 0:
-            print("Conectado ao Broker MQTT com sucesso!")
+            logger.info("Conectado ao Broker MQTT com sucesso!")
             # Inscreve-se no tópico de notificações do MGC
             client.subscribe(NOTIFICATIONS_TOPIC)
-            print(f" -> Inscrito no tópico de notificações: {NOTIFICATIONS_TOPIC}")
-            # Inscreve-se nos tópicos de dados dos dispositivos
-            client.subscribe(RECEIVED_DATA_TOPIC)
-            print(f" -> Inscrito no tópico de dados: {RECEIVED_DATA_TOPIC}")
+            logger.info(" -> Inscrito no tópico de notificações: %s", NOTIFICATIONS_TOPIC)
+            # Inscreve-se nos tópicos de dados dos dispositivos (em cluster, com assinatura
+            # compartilhada: cada mensagem é entregue a uma única réplica do grupo).
+            client.subscribe(shared_topic(RECEIVED_DATA_TOPIC))
+            logger.info(" -> Inscrito no tópico de dados: %s", shared_topic(RECEIVED_DATA_TOPIC))
         else:
-            print(f"Falha ao conectar ao broker, código de retorno: {reason_code}")
+            logger.error("Falha ao conectar ao broker, código de retorno: %s", reason_code)
     
     def on_message(self, client, userdata, msg):
         """Callback executado para cada mensagem recebida."""
-        print(f"\nMensagem recebida no tópico '{msg.topic}'")
+        debug_sampled(logger, "Mensagem recebida no tópico '%s'", msg.topic)
         
         # Direciona a mensagem para a função de tratamento correta
         if msg.topic == NOTIFICATIONS_TOPIC:
             self.handle_notification(msg.payload)
         elif msg.topic.startswith(RECEIVED_DATA_TOPIC.split("/")[0]):
-            self.handle_received_data(msg.topic, msg.payload)
+            # O processamento acontece nos workers da pipeline de ingestão, fora da thread de rede.
+            content_type = getattr(msg.properties, "ContentType", None) if msg.properties else None
+            if not self.ingestion.submit(msg.topic, msg.payload, content_type, self.priorities.select(msg.topic)):
+                debug_sampled(logger, "Fila de ingestão sobrecarregada: mensagem do tópico '%s' descartada.", msg.topic)
     
     def handle_notification(self, payload):
-        """Trata as mensagens de invalidação de cache vindas do MGC."""
+        """
+        Trata as mensagens de invalidação de cache vindas do MGC. O campo "escopo" define o alcance:
+          - "par" (padrão): um dispositivo de um titular ("dispositivo_id" e "titular_id").
+          - "titular": todos os dispositivos do titular (ex: revogação de todo o consentimento).
+          - "dispositivo": todos os titulares do dispositivo (ex: dispositivo desativado).
+          - "lote": uma lista "pares" de {"dispositivo_id", "titular_id"}.
+        Com "revogacao" (padrão verdadeiro para titular e dispositivo), os dados pendentes de
+        agregação e as tarefas agendadas também são descartados. Um "timestamp" opcional (epoch
+        ou ISO 8601) com o horário da revogação no MGC é usado na métrica de latência.
+        """
+        received_at = time.time()
         try:
             notificacao = json.loads(payload)
-            dispositivo_id = notificacao.get("dispositivo_id") 
-            titular_id = notificacao.get("titular_id")
-            if dispositivo_id:
-                print(f"Notificação recebida!")
-                cache_manager.invalidate_policy(dispositivo_id, titular_id)
         except json.JSONDecodeError:
-            print("Erro ao decodificar notificação do MGC.")
+            logger.warning("Erro ao decodificar notificação do MGC.")
+            return
+        if not isinstance(notificacao, dict):
+            logger.warning("Notificação do MGC em formato inesperado.")
+            return
+        escopo = notificacao.get("escopo", "par")
+        purge = bool(notificacao.get("revogacao", escopo in ("titular", "dispositivo")))
+        dispositivo_id = notificacao.get("dispositivo_id")
+        titular_id = notificacao.get("titular_id")
+        if escopo == "titular" and titular_id:
+            pairs = cache_manager.invalidate_policies(titulares=[titular_id], purge=purge)
+        elif escopo == "dispositivo" and dispositivo_id:
+            pairs = cache_manager.invalidate_policies(dispositivos=[dispositivo_id], purge=purge)
+        elif escopo == "lote":
+            pares = [(p.get("dispositivo_id"), p.get("titular_id")) for p in notificacao.get("pares") or [] if isinstance(p, dict)]
+            pairs = cache_manager.invalidate_policies(pairs=[(d, t) for d, t in pares if d and t], purge=purge)
+        elif escopo == "par" and dispositivo_id:
+            pairs = cache_manager.invalidate_policies(pairs=[(dispositivo_id, titular_id)], purge=purge)
+        else:
+            logger.warning("Notificação do MGC com escopo inválido ou sem identificadores: %s", notificacao)
+            return
+        INVALIDATE_LATENCY.observe(time.time() - received_at)
+        if self.snapshots:
+            # O snapshot do warm-up ainda contém as políticas invalidadas: ele é descartado e regravado.
+            self.snapshots.invalidate()
+        REVOKED_PAIRS.labels(escopo).inc(len(pairs))
+        revoked_at = parse_timestamp(notificacao.get("timestamp"))
+        if revoked_at is not None:
+            REVOCATION_LATENCY.labels(escopo).observe(max(time.time() - revoked_at, 0.0))
+        logger.info(
+            "Notificação do MGC (escopo %s, revogação: %s): %d políticas invalidadas.",
+            escopo, "sim" if purge else "não", len(pairs),
+        )
     
-    def handle_received_data(self, topic, payload):
+    def handle_received_data(self, topic, payload, content_type: Optional[str] = None):
         """Processa os dados recebidos de um dispositivo IoT."""
+        message = self._decode_message(topic, payload, content_type)
+        if not message:
+            return
+        dispositivo_id, titular_id, dados = message
+        if not self._admit(dispositivo_id, titular_id):
+            return
+        politica = self._get_or_fetch_policy(dispositivo_id, titular_id)
+        if politica:
+            self._apply_policy(dados, politica)
+        else:
+            debug_sampled(logger, "Nenhuma política de privacidade encontrada para o dispositivo %s.", dispositivo_id)
+        startup.first_message()
+
+    def handle_received_batch(self, messages: List[Message]):
+        """
+        Processa um micro-lote de mensagens de dispositivos: as políticas do lote são buscadas
+        de uma só vez e as escritas no Redis (ex: pontos de agregação) vão em um único pipeline.
+        As mensagens cuja política não está no cache aguardam a busca no MGC no PolicyFetcher,
+        sem bloquear o worker. A ordem das mensagens de cada dispositivo é preservada.
+        """
+        decoded = [m for m in (self._decode_message(*message) for message in messages) if m and self._admit(m[0], m[1])]
+        if not decoded:
+            return
+        politicas = cache_manager.get_policies((d, t) for d, t, _ in decoded)
+        ready = [m for m in decoded if not self.policy_fetcher.defer(m, (m[0], m[1]) not in politicas)]
+        self._process_decoded(ready, politicas)
+        startup.first_message()
+
+    def _process_fetched(self, messages: List[Decoded], politica: Optional[Dict[str, Any]]):
+        """ Processa as mensagens de um par que aguardavam a busca da política no MGC. """
+        self._process_decoded(messages, {(d, t): politica for d, t, _ in messages})
+
+    def _process_decoded(self, decoded: List[Decoded], politicas: Dict[Tuple[str, str], Optional[Dict[str, Any]]]):
+        """ Aplica as políticas (já resolvidas) às mensagens decodificadas. """
+        # Agrupa os payloads por plano para que cada estratégia trate seu grupo em lote
+        # (ex: ruído vetorizado); os grupos mantêm a ordem de chegada de cada dispositivo.
+        grupos: Dict[PolicyPlan, List[Dict[str, Any]]] = {}
+        for dispositivo_id, titular_id, dados in decoded:
+            politica = politicas[(dispositivo_id, titular_id)]
+            if not politica:
+                debug_sampled(logger, "Nenhuma política de privacidade encontrada para o dispositivo %s.", dispositivo_id)
+                continue
+            plan = get_policy_plan(politica)
+            if plan.rejected:
+                debug_sampled(logger, "Erro: %s", plan.error)
+                continue
+            grupos.setdefault(plan, []).append(dados)
+        with cache_manager.pipelined():
+            for plan, payloads in grupos.items():
+                MESSAGES_IN.labels(plan.action).inc(len(payloads))
+                start = time.perf_counter()
+                results = self._execute_plan(plan, payloads)
+                if results is None:
+                    continue
+                STRATEGY_LATENCY.observe((time.perf_counter() - start) / len(payloads), len(payloads))
+                for payload, processed_data in zip(payloads, results):
+                    self._forward_processed_data(payload, processed_data, plan)
+
+    def _decode_message(self, topic: str, payload: bytes, content_type: Optional[str] = None) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+        """
+        Extrai (dispositivo_id, titular_id, dados) de uma mensagem de dispositivo, decodificando
+        o payload diretamente do buffer recebido com o codec do content type ou do tópico.
+        """
+        start = time.perf_counter()
         try:
             # Extrai o ID do dispositivo do tópico
             dispositivo_id = topic.split('/')[1]
-            dados = json.loads(payload)
-
-            titular_id = dados.get("titular_id")
-            if not titular_id:
-                print("Erro: Dados do dispositivo não contêm titular_id.")
-                return
-
-            print(f"Processando dados do dispositivo '{dispositivo_id}': {dados}")
-
-            politica = self._get_or_fetch_policy(dispositivo_id, titular_id)
-            if politica:
-                self._apply_policy(dados, politica)
-            else:
-                print(f"Nenhuma política de privacidade encontrada para o dispositivo {dispositivo_id}.")
-            
-        except (IndexError, json.JSONDecodeError):
-            print("Erro ao processar dados do dispositivo. Tópico ou payload mal formatado.")
-    
+            dados = payload_codecs.select(topic, content_type).decode(payload)
+        except (IndexError, CodecError):
+            debug_sampled(logger, "Erro ao processar dados do dispositivo. Tópico ou payload mal formatado.")
+            return None
+        if not isinstance(dados, dict):
+            debug_sampled(logger, "Erro ao processar dados do dispositivo. Tópico ou payload mal formatado.")
+            return None
+        DECODE_LATENCY.observe(time.perf_counter() - start)
+        titular_id = dados.get("titular_id")
+        if not titular_id:
+            debug_sampled(logger, "Erro: Dados do dispositivo não contêm titular_id.")
+            return None
+        debug_sampled(logger, "Processando dados do dispositivo '%s' (titular '%s').", dispositivo_id, titular_id)
+        return dispositivo_id, titular_id, dados
+
     def _get_or_fetch_policy(self, dispositivo_id: str, titular_id: str) -> Optional[Dict[str, Any]]:
         """ Busca no cache ou no MGC uma política de privacidade para o dispositivo. """
+        if cache_manager.is_policy_absent(dispositivo_id, titular_id):
+            return None
         politica = cache_manager.get_policy(dispositivo_id, titular_id)
         if not politica:
-            politica = self.mgc.get_politica_privacidade(dispositivo_id, titular_id)
-            if politica:
-                cache_manager.set_policy(dispositivo_id, titular_id, politica)
-                self._kickstart_aggregation_task(dispositivo_id, titular_id, politica)
+            # Em caso de sucesso, o MGC já cacheou e agendou todas as políticas do titular
+            # através de _store_consentimentos.
+            start = time.perf_counter()
+            try:
+                politica = self.mgc.get_politica_privacidade(titular_id=titular_id, dispositivo_id=dispositivo_id)
+            except MGCError as e:
+                # Sem resposta do MGC a ausência não é cacheada: a próxima mensagem tenta de novo.
+                debug_sampled(logger, "MGC indisponível para o dispositivo %s: %s", dispositivo_id, e)
+                return None
+            finally:
+                MGC_LOOKUP_LATENCY.observe(time.perf_counter() - start)
+            if not politica:
+                cache_manager.set_policy_absent(dispositivo_id, titular_id)
         return politica
 
+    def _store_consentimentos(self, titular_id: str, consentimentos: Dict[str, Dict[str, Any]]):
+        """ Cacheia todos os consentimentos retornados pelo MGC e agenda as agregações necessárias. """
+        cache_manager.set_policies(titular_id, consentimentos)
+        for dispositivo_id, politica in consentimentos.items():
+            self._kickstart_aggregation_task(dispositivo_id, titular_id, politica)
+
     def _apply_policy(self, payload: Dict[str, Any], policy: Dict[str, Any]) -> None:
         """ Aplica a política de privacidade aos dados recebidos. """
-        chave_politica = policy.get("opcao_tratamento", {}).get("chave_politica")
-        if not chave_politica:
-            print("Erro: Dados do dispositivo não contêm chave_politica.")
-            return
-        parsed_policy = parse_policy_key(chave_politica)
-        if not parsed_policy["action"]:
-            print("Erro: Dados do dispositivo não contêm ação de tratamento.")
+        plan = get_policy_plan(policy)
+        if plan.rejected:
+            debug_sampled(logger, "Erro: %s", plan.error)
             return
-        strategy = get_treatment_strategy(parsed_policy["action"])
-        if not strategy:
-            print(f"Estratégia de tratamento não encontrada para a chave_politica '{chave_politica}'.")
+        MESSAGES_IN.labels(plan.action).inc()
+        start = time.perf_counter()
+        results = self._execute_plan(plan, [payload])
+        if results is None:
             return
-        processed_data = strategy.execute(payload, parsed_policy["params"])
+        STRATEGY_LATENCY.observe(time.perf_counter() - start)
+        self._forward_processed_data(payload, results[0], plan)
+
+    def _execute_plan(self, plan: PolicyPlan, payloads: List[Dict[str, Any]]) -> Optional[List[Optional[Dict[str, Any]]]]:
+        """
+        Executa a estratégia do plano; estratégias de agregação acumulam os pontos na janela do plano.
+        O gateway falha fechado: se a estratégia falhar, os payloads são descartados e nunca
+        encaminhados sem tratamento.
+        Returns:
+            - Os resultados da estratégia, ou None se ela falhou.
+        """
+        try:
+            if plan.accumulated:
+                late = plan.strategy.accumulate(payloads, plan.window_spec)
+                if late:
+                    LATE_POINTS.labels(plan.action).inc(late)
+                return [None] * len(payloads)
+            return plan.strategy.execute_batch(payloads, plan.params)
+        except Exception as e:
+            FAILED_CLOSED.labels(plan.action).inc(len(payloads))
+            logger.exception("Erro na estratégia '%s': %d mensagens descartadas. %s", plan.action, len(payloads), e)
+            return None
+
+    def _admit(self, dispositivo_id: str, titular_id: str) -> bool:
+        """ Aplica os limites de taxa por dispositivo e por titular; mensagens limitadas são descartadas. """
+        scope = self.rate_limiter.admit(dispositivo_id, titular_id)
+        if scope:
+            THROTTLED.labels(scope).inc()
+            debug_sampled(logger, "Mensagem do dispositivo %s descartada pelo limite de taxa (%s).", dispositivo_id, scope)
+            return False
+        return True
+
+    def _forward_processed_data(self, payload: Dict[str, Any], processed_data: Optional[Dict[str, Any]], plan: PolicyPlan):
+        """ Publica o resultado de uma estratégia, se houver dados a encaminhar. """
         if processed_data:
             dispositivo_id = payload.get("dispositivo_id", "unknown")
-            self.mqtt_client.publish(f"{SEND_DATA_TOPIC}/{dispositivo_id}", json.dumps(processed_data))
-            print(f"Dados processados e encaminhados para o tópico de dados processados: {SEND_DATA_TOPIC}/{dispositivo_id}")
+            start = time.perf_counter()
+            self.publisher.publish(f"{SEND_DATA_TOPIC}/{dispositivo_id}", processed_data, plan.action)
+            PUBLISH_LATENCY.observe(time.perf_counter() - start)
+            MESSAGES_OUT.labels(plan.action).inc()
+            debug_sampled(logger, "Dados processados e encaminhados para o tópico de dados processados: %s/%s", SEND_DATA_TOPIC, dispositivo_id)
         else:
-            print(f"Dados não processados pela política '{chave_politica}'.")
+            debug_sampled(logger, "Dados não processados pela política '%s'.", plan.chave_politica)
 
     def _kickstart_aggregation_task(self, device_id:str, titular_id:str, policy:Dict[str, Any]):
         """ Inicia a tarefa de agregação de dados para um dispositivo. """
-        chave_politica = policy.get("opcao_tratamento", {}).get("chave_politica")
-        if not chave_politica:
-            print("Erro: Dados do dispositivo não contêm chave_politica.")
+        plan = get_policy_plan(policy)
+        if plan.rejected:
+            debug_sampled(logger, "Erro: %s", plan.error)
             return
-        parsed_policy = parse_policy_key(chave_politica)
-        if not parsed_policy["action"]:
-            print("Erro: Dados do dispositivo não contêm ação de tratamento.")
+        if not plan.accumulated:
             return
-        if is_accumulated_strategy(parsed_policy["action"]):
-            interval_str = parsed_policy["interval"]
-            if not interval_str:
-                print("Erro: Dados do dispositivo não contêm intervalo de agregação.")
-                return
-            interval_seconds = parse_time_string(interval_str)
-            if not interval_seconds:
-                print("Erro: Dados do dispositivo não contêm intervalo de agregação válido.")
-                return
-            due_timestamp = time.time() + interval_seconds
-            cache_manager.schedule_aggregation_task(device_id, titular_id, due_timestamp)
-            print(f"Tarefa de agregação agendada para o dispositivo {device_id} para o titular {titular_id}.")
-        else:
-            print(f"Estratégia de tratamento não é de agregação de dados para a chave_politica '{chave_politica}'.")
-            return
\ No newline at end of file
+        due_timestamp = plan.window_spec.first_emission(time.time())
+        cache_manager.schedule_aggregation_task(device_id, titular_id, due_timestamp, only_if_absent=True)
+        debug_sampled(logger, "Tarefa de agregação agendada para o dispositivo %s para o titular %s.", device_id, titular_id)
+
+    def _register_metrics(self):
+        """ Expõe no endpoint de métricas os contadores mantidos pelos componentes do gateway. """
+        registry.callback("gateway_policy_cache", "Contadores do cache L1 de políticas.", cache_manager.get_policy_cache_stats, "gauge", "stat")
+        registry.callback("gateway_policy_plan_cache", "Contadores do cache de planos compilados.", policy_plans.stats, "gauge", "stat")
+        registry.callback(
+            "gateway_policy_cache_hit_ratio", "Taxa de acerto do cache L1 de políticas (acertos positivos e negativos).",
+            lambda: _hit_ratio(cache_manager.get_policy_cache_stats()),
+        )
+        registry.callback("gateway_mgc", "Estatísticas do cliente do MGC (requisições, erros, latência).", self.mgc.get_stats, "gauge", "stat")
+        registry.callback("gateway_ingestion", "Estatísticas da pipeline de ingestão (filas e lotes).", self.ingestion.stats, "gauge", "stat")
+        registry.callback(
+            "gateway_policy_fetch", "Buscas de políticas no MGC fora dos workers e mensagens em espera, adiadas e descartadas.",
+            self.policy_fetcher.stats, "gauge", "stat",
+        )
+        registry.callback(
+            "gateway_publisher", "Estatísticas do publicador (fila, buffer local, mensagens em voo, entregas e falhas).",
+            self.publisher.stats, "gauge", "stat",
+        )
+        registry.callback(
+            "gateway_scheduler", "Estatísticas do scheduler de agregação.",
+            lambda: {k: v for k, v in self.scheduler.stats().items() if v is not None}, "gauge", "stat",
+        )
+        registry.callback(
+            "gateway_warmup", "Progresso do warm-up de políticas (políticas, titulares, tarefas, duração).",
+            lambda: {k: v for k, v in self.warmup.stats().items() if isinstance(v, (int, float))}, "gauge", "stat",
+        )
+        registry.callback("gateway_rate_limiter", "Mensagens limitadas por taxa e buckets em memória.", self.rate_limiter.stats, "gauge", "stat")
+        registry.callback("gateway_startup_seconds", "Duração de cada fase da inicialização do gateway.", startup.report, "gauge", "phase")
+        registry.callback("gateway_cluster", "Participação da réplica no cluster (réplicas vivas, slots, rebalanceamentos).", self.cluster.stats, "gauge", "stat")
+
+
+def _hit_ratio(stats: Dict[str, int]) -> float:
+    hits = stats["hits"] + stats["negative_hits"]
+    total = hits + stats["misses"]
+    return hits / total if total else 0.0
@@ -0,0 +1,157 @@
+import logging
+import queue
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from core.config import settings
+from core.metrics import SHED_MESSAGES
+from core.overload import PRIORITY_HIGH, PRIORITY_LABELS, PRIORITY_NORMAL, SHED_WATERMARKS
+INGESTION_WORKERS = settings.ingestion_workers
+INGESTION_QUEUE_SIZE = settings.ingestion_queue_size
+INGESTION_BATCH_SIZE = settings.ingestion_batch_size
+INGESTION_BATCH_LINGER = settings.ingestion_batch_linger_ms / 1000
+INGESTION_ENQUEUE_TIMEOUT = settings.ingestion_enqueue_timeout_ms / 1000
+
+logger = logging.getLogger(__name__)
+
+# (tópico, payload, content type da mensagem MQTT 5, se houver)
+Message = Tuple[str, bytes, Optional[str]]
+
+
+class IngestionPipeline:
+    """
+    Desacopla a recepção das mensagens (thread de rede do paho) do seu processamento.
+    Cada dispositivo é sempre atendido pelo mesmo worker, o que preserva a ordem das
+    mensagens por dispositivo; cada worker consome sua fila em micro-lotes.
+    Sob sobrecarga, mensagens de prioridade menor são descartadas assim que a fila passa da
+    marca d'água da sua prioridade (SHED_WATERMARKS), preservando espaço para as de maior.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[Message]], None],
+        num_workers: int = INGESTION_WORKERS,
+        queue_size: int = INGESTION_QUEUE_SIZE,
+        batch_size: int = INGESTION_BATCH_SIZE,
+        batch_linger: float = INGESTION_BATCH_LINGER,
+        enqueue_timeout: float = INGESTION_ENQUEUE_TIMEOUT,
+    ):
+        """
+        Args:
+            handler: Função que processa um micro-lote de mensagens (tópico, payload, content type).
+            num_workers: Número de workers (e de filas).
+            queue_size: Capacidade máxima de cada fila.
+            batch_size: Tamanho máximo de um micro-lote.
+            batch_linger: Tempo máximo (segundos) que um worker espera para completar um lote.
+            enqueue_timeout: Tempo máximo (segundos) que o enfileiramento de uma mensagem de
+                prioridade alta bloqueia com a fila cheia.
+        """
+        self.handler = handler
+        self.batch_size = batch_size
+        self.batch_linger = batch_linger
+        self.enqueue_timeout = enqueue_timeout
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(num_workers)]
+        self._watermarks = {priority: int(mark * queue_size) for priority, mark in SHED_WATERMARKS.items()}
+        self._workers = [
+            threading.Thread(target=self._run_worker, args=(q,), name=f"ingestion-worker-{i}", daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "dropped": 0,
+            "shed_baixa": 0,
+            "shed_normal": 0,
+            "shed_alta": 0,
+            "processed": 0,
+            "batches": 0,
+            "batch_size_max": 0,
+            "errors": 0,
+        }
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self, timeout: float = 5.0):
+        """ Sinaliza a parada dos workers e aguarda o esvaziamento das filas. """
+        self._stop_event.set()
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def submit(self, topic: str, payload: bytes, content_type: Optional[str] = None, priority: int = PRIORITY_NORMAL) -> bool:
+        """
+        Enfileira uma mensagem para processamento. O payload é enfileirado como recebido, sem cópia.
+        Returns:
+            - False se a mensagem foi descartada: fila acima da marca d'água da prioridade ou,
+              para prioridade alta, fila ainda cheia após o timeout.
+        """
+        parts = topic.split("/")
+        shard_key = parts[1] if len(parts) > 1 else topic
+        q = self._queues[zlib.crc32(shard_key.encode()) % len(self._queues)]
+        try:
+            if priority < PRIORITY_HIGH:
+                if q.qsize() >= self._watermarks[priority]:
+                    raise queue.Full
+                q.put_nowait((topic, payload, content_type))
+            else:
+                q.put((topic, payload, content_type), timeout=self.enqueue_timeout)
+        except queue.Full:
+            label = PRIORITY_LABELS[priority]
+            SHED_MESSAGES.labels(label).inc()
+            with self._lock:
+                self._stats["dropped"] += 1
+                self._stats[f"shed_{label}"] += 1
+            return False
+        with self._lock:
+            self._stats["enqueued"] += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """ Retorna as métricas da pipeline (profundidade das filas e tamanho dos lotes). """
+        with self._lock:
+            stats = dict(self._stats)
+        depths = [q.qsize() for q in self._queues]
+        stats["queue_depth"] = sum(depths)
+        stats["queue_depth_max"] = max(depths) if depths else 0
+        stats["batch_size_avg"] = stats["processed"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def _run_worker(self, q: queue.Queue):
+        while True:
+            try:
+                first = q.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop_event.is_set():
+                    return
+                continue
+            batch = self._drain(q, first)
+            try:
+                self.handler(batch)
+            except Exception as e:
+                with self._lock:
+                    self._stats["errors"] += 1
+                logger.exception("Erro ao processar lote de %d mensagens: %s", len(batch), e)
+            with self._lock:
+                self._stats["processed"] += len(batch)
+                self._stats["batches"] += 1
+                self._stats["batch_size_max"] = max(self._stats["batch_size_max"], len(batch))
+
+    def _drain(self, q: queue.Queue, first: Message) -> List[Message]:
+        """ Monta um micro-lote com o que já está na fila (e, opcionalmente, espera um pouco mais). """
+        batch = [first]
+        deadline = time.monotonic() + self.batch_linger
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(q.get_nowait())
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        return batch
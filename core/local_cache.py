@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# Sentinela usada para representar uma entrada negativa ("não existe política").
+_NEGATIVE = object()
+
+
+class LocalPolicyCache:
+    """
+    Cache L1 em memória (LRU + TTL) para políticas de privacidade.
+    Fica na frente do Redis e também guarda entradas negativas, para que
+    dispositivos sem política não consultem o Redis e o MGC a cada mensagem.
+    """
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def lookup(self, key: Hashable) -> Tuple[bool, Optional[Any]]:
+        """
+        Busca uma entrada no cache.
+        Returns:
+            - (True, valor) em caso de acerto positivo.
+            - (True, None) em caso de acerto negativo (política sabidamente inexistente).
+            - (False, None) em caso de falta ou entrada expirada.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            if value is _NEGATIVE:
+                self.negative_hits += 1
+                return True, None
+            self.hits += 1
+            return True, value
+
+    def is_negative(self, key: Hashable) -> bool:
+        """ Indica se existe uma entrada negativa válida para a chave. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] is not _NEGATIVE:
+                return False
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return False
+            self._entries.move_to_end(key)
+            self.negative_hits += 1
+            return True
+
+    def put(self, key: Hashable, value: Any):
+        """ Armazena uma entrada positiva. """
+        self._store(key, value, self.ttl)
+
+    def put_negative(self, key: Hashable):
+        """ Armazena uma entrada negativa, com TTL próprio (normalmente mais curto). """
+        self._store(key, _NEGATIVE, self.negative_ttl)
+
+    def invalidate(self, key: Hashable) -> bool:
+        """ Remove uma entrada (positiva ou negativa) do cache. """
+        with self._lock:
+            removed = self._entries.pop(key, None) is not None
+            if removed:
+                self.invalidations += 1
+            return removed
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """ Remove todas as entradas cujas chaves satisfazem o predicado (ex: todos os dispositivos de um titular). """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """ Retorna os contadores de uso do cache. """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _store(self, key: Hashable, value: Any, ttl: float):
+        if self.max_size <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
@@ -0,0 +1,246 @@
+import bisect
+import logging
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+from core.config import settings
+METRICS_HOST = settings.metrics_host
+METRICS_PORT = settings.metrics_port
+LOG_SAMPLE_RATE = settings.log_sample_rate
+
+# Buckets (em segundos) adequados para latências de microssegundos até alguns segundos.
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """ Retorna (criando se necessário) a série correspondente aos valores dos labels. """
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values: LabelValues, child) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {child.value}"]
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, count: int = 1):
+        """ Registra `count` observações de `value` (ex: latência amortizada de um lote). """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += count
+            self.sum += value * count
+            self.count += count
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float, count: int = 1):
+        self.labels().observe(value, count)
+
+    def _render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, child.counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, f'le=\"{bound}\"')} {cumulative}")
+        lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, 'le=\"+Inf\"')} {child.count}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, values)} {child.sum}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, values)} {child.count}")
+        return lines
+
+
+class CallbackMetric:
+    """
+    Métrica cujo valor é lido sob demanda (no momento da coleta) de uma função, usada para
+    expor contadores que já existem em outros componentes (ex: stats() do cache L1).
+    A função retorna um número ou um dicionário {valor do label: número}.
+    """
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], Union[float, Dict[str, float]]], type_name: str = "gauge", labelname: Optional[str] = None):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.type_name = type_name
+        self.labelname = labelname
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        value = self.callback()
+        if isinstance(value, dict):
+            for label, v in value.items():
+                lines.append(f"{self.name}{_format_labels((self.labelname,), (label,))} {v}")
+        elif value is not None:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback(self, name: str, help_text: str, callback: Callable, type_name: str = "gauge", labelname: Optional[str] = None) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help_text, callback, type_name, labelname))
+
+    def render(self) -> str:
+        """ Serializa todas as métricas no formato texto do Prometheus. """
+        lines: List[str] = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.warning("Erro ao coletar a métrica %s: %s", metric.name, e)
+        return "\n".join(lines) + "\n"
+
+
+# Singleton
+registry = MetricsRegistry()
+
+# Métricas do caminho quente, compartilhadas pelos módulos do gateway.
+STAGE_LATENCY = registry.histogram("gateway_stage_latency_seconds", "Latência de cada etapa do processamento de mensagens.", ("stage",))
+POLICY_LOOKUP_LATENCY = registry.histogram("gateway_policy_lookup_seconds", "Latência da busca de políticas por origem.", ("source",))
+MESSAGES_IN = registry.counter("gateway_messages_in_total", "Mensagens de dispositivos recebidas por estratégia.", ("strategy",))
+MESSAGES_OUT = registry.counter("gateway_messages_out_total", "Mensagens publicadas por estratégia.", ("strategy",))
+SCHEDULER_LAG = registry.histogram("gateway_scheduler_lag_seconds", "Atraso entre o horário previsto e o real de cada tarefa de agregação.")
+REVOCATION_LATENCY = registry.histogram(
+    "gateway_revocation_latency_seconds", "Tempo entre a revogação no MGC e sua aplicação no gateway, por escopo.", ("scope",),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+REVOKED_PAIRS = registry.counter("gateway_revoked_pairs_total", "Pares dispositivo/titular invalidados por notificações do MGC, por escopo.", ("scope",))
+SHED_MESSAGES = registry.counter("gateway_shed_total", "Mensagens descartadas pelas filas de ingestão sob sobrecarga, por prioridade.", ("priority",))
+THROTTLED = registry.counter(
+    "gateway_throttled_total", "Mensagens recusadas por limite de taxa (device, titular).", ("scope",),
+)
+FAILED_CLOSED = registry.counter("gateway_failed_closed_total", "Mensagens descartadas (nunca encaminhadas) por erro na estratégia, por estratégia.", ("strategy",))
+LATE_POINTS = registry.counter("gateway_late_points_total", "Pontos descartados por chegarem depois do fechamento da janela, por estratégia.", ("strategy",))
+PIPELINE_STEP_LATENCY = registry.histogram(
+    "gateway_pipeline_step_seconds", "Latência por mensagem de cada etapa dos pipelines de tratamento (amostrada).", ("pipeline", "step"),
+)
+STORAGE_DECODE_ERRORS = registry.counter(
+    "gateway_storage_decode_errors_total", "Valores do backend de estado ilegíveis (ex: codec não instalado), tratados como ausentes, por tipo.", ("kind",),
+)
+PUBLISH_FAILED = registry.counter("gateway_publish_failed_total", "Resultados não entregues ao broker pelo publicador, por motivo.", ("reason",))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> Optional[ThreadingHTTPServer]:
+    """ Expõe /metrics (formato Prometheus) em uma thread de fundo. Porta 0 desativa o endpoint. """
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Endpoint de métricas disponível em http://%s:%s/metrics", host, port)
+    return server
+
+
+def debug_sampled(log: logging.Logger, msg: str, *args):
+    """
+    Log de depuração por mensagem: não custa nada (nem formatação) quando o nível DEBUG
+    está desligado e, quando ligado, registra apenas uma amostra (LOG_SAMPLE_RATE).
+    """
+    if log.isEnabledFor(logging.DEBUG) and (LOG_SAMPLE_RATE >= 1.0 or random.random() < LOG_SAMPLE_RATE):
+        log.debug(msg, *args)
@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Tuple
+import paho.mqtt.client as mqtt
+from core.config import settings
+# Taxa sustentada (mensagens/s) e rajada máxima por dispositivo e por titular; 0 desativa o limite.
+RATE_LIMIT_DEVICE = settings.rate_limit_device
+RATE_LIMIT_DEVICE_BURST = settings.rate_limit_device_burst or 2 * RATE_LIMIT_DEVICE
+RATE_LIMIT_TITULAR = settings.rate_limit_titular
+RATE_LIMIT_TITULAR_BURST = settings.rate_limit_titular_burst or 2 * RATE_LIMIT_TITULAR
+# Número máximo de buckets mantidos em memória (os menos usados são descartados).
+RATE_LIMIT_MAX_KEYS = settings.rate_limit_max_keys
+# Prioridade das mensagens por tópico ("filtro=prioridade,...", com baixa, normal ou alta).
+INGESTION_PRIORITY_RULES = settings.ingestion_priority_rules
+# Ocupação da fila (fração da capacidade) a partir da qual mensagens de cada prioridade são
+# descartadas; mensagens de prioridade alta só são descartadas com a fila cheia.
+INGESTION_SHED_LOW_WATERMARK = settings.ingestion_shed_low_watermark
+INGESTION_SHED_NORMAL_WATERMARK = settings.ingestion_shed_normal_watermark
+
+PRIORITY_LOW = 0
+PRIORITY_NORMAL = 1
+PRIORITY_HIGH = 2
+PRIORITY_NAMES = {"baixa": PRIORITY_LOW, "normal": PRIORITY_NORMAL, "alta": PRIORITY_HIGH}
+PRIORITY_LABELS = {level: name for name, level in PRIORITY_NAMES.items()}
+SHED_WATERMARKS = {
+    PRIORITY_LOW: INGESTION_SHED_LOW_WATERMARK,
+    PRIORITY_NORMAL: INGESTION_SHED_NORMAL_WATERMARK,
+    PRIORITY_HIGH: 1.0,
+}
+
+
+class TokenBuckets:
+    """
+    Conjunto de token buckets (taxa sustentada + rajada) indexados por chave, com no máximo
+    `max_keys` buckets em memória (LRU). Um bucket descartado volta cheio, o que só
+    favorece chaves pouco ativas.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def acquire(self, key: Hashable, now: float) -> bool:
+        """ Consome um token do bucket da chave; False se o bucket estiver vazio. """
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] < 1.0:
+                return False
+            bucket[0] -= 1.0
+            return True
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RateLimiter:
+    """ Limita a taxa de mensagens por dispositivo e por titular. """
+
+    def __init__(
+        self,
+        device_rate: float = RATE_LIMIT_DEVICE,
+        device_burst: float = RATE_LIMIT_DEVICE_BURST,
+        titular_rate: float = RATE_LIMIT_TITULAR,
+        titular_burst: float = RATE_LIMIT_TITULAR_BURST,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            clock: Relógio monotônico (segundos) usado para reabastecer os buckets.
+        """
+        self.clock = clock
+        self.devices = TokenBuckets(device_rate, device_burst)
+        self.titulars = TokenBuckets(titular_rate, titular_burst)
+        self._lock = threading.Lock()
+        self._stats = {"throttled_device": 0, "throttled_titular": 0}
+
+    def admit(self, dispositivo_id: str, titular_id: str) -> str:
+        """
+        Verifica se a mensagem cabe nos limites do dispositivo e do titular. O bucket do
+        titular só é consumido por mensagens aceitas pelo do dispositivo.
+        Returns:
+            - "" se a mensagem foi aceita, ou o escopo que a limitou ("device" ou "titular").
+        """
+        now = self.clock()
+        if self.devices.enabled and not self.devices.acquire(dispositivo_id, now):
+            scope = "device"
+        elif self.titulars.enabled and not self.titulars.acquire(titular_id, now):
+            scope = "titular"
+        else:
+            return ""
+        with self._lock:
+            self._stats[f"throttled_{scope}"] += 1
+        return scope
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["device_buckets"] = len(self.devices)
+        stats["titular_buckets"] = len(self.titulars)
+        return stats
+
+
+class PrioritySelector:
+    """ Atribui a prioridade de descarte de cada mensagem pelo tópico. """
+
+    def __init__(self, rules: str = INGESTION_PRIORITY_RULES, default: int = PRIORITY_NORMAL):
+        """
+        Args:
+            rules: Regras "filtro=prioridade" separadas por vírgula (ex: "dispositivos/+/alarme=alta"),
+                avaliadas em ordem, com a sintaxe de filtros de tópico do MQTT.
+        """
+        self.default = default
+        self.rules: List[Tuple[str, int]] = []
+        for rule in filter(None, (r.strip() for r in rules.split(","))):
+            topic_filter, name = rule.rsplit("=", 1)
+            self.rules.append((topic_filter.strip(), PRIORITY_NAMES[name.strip().lower()]))
+        self._by_topic: Dict[str, int] = {}
+
+    def select(self, topic: str) -> int:
+        if not self.rules:
+            return self.default
+        priority = self._by_topic.get(topic)
+        if priority is None:
+            priority = next((p for f, p in self.rules if mqtt.topic_matches_sub(f, topic)), self.default)
+            if len(self._by_topic) < 100000:
+                self._by_topic[topic] = priority
+        return priority
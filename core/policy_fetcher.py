@@ -0,0 +1,102 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from core.config import settings
+MGC_POOL_SIZE = settings.mgc_pool_size
+# Mensagens de um par mantidas em espera enquanto a sua política é buscada no MGC.
+POLICY_FETCH_MAX_PENDING = settings.policy_fetch_max_pending
+
+logger = logging.getLogger(__name__)
+
+Pair = Tuple[str, str]
+# (dispositivo_id, titular_id, dados)
+Decoded = Tuple[str, str, Dict[str, Any]]
+
+
+class PolicyFetcher:
+    """
+    Busca no MGC, fora dos workers de ingestão, as políticas que faltam no cache: uma busca
+    lenta (ou o MGC fora do ar) não trava os outros dispositivos do mesmo worker. As mensagens
+    do par aguardam a resposta e são entregues ao handler na ordem de chegada; as que chegam
+    durante a busca também aguardam, o que preserva a ordem das mensagens de cada par.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str, str], Optional[Dict[str, Any]]],
+        handler: Callable[[List[Decoded], Optional[Dict[str, Any]]], None],
+        num_workers: int = MGC_POOL_SIZE,
+        max_pending: int = POLICY_FETCH_MAX_PENDING,
+    ):
+        """
+        Args:
+            fetch: Função que busca a política de um par (dispositivo_id, titular_id); None se não houver.
+            handler: Função que processa as mensagens em espera de um par com a política obtida.
+            num_workers: Número máximo de buscas simultâneas (uma por par).
+            max_pending: Mensagens em espera por par; as excedentes são descartadas.
+        """
+        self.fetch = fetch
+        self.handler = handler
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(num_workers, thread_name_prefix="policy-fetch")
+        self._pending: Dict[Pair, List[Decoded]] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "fetches": 0,
+            "deferred": 0,
+            "dropped": 0,
+        }
+
+    def defer(self, message: Decoded, fetch: bool) -> bool:
+        """
+        Coloca a mensagem em espera se o seu par já aguarda uma busca ou, com `fetch`, inicia a busca.
+        Returns:
+            - False se a mensagem não precisa esperar e pode ser processada no lote atual.
+        """
+        pair = (message[0], message[1])
+        with self._lock:
+            pending = self._pending.get(pair)
+            if pending is None:
+                if not fetch:
+                    return False
+                pending = self._pending[pair] = []
+                self._stats["fetches"] += 1
+                self._executor.submit(self._run, pair)
+            if len(pending) >= self.max_pending:
+                self._stats["dropped"] += 1
+                return True
+            pending.append(message)
+            self._stats["deferred"] += 1
+        return True
+
+    def stop(self):
+        """ Aguarda as buscas em andamento e a entrega das mensagens em espera. """
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, int]:
+        """ Retorna as buscas iniciadas e as mensagens em espera, adiadas e descartadas. """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = sum(len(messages) for messages in self._pending.values())
+            stats["pending_pairs"] = len(self._pending)
+        return stats
+
+    def _run(self, pair: Pair):
+        try:
+            politica = self.fetch(*pair)
+        except Exception as e:
+            logger.exception("Erro ao buscar a política do dispositivo %s: %s", pair[0], e)
+            politica = None
+        # Entrega as mensagens em lotes até esvaziar a espera; só então o par volta ao fluxo normal.
+        while True:
+            with self._lock:
+                messages = self._pending[pair]
+                if not messages:
+                    del self._pending[pair]
+                    return
+                self._pending[pair] = []
+            try:
+                self.handler(messages, politica)
+            except Exception as e:
+                logger.exception("Erro ao processar %d mensagens em espera do dispositivo %s: %s", len(messages), pair[0], e)
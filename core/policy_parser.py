@@ -19,18 +19,28 @@ def parse_policy_key(policy_key: str) -> Dict[str, Any]:
     if len(parts) >= 2:
         default["params"] = _parser_params(parts[1])
     if len(parts) >= 3:
-        default["window"] = int(parts[2])
+        default["window"] = _parse_optional_segment(parts[2])
     if len(parts) >= 4:
-        default["interval"] = int(parts[3])
+        default["interval"] = _parse_optional_segment(parts[3])
     return default
 
 
+def _parse_optional_segment(segment: str) -> Any:
+    """ Segmentos vazios ou "none" são tratados como ausentes. """
+    segment = segment.strip()
+    if not segment or segment.lower() == "none":
+        return None
+    return segment
+
+
 def _parser_params(params_str: str) -> Dict[str, Any]:
     """ 
     Converte uma string de parâmetros em um dicionário.
     Exemplo: "sigma=0.1,threshold=0.5" -> {"sigma": 0.1, "threshold": 0.5}
     """
     params = {}
+    if _parse_optional_segment(params_str) is None:
+        return params
     for item in params_str.split(","):
         key, value = item.split("=")
         try:
@@ -41,14 +51,15 @@ def _parser_params(params_str: str) -> Dict[str, Any]:
     return params
 
 def parse_time_string(time_str: str) -> int:
+    """ Converte uma duração no formato "10S", "10M" ou "1H" (ou apenas segundos, "600") em segundos. """
     if not isinstance(time_str, str):
         return None
-    match = re.match(r'(\d+)([SMH])$', time_str.upper())
+    match = re.match(r'(\d+)([SMH]?)$', time_str.strip().upper())
     if not match:
         return None
     value = int(match.group(1))
     unit = match.group(2)
-    if unit == "S":
+    if unit in ("S", ""):
         return value
     elif unit == "M":
         return value * 60
@@ -0,0 +1,171 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from core.config import settings
+from core.policy_parser import parse_policy_key, parse_time_string
+from core.windowing import WINDOW_MAX_PANES, WindowSpec
+# Import do módulo (e não dos nomes) para tolerar o ciclo treatments -> core.cache_manager -> core.
+from treatments import factory
+POLICY_PLAN_CACHE_SIZE = settings.policy_plan_cache_size
+
+# Separador das etapas de um pipeline de tratamentos (ex: DENY:campos=senha|ROUND:casas=1|AVG:none:10M:10M).
+PIPELINE_SEPARATOR = "|"
+
+
+class PolicyPlan:
+    """
+    Versão "compilada" de uma chave_politica: ação, parâmetros tipados, janela e
+    intervalo em segundos e a instância da estratégia de tratamento. Chaves com várias
+    etapas (separadas por "|") viram um TreatmentPipeline, com a agregação no fim e a ação
+    formada pelas etapas na ordem de execução (ex: "DENY|ROUND|AVG"). Planos acumulados
+    também carregam a janela de agregação (`window_spec`): sem JANELA, uma janela tumbling
+    do tamanho do intervalo; com JANELA, uma janela desse tamanho que avança a cada INTERVALO.
+    Chaves malformadas geram um plano rejeitado, com o motivo em `error`.
+    """
+
+    __slots__ = ("chave_politica", "action", "params", "window", "interval", "strategy", "accumulated", "window_spec", "error")
+
+    def __init__(
+        self,
+        chave_politica: Optional[str],
+        action: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None,
+        window: Optional[int] = None,
+        interval: Optional[int] = None,
+        strategy: Any = None,
+        accumulated: bool = False,
+        window_spec: Optional[WindowSpec] = None,
+        error: Optional[str] = None,
+    ):
+        self.chave_politica = chave_politica
+        self.action = action
+        self.params = params or {}
+        self.window = window
+        self.interval = interval
+        self.strategy = strategy
+        self.accumulated = accumulated
+        self.window_spec = window_spec
+        self.error = error
+
+    @property
+    def rejected(self) -> bool:
+        return self.error is not None
+
+    def __repr__(self) -> str:
+        if self.rejected:
+            return f"PolicyPlan({self.chave_politica!r}, error={self.error!r})"
+        return f"PolicyPlan({self.chave_politica!r}, action={self.action!r}, window={self.window}, interval={self.interval})"
+
+
+def compile_policy_plan(chave_politica: Optional[str]) -> PolicyPlan:
+    """ Analisa a chave_politica uma única vez e monta o plano correspondente. """
+    if not chave_politica:
+        return PolicyPlan(chave_politica, error="Dados do dispositivo não contêm chave_politica.")
+    steps = []
+    for segment in chave_politica.split(PIPELINE_SEPARATOR):
+        try:
+            parsed_policy = parse_policy_key(segment.strip())
+        except ValueError:
+            return PolicyPlan(chave_politica, error=f"chave_politica malformada: '{chave_politica}'.")
+        if not parsed_policy["action"]:
+            return PolicyPlan(chave_politica, error="Dados do dispositivo não contêm ação de tratamento.")
+        parsed_policy["action"] = parsed_policy["action"].strip().upper()
+        steps.append(parsed_policy)
+
+    # Janela e intervalo vêm da etapa de agregação (sem ela, da última etapa).
+    timing = next((step for step in steps if factory.is_accumulated_strategy(step["action"])), steps[-1])
+    if len(steps) == 1 and not factory.is_field_strategy(timing["action"]):
+        action = timing["action"]
+        params = timing["params"]
+        strategy = factory.get_treatment_strategy(action)
+        if not strategy:
+            return PolicyPlan(chave_politica, error=f"Estratégia de tratamento não encontrada para a chave_politica '{chave_politica}'.")
+    else:
+        try:
+            strategy = factory.compile_pipeline([(step["action"], step["params"]) for step in steps])
+        except ValueError as e:
+            return PolicyPlan(chave_politica, error=f"Pipeline inválido na chave_politica '{chave_politica}': {e}")
+        # Os parâmetros de cada etapa já foram compilados no pipeline.
+        action = strategy.name
+        params = {}
+
+    if any(step is not timing and (step["window"] is not None or step["interval"] is not None) for step in steps):
+        return PolicyPlan(chave_politica, error=f"Somente a etapa de agregação pode ter janela e intervalo na chave_politica '{chave_politica}'.")
+
+    window = None
+    if timing["window"] is not None:
+        window = parse_time_string(timing["window"])
+        if not window:
+            return PolicyPlan(chave_politica, error=f"Janela inválida na chave_politica '{chave_politica}'.")
+    interval = None
+    if timing["interval"] is not None:
+        interval = parse_time_string(timing["interval"])
+        if not interval:
+            return PolicyPlan(chave_politica, error=f"Intervalo de agregação inválido na chave_politica '{chave_politica}'.")
+
+    accumulated = factory.is_accumulated_strategy(timing["action"])
+    if accumulated and not interval:
+        return PolicyPlan(chave_politica, error=f"chave_politica '{chave_politica}' não contém intervalo de agregação.")
+    window_spec = None
+    if accumulated:
+        window_spec = WindowSpec(window or interval, interval)
+        if window_spec.panes > WINDOW_MAX_PANES:
+            return PolicyPlan(chave_politica, error=f"Janela da chave_politica '{chave_politica}' exige {window_spec.panes} panes (máximo: {WINDOW_MAX_PANES}).")
+    return PolicyPlan(
+        chave_politica,
+        action=action,
+        params=params,
+        window=window,
+        interval=interval,
+        strategy=strategy,
+        accumulated=accumulated,
+        window_spec=window_spec,
+    )
+
+
+class PolicyPlanCache:
+    """ Cache LRU limitado de planos compilados, indexado pela chave_politica. """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._plans: "OrderedDict[Optional[str], PolicyPlan]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, chave_politica: Optional[str]) -> PolicyPlan:
+        with self._lock:
+            plan = self._plans.get(chave_politica)
+            if plan is not None:
+                self._plans.move_to_end(chave_politica)
+                self.hits += 1
+                return plan
+            self.misses += 1
+        # A compilação acontece fora do lock; compilações concorrentes da mesma chave são idempotentes.
+        plan = compile_policy_plan(chave_politica)
+        with self._lock:
+            self._plans[chave_politica] = plan
+            while len(self._plans) > self.max_size:
+                self._plans.popitem(last=False)
+                self.evictions += 1
+        return plan
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._plans),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Singleton compartilhado pelo gateway e pelo scheduler
+policy_plans = PolicyPlanCache(POLICY_PLAN_CACHE_SIZE)
+
+
+def get_policy_plan(policy: Dict[str, Any]) -> PolicyPlan:
+    """ Retorna o plano compilado para a política (consentimento) retornada pelo MGC. """
+    chave_politica = policy.get("opcao_tratamento", {}).get("chave_politica")
+    return policy_plans.get(chave_politica)
@@ -0,0 +1,299 @@
+import collections
+import logging
+import queue
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import paho.mqtt.client as mqtt
+from core.codecs import CodecError, output_codec
+from core.config import settings
+from core.metrics import PUBLISH_FAILED
+PUBLISHER_QUEUE_SIZE = settings.publisher_queue_size
+PUBLISHER_BATCH_SIZE = settings.publisher_batch_size
+PUBLISHER_LINGER = settings.publisher_linger_ms / 1000
+# Tempo máximo (ms) que quem publica fica bloqueado com a fila cheia (backpressure); depois
+# disso, o resultado vai direto para o buffer local.
+PUBLISHER_ENQUEUE_TIMEOUT = settings.publisher_enqueue_timeout_ms / 1000
+# Agrupamento dos resultados de um ciclo em envelopes: "" (desativado), "topic" (por tópico
+# de dispositivo) ou "titular" (por titular, no tópico <TOPICO_DADOS_PROCESSADOS>/titulares/<id>).
+PUBLISHER_COALESCE = settings.publisher_coalesce.lower()
+PUBLISHER_MAX_ENVELOPE = settings.publisher_max_envelope
+# QoS padrão e por estratégia ("AVG=1,P95=2,...").
+PUBLISHER_QOS = settings.publisher_qos
+PUBLISHER_QOS_RULES = settings.publisher_qos_rules
+# Publicações com QoS > 0 ainda sem confirmação do broker a partir das quais as novas
+# aguardam no buffer local, em vez de crescer a fila interna do paho.
+PUBLISHER_MAX_INFLIGHT = settings.publisher_max_inflight
+# Capacidade do buffer local (mensagens); acima dela, as mais antigas são descartadas.
+PUBLISHER_SPILL_SIZE = settings.publisher_spill_size
+# Resultados que ainda não passaram pela thread do publicador (fila cheia após o timeout);
+# acima disso, os novos são descartados.
+PUBLISHER_OVERFLOW_SIZE = settings.publisher_overflow_size
+PUBLISHER_MAX_RETRIES = settings.publisher_max_retries
+PUBLISHER_RETRY_INTERVAL = settings.publisher_retry_interval_ms / 1000
+SEND_DATA_TOPIC = settings.topico_dados_processados
+
+logger = logging.getLogger(__name__)
+
+# (tópico, resultado, QoS, titular)
+Result = Tuple[str, Dict[str, Any], int, Optional[str]]
+
+
+class _Outgoing:
+    """ Mensagem já codificada aguardando publicação (ou nova tentativa). """
+
+    __slots__ = ("topic", "payload", "qos", "count", "attempts")
+
+    def __init__(self, topic: str, payload: bytes, qos: int, count: int):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        # Resultados contidos na mensagem (mais de um em envelopes).
+        self.count = count
+        self.attempts = 0
+
+
+class OutboundPublisher:
+    """
+    Publica os resultados do gateway (encaminhamentos e agregados) a partir de uma única
+    thread, com fila própria, em vez de cada worker chamar o cliente MQTT diretamente.
+    A cada ciclo, os resultados da fila podem ser agrupados em envelopes
+    ({"mensagens": [...]}) por tópico ou por titular, com o QoS configurado por estratégia.
+    As publicações com QoS > 0 são acompanhadas pelo MQTTMessageInfo do paho até a
+    confirmação do broker. Com o broker lento ou desconectado, as mensagens aguardam em um
+    buffer local e são reenviadas em ordem; com a fila cheia, quem publica fica bloqueado
+    (backpressure sobre a ingestão e o scheduler).
+    """
+
+    def __init__(
+        self,
+        client: Optional[mqtt.Client],
+        queue_size: int = PUBLISHER_QUEUE_SIZE,
+        batch_size: int = PUBLISHER_BATCH_SIZE,
+        linger: float = PUBLISHER_LINGER,
+        coalesce: str = PUBLISHER_COALESCE,
+        default_qos: int = PUBLISHER_QOS,
+        qos_rules: str = PUBLISHER_QOS_RULES,
+    ):
+        if coalesce not in ("", "topic", "titular"):
+            raise ValueError(f"PUBLISHER_COALESCE inválido: {coalesce}")
+        self.client = client
+        self.batch_size = batch_size
+        self.linger = linger
+        self.coalesce = coalesce
+        self.default_qos = default_qos
+        self.qos_by_strategy: Dict[str, int] = {}
+        for rule in filter(None, (r.strip() for r in qos_rules.split(","))):
+            strategy, qos = rule.split("=", 1)
+            self.qos_by_strategy[strategy.strip().upper()] = int(qos)
+        self._queue: "queue.Queue[Result]" = queue.Queue(maxsize=queue_size)
+        # Buffer local: mensagens à espera do broker, publicadas sempre em ordem. Só a thread
+        # do publicador o altera; quem publica e encontra a fila cheia usa _overflow.
+        self._pending: Deque[_Outgoing] = collections.deque()
+        self._overflow: Deque[Result] = collections.deque()
+        # Mensagens no fim de _pending ainda não contabilizadas como "spilled".
+        self._uncounted = 0
+        self._inflight: List[Tuple[Any, _Outgoing]] = []
+        self._thread = threading.Thread(target=self._run, name="publisher", daemon=True)
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "blocked": 0,
+            "published": 0,
+            "envelopes": 0,
+            "delivered": 0,
+            "spilled": 0,
+            "retries": 0,
+            "failed": 0,
+            "dropped": 0,
+        }
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """ Publica o que ainda está na fila e aguarda as confirmações pendentes (até timeout). """
+        self._stop_event.set()
+        self._thread.join(timeout)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """ Aguarda (até timeout) a fila e o buffer local esvaziarem; retorna se esvaziaram. """
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks or self._overflow or self._pending:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def qos_for(self, strategy: Optional[str]) -> int:
+        return self.qos_by_strategy.get((strategy or "").upper(), self.default_qos)
+
+    def publish(self, topic: str, result: Dict[str, Any], strategy: Optional[str] = None):
+        """
+        Enfileira um resultado para publicação. Com a fila cheia, bloqueia por até
+        PUBLISHER_ENQUEUE_TIMEOUT e então o coloca no buffer local; se ele também já tiver
+        PUBLISHER_OVERFLOW_SIZE resultados, o resultado é descartado.
+        """
+        item = (topic, result, self.qos_for(strategy), result.get("titular_id"))
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._stats["blocked"] += 1
+            try:
+                self._queue.put(item, timeout=PUBLISHER_ENQUEUE_TIMEOUT)
+            except queue.Full:
+                if len(self._overflow) < PUBLISHER_OVERFLOW_SIZE:
+                    self._overflow.append(item)
+                else:
+                    self._fail([_Outgoing(topic, b"", item[2], 1)], "overflow")
+        with self._lock:
+            self._stats["submitted"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize() + len(self._overflow)
+        stats["pending"] = len(self._pending)
+        stats["inflight"] = len(self._inflight)
+        return stats
+
+    def _run(self):
+        while True:
+            stopping = self._stop_event.is_set()
+            items = self._drain(0 if stopping else (PUBLISHER_RETRY_INTERVAL if self._pending else 0.5))
+            drained = len(items)
+            overflow = len(self._overflow)
+            items.extend(self._overflow[i] for i in range(overflow))
+            self._reap()
+            if items:
+                self._spill(self._encode(items))
+            # Só retira os itens da fila (e do _overflow) depois de estarem no buffer local, para flush().
+            for _ in range(overflow):
+                self._overflow.popleft()
+            for _ in range(drained):
+                self._queue.task_done()
+            self._flush()
+            if stopping and not items and not self._queue.qsize() and not self._overflow:
+                break
+        # Aguarda (por pouco tempo) as confirmações e o esvaziamento do buffer local.
+        deadline = time.monotonic() + 2.0
+        while (self._inflight or self._pending) and time.monotonic() < deadline:
+            time.sleep(0.05)
+            self._reap()
+            self._flush()
+        if self._pending or self._inflight:
+            logger.warning(
+                "Publicador encerrado com %d mensagens no buffer local e %d sem confirmação.",
+                len(self._pending), len(self._inflight),
+            )
+
+    def _drain(self, timeout: float) -> List[Result]:
+        """ Retira da fila um ciclo de resultados (até batch_size), esperando até timeout pelo primeiro. """
+        try:
+            items = [self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait()]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.linger
+        while len(items) < self.batch_size:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        return items
+
+    def _encode(self, items: List[Result]) -> List[_Outgoing]:
+        """ Codifica os resultados, agrupando-os em envelopes se PUBLISHER_COALESCE estiver ativo. """
+        if not self.coalesce:
+            return [o for o in (self._encode_one(topic, result, qos, 1) for topic, result, qos, _ in items) if o]
+        groups: Dict[str, List[Result]] = {}
+        for item in items:
+            topic, _, _, titular_id = item
+            key = f"{SEND_DATA_TOPIC}/titulares/{titular_id}" if self.coalesce == "titular" and titular_id else topic
+            groups.setdefault(key, []).append(item)
+        outgoing = []
+        for topic, group in groups.items():
+            for i in range(0, len(group), PUBLISHER_MAX_ENVELOPE):
+                chunk = group[i:i + PUBLISHER_MAX_ENVELOPE]
+                # O envelope usa o maior QoS entre os resultados que carrega.
+                envelope = self._encode_one(topic, {"mensagens": [r for _, r, _, _ in chunk]}, max(q for _, _, q, _ in chunk), len(chunk))
+                if envelope:
+                    outgoing.append(envelope)
+        with self._lock:
+            self._stats["envelopes"] += len(outgoing)
+        return outgoing
+
+    def _encode_one(self, topic: str, body: Dict[str, Any], qos: int, count: int) -> Optional[_Outgoing]:
+        try:
+            return _Outgoing(topic, output_codec.encode(body), qos, count)
+        except CodecError as e:
+            self._fail([_Outgoing(topic, b"", qos, count)], "encode")
+            logger.warning("Resultado não codificável descartado (tópico %s): %s", topic, e)
+            return None
+
+    def _spill(self, outgoing: List[_Outgoing]):
+        """ Coloca as mensagens no buffer local; acima de PUBLISHER_SPILL_SIZE, descarta as mais antigas. """
+        self._pending.extend(outgoing)
+        self._uncounted += len(outgoing)
+        overflow = len(self._pending) - PUBLISHER_SPILL_SIZE
+        dropped = [self._pending.popleft() for _ in range(max(overflow, 0))]
+        if dropped:
+            self._fail(dropped, "spill_full")
+
+    def _flush(self):
+        """ Publica o buffer local em ordem enquanto o broker estiver conectado e sem excesso de mensagens em voo. """
+        if not self._pending:
+            self._uncounted = 0
+            return
+        connected = self.client is not None and self.client.is_connected()
+        published = 0
+        while self._pending and connected and len(self._inflight) < PUBLISHER_MAX_INFLIGHT:
+            message = self._pending[0]
+            info = self.client.publish(message.topic, message.payload, qos=message.qos)
+            if info.rc == mqtt.MQTT_ERR_SUCCESS or (info.rc == mqtt.MQTT_ERR_NO_CONN and message.qos > 0):
+                # Com QoS > 0, o paho guarda a mensagem e a reenvia ao reconectar.
+                self._pending.popleft()
+                published += 1
+                if message.qos > 0:
+                    self._inflight.append((info, message))
+                continue
+            if info.rc == mqtt.MQTT_ERR_NO_CONN:
+                break
+            # Fila interna do paho cheia (ou outro erro): nova tentativa no próximo ciclo.
+            message.attempts += 1
+            with self._lock:
+                self._stats["retries"] += 1
+            if message.attempts > PUBLISHER_MAX_RETRIES:
+                self._pending.popleft()
+                self._fail([message], "retries")
+                continue
+            break
+        # As mensagens que sobraram aguardam o broker no buffer local.
+        spilled = min(self._uncounted, len(self._pending))
+        self._uncounted = 0
+        with self._lock:
+            self._stats["published"] += published
+            self._stats["spilled"] += spilled
+
+    def _reap(self):
+        """ Retira da lista de mensagens em voo as já confirmadas pelo broker. """
+        if not self._inflight:
+            return
+        remaining = [(info, message) for info, message in self._inflight if not info.is_published()]
+        delivered = len(self._inflight) - len(remaining)
+        self._inflight = remaining
+        with self._lock:
+            self._stats["delivered"] += delivered
+
+    def _fail(self, messages: List[_Outgoing], reason: str):
+        count = sum(m.count for m in messages)
+        PUBLISH_FAILED.labels(reason).inc(count)
+        with self._lock:
+            self._stats["failed" if reason not in ("spill_full", "overflow") else "dropped"] += count
@@ -0,0 +1,397 @@
+import itertools
+import logging
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import paho.mqtt.client as mqtt
+from apis import MGCAPI
+from core.cache_manager import cache_manager
+from core.codecs import CodecError, get_codec, output_codec
+from core.config import settings
+from core.policy_plan import PolicyPlan, get_policy_plan
+from core.windowing import WindowSpec, parse_timestamp
+from treatments.pipeline import TreatmentPipeline
+from treatments.running_summary import RunningSummary, sketch_bucket_codes, sketch_bucket_name
+# Registros lidos e processados de cada vez; limita a memória usada pelo replay.
+REPLAY_CHUNK_SIZE = settings.replay_chunk_size
+SEND_DATA_TOPIC = settings.topico_dados_processados
+
+# Dependência opcional: sem ela, apenas arquivos JSONL podem ser reprocessados.
+try:
+    import pyarrow.parquet as parquet
+except ImportError:
+    parquet = None
+
+logger = logging.getLogger(__name__)
+
+Pair = Tuple[str, str]
+Consentimentos = Dict[str, Dict[str, Dict[str, Any]]]
+
+
+def read_records(path: str, chunk_size: int = REPLAY_CHUNK_SIZE) -> Iterator[Tuple[List[Dict[str, Any]], int]]:
+    """
+    Lê um arquivo de mensagens gravadas (JSONL, um payload por linha, ou Parquet, uma
+    coluna por campo) em blocos de até chunk_size registros.
+    Returns:
+        - Um iterador de (registros do bloco, linhas ilegíveis descartadas).
+    """
+    if path.endswith(".parquet"):
+        if parquet is None:
+            raise RuntimeError("A leitura de arquivos Parquet requer o pacote pyarrow.")
+        for batch in parquet.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist(), 0
+        return
+    codec = get_codec("json")
+    with open(path, "rb") as f:
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                return
+            records, invalid = [], 0
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    record = codec.decode(line)
+                except CodecError:
+                    invalid += 1
+                    continue
+                if isinstance(record, dict):
+                    records.append(record)
+                else:
+                    invalid += 1
+            yield records, invalid
+
+
+class PolicyResolver:
+    """
+    Resolve a política de cada par (dispositivo, titular) uma única vez por replay: a partir
+    de um snapshot de consentimentos, ou do cache do gateway e, na falta, do MGC (uma
+    requisição por titular). O cache e a fila de agregação do gateway não são alterados.
+    """
+
+    def __init__(self, consentimentos: Optional[Consentimentos] = None, mgc: Optional[MGCAPI] = None):
+        self.consentimentos = consentimentos
+        self.mgc = mgc
+        self._policies: Dict[Pair, Optional[Dict[str, Any]]] = {}
+
+    def resolve(self, pairs: List[Pair]) -> Dict[Pair, Optional[Dict[str, Any]]]:
+        missing = [pair for pair in dict.fromkeys(pairs) if pair not in self._policies]
+        if not missing:
+            return self._policies
+        if self.consentimentos is not None:
+            for dispositivo_id, titular_id in missing:
+                self._policies[(dispositivo_id, titular_id)] = self.consentimentos.get(titular_id, {}).get(dispositivo_id)
+            return self._policies
+        found = cache_manager.get_policies(missing)
+        unresolved: Dict[str, List[str]] = {}
+        for pair in missing:
+            if found.get(pair):
+                self._policies[pair] = found[pair]
+            else:
+                unresolved.setdefault(pair[1], []).append(pair[0])
+        for titular_id, dispositivos in unresolved.items():
+            consentimentos = (self.mgc.get_consentimentos_titular(titular_id) if self.mgc else None) or {}
+            for dispositivo_id in dispositivos:
+                self._policies[(dispositivo_id, titular_id)] = consentimentos.get(str(dispositivo_id))
+        return self._policies
+
+
+class _PairWindows:
+    """ Panes ainda abertos de um par e o fim da próxima janela a emitir. """
+
+    __slots__ = ("panes", "next_end")
+
+    def __init__(self):
+        self.panes: Dict[int, RunningSummary] = {}
+        self.next_end = 0
+
+
+class WindowAccumulator:
+    """
+    Agrega, fora do Redis, os pontos de um plano acumulado com as mesmas janelas do gateway.
+    Os resumos de cada pane são calculados de uma vez para o bloco inteiro (NumPy, com
+    `reduceat` sobre os pontos ordenados por par e pane) e as janelas são emitidas pelo
+    relógio dos próprios dados: quando o horário mais recente do arquivo passa do fim da
+    janela mais WINDOW_ALLOWED_LATENESS. Pontos que chegam depois disso são descartados.
+    """
+
+    def __init__(self, plan: PolicyPlan):
+        self.plan = plan
+        self.spec: WindowSpec = plan.window_spec
+        self.with_sketch = getattr(plan.strategy, "uses_sketch", False)
+        self._codes: Dict[Pair, int] = {}
+        self._pairs: List[Pair] = []
+        self._windows: List[_PairWindows] = []
+
+    def add(self, pairs: List[Pair], times: np.ndarray, values: np.ndarray) -> int:
+        """
+        Incorpora os pontos do bloco aos panes abertos.
+        Returns:
+            - O número de pontos descartados por atraso.
+        """
+        spec = self.spec
+        codes = np.fromiter((self._code(pair) for pair in pairs), dtype=np.int64, count=len(pairs))
+        next_ends = np.fromiter((w.next_end for w in self._windows), dtype=np.int64, count=len(self._windows))
+        panes = (times // spec.pane).astype(np.int64)
+        last_ends = (panes * spec.pane + spec.size) // spec.slide * spec.slide
+        accepted = (last_ends >= (panes + 1) * spec.pane) & (last_ends >= next_ends[codes])
+        late = len(codes) - int(np.count_nonzero(accepted))
+        codes, panes, values = codes[accepted], panes[accepted], values[accepted]
+        if not len(codes):
+            return late
+
+        order = np.lexsort((panes, codes))
+        codes, panes, values = codes[order], panes[order], values[order]
+        starts = np.flatnonzero(np.concatenate(([True], (codes[1:] != codes[:-1]) | (panes[1:] != panes[:-1]))))
+        counts = np.diff(np.append(starts, len(codes)))
+        sums = np.add.reduceat(values, starts)
+        means = sums / counts
+        deviations = values - np.repeat(means, counts)
+        m2s = np.add.reduceat(deviations * deviations, starts)
+        minimums = np.minimum.reduceat(values, starts)
+        maximums = np.maximum.reduceat(values, starts)
+        buckets = sketch_bucket_codes(values) if self.with_sketch else None
+
+        ends = np.append(starts[1:], len(codes)).tolist()
+        for i, (start, end) in enumerate(zip(starts.tolist(), ends)):
+            summary = RunningSummary(int(counts[i]), float(sums[i]), float(minimums[i]), float(maximums[i]), float(means[i]), float(m2s[i]))
+            if buckets is not None:
+                names, bucket_counts = np.unique(buckets[start:end], return_counts=True)
+                summary.buckets = {sketch_bucket_name(int(c)): int(n) for c, n in zip(names, bucket_counts)}
+            windows = self._windows[codes[start]]
+            pane = int(panes[start])
+            windows.panes[pane] = summary.merge(windows.panes.get(pane))
+        return late
+
+    def emit(self, watermark: float) -> List[Dict[str, Any]]:
+        """ Emite as janelas cujo fim + WINDOW_ALLOWED_LATENESS já passou do watermark (todas, com inf). """
+        spec = self.spec
+        upto = watermark - spec.lateness
+        results = []
+        for (dispositivo_id, titular_id), windows in zip(self._pairs, self._windows):
+            while windows.panes:
+                # Primeira janela a emitir que contém algum pane aberto (janelas vazias são puladas).
+                first_pane = min(windows.panes)
+                window_end = max(windows.next_end, -(-(first_pane + 1) * spec.pane // spec.slide) * spec.slide)
+                if window_end > upto:
+                    break
+                summary = RunningSummary()
+                for pane in spec.window_panes(window_end):
+                    summary = summary.merge(windows.panes.get(pane))
+                windows.next_end = window_end + spec.slide
+                oldest_pane = (windows.next_end - spec.size) // spec.pane
+                for pane in [p for p in windows.panes if p < oldest_pane]:
+                    del windows.panes[pane]
+                if not summary.count:
+                    continue
+                value = self.plan.strategy.calculate_aggregated_data(summary)
+                if value is None:
+                    continue
+                results.append({
+                    "dispositivo_id": dispositivo_id,
+                    "titular_id": titular_id,
+                    "value": value,
+                    "janela": {"inicio": window_end - spec.size, "fim": window_end},
+                })
+        return results
+
+    def _code(self, pair: Pair) -> int:
+        code = self._codes.get(pair)
+        if code is None:
+            code = self._codes[pair] = len(self._pairs)
+            self._pairs.append(pair)
+            self._windows.append(_PairWindows())
+        return code
+
+
+class FileSink:
+    """ Grava os resultados em um arquivo JSONL, um payload processado por linha. """
+
+    def __init__(self, path: str):
+        self.codec = get_codec("json")
+        self._file = open(path, "wb")
+
+    def write(self, results: List[Dict[str, Any]]):
+        if results:
+            encode = self.codec.encode
+            self._file.write(b"\n".join(encode(r) for r in results) + b"\n")
+
+    def close(self):
+        self._file.close()
+
+
+class MqttSink:
+    """
+    Publica os resultados no tópico de dados processados (ou em outro prefixo), como o
+    gateway. Ao fim de cada bloco, aguarda a entrega da última publicação, para que a fila
+    de saída do cliente não cresça sem limite.
+    """
+
+    def __init__(self, host: str, port: int, topic: str = SEND_DATA_TOPIC, qos: int = 1):
+        self.topic = topic
+        self.qos = qos
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.client.connect(host, port, 60)
+        self.client.loop_start()
+
+    def write(self, results: List[Dict[str, Any]]):
+        info = None
+        for result in results:
+            info = self.client.publish(f"{self.topic}/{result.get('dispositivo_id', 'unknown')}", output_codec.encode(result), qos=self.qos)
+        if info is not None:
+            info.wait_for_publish()
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class ReplayEngine:
+    """
+    Reprocessa mensagens gravadas de dispositivos com a mesma resolução de políticas e as
+    mesmas estratégias do gateway, em blocos: as estratégias de encaminhamento tratam cada
+    grupo de payloads do bloco com execute_batch (ruído vetorizado) e as de agregação são
+    calculadas pelo WindowAccumulator, sem passar pelo Redis nem pelo scheduler.
+
+    O horário de cada ponto agregado vem do campo `time_field`. Sem ele, vale o relógio
+    sintético da ordem do arquivo (`start` + posição do registro * `interval`), se `start`
+    for informado, ou o horário mais recente já visto nos dados. Um ponto sem horário antes
+    de qualquer outro é contado como inválido, com um aviso no log.
+    """
+
+    def __init__(self, resolver: PolicyResolver, sink, chunk_size: int = REPLAY_CHUNK_SIZE,
+                 time_field: str = "timestamp", start: Optional[float] = None, interval: float = 1.0):
+        self.resolver = resolver
+        self.sink = sink
+        self.chunk_size = chunk_size
+        self.time_field = time_field
+        self.start = start
+        self.interval = interval
+        self._accumulators: Dict[PolicyPlan, WindowAccumulator] = {}
+        # Horário mais recente visto nos dados; substitui o relógio de parede nas janelas.
+        self._watermark = float("-inf")
+        self._warned_no_time = False
+        self._stats = {
+            "records": 0,
+            "invalid": 0,
+            "no_policy": 0,
+            "rejected": 0,
+            "late": 0,
+            "forwarded": 0,
+            "windows": 0,
+            "chunks": 0,
+            "duration": 0.0,
+        }
+
+    def run(self, path: str) -> Dict[str, Any]:
+        start = time.perf_counter()
+        for records, invalid in read_records(path, self.chunk_size):
+            self._stats["invalid"] += invalid
+            self.process_chunk(records)
+        self._flush(float("inf"))
+        self._stats["duration"] = time.perf_counter() - start
+        return self.stats()
+
+    def process_chunk(self, records: List[Dict[str, Any]]):
+        """ Processa um bloco de registros; os resultados são enviados ao destino ao final do bloco. """
+        # Posição do primeiro registro do bloco no arquivo (relógio sintético).
+        offset = self._stats["records"]
+        self._stats["records"] += len(records)
+        self._stats["chunks"] += 1
+        decoded = []
+        for position, record in enumerate(records, offset):
+            dispositivo_id = record.get("dispositivo_id")
+            if not dispositivo_id and isinstance(record.get("topic"), str):
+                # Gravações do tráfego MQTT trazem o dispositivo no tópico (dispositivos/<id>/dados).
+                parts = record["topic"].split("/")
+                dispositivo_id = parts[1] if len(parts) > 1 else None
+                record = dict(record.get("payload") or record, dispositivo_id=dispositivo_id)
+            titular_id = record.get("titular_id")
+            if not dispositivo_id or not titular_id:
+                self._stats["invalid"] += 1
+                continue
+            decoded.append(((str(dispositivo_id), str(titular_id)), record, position))
+
+        policies = self.resolver.resolve([pair for pair, _, _ in decoded])
+        groups: Dict[PolicyPlan, List[Tuple[Pair, Dict[str, Any], int]]] = {}
+        for pair, record, position in decoded:
+            policy = policies.get(pair)
+            if not policy:
+                self._stats["no_policy"] += 1
+                continue
+            plan = get_policy_plan(policy)
+            if plan.rejected:
+                self._stats["rejected"] += 1
+                continue
+            groups.setdefault(plan, []).append((pair, record, position))
+
+        results: List[Dict[str, Any]] = []
+        for plan, items in groups.items():
+            if plan.accumulated:
+                self._accumulate(plan, items)
+            else:
+                processed = plan.strategy.execute_batch([record for _, record, _ in items], plan.params)
+                forwarded = [r for r in processed if r]
+                self._stats["forwarded"] += len(forwarded)
+                results.extend(forwarded)
+        self.sink.write(results)
+        self._flush(self._watermark)
+
+    def _accumulate(self, plan: PolicyPlan, items: List[Tuple[Pair, Dict[str, Any], int]]):
+        if isinstance(plan.strategy, TreatmentPipeline):
+            # As etapas anteriores à agregação (ex: ROUND, GNOISE) tratam os pontos antes de acumulá-los.
+            records = plan.strategy.transform([record for _, record, _ in items])
+            items = [(pair, record, position) for (pair, _, position), record in zip(items, records)]
+        pairs, times, values = [], [], []
+        for pair, record, position in items:
+            value = record.get("value")
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                self._stats["invalid"] += 1
+                continue
+            timestamp = self._point_time(record, position)
+            if timestamp is None:
+                self._stats["invalid"] += 1
+                continue
+            # O horário avança a cada registro, para os pontos seguintes sem horário do mesmo bloco.
+            self._watermark = max(self._watermark, timestamp)
+            pairs.append(pair)
+            times.append(timestamp)
+            values.append(value)
+        if not pairs:
+            return
+        times_array = np.asarray(times, dtype=float)
+        accumulator = self._accumulators.get(plan)
+        if accumulator is None:
+            accumulator = self._accumulators[plan] = WindowAccumulator(plan)
+        self._stats["late"] += accumulator.add(pairs, times_array, np.asarray(values, dtype=float))
+
+    def _point_time(self, record: Dict[str, Any], position: int) -> Optional[float]:
+        timestamp = parse_timestamp(record.get(self.time_field))
+        if timestamp is not None:
+            return timestamp
+        if self.start is not None:
+            return self.start + position * self.interval
+        if self._watermark == float("-inf"):
+            if not self._warned_no_time:
+                self._warned_no_time = True
+                logger.warning(
+                    "Registro %d sem horário em '%s' antes de qualquer outro, contado como inválido: informe o "
+                    "campo do horário (--time-field) ou o início do relógio sintético (--start).", position + 1, self.time_field,
+                )
+            return None
+        # Sem horário do dispositivo, o ponto vale no horário mais recente já visto.
+        return self._watermark
+
+    def _flush(self, watermark: float):
+        results = []
+        for accumulator in self._accumulators.values():
+            results.extend(accumulator.emit(watermark))
+        self._stats["windows"] += len(results)
+        self.sink.write(results)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        duration = stats["duration"] or 1e-9
+        stats["records_per_minute"] = stats["records"] / duration * 60
+        return stats
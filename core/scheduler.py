@@ -1,88 +1,215 @@
+import logging
 import threading
 import time
-from typing import Any, Dict, List, Optional
-import paho.mqtt.client as mqtt
-import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
 from core.cache_manager import cache_manager
-from core.policy_parser import parse_policy_key, parse_time_string
-import os
-from dotenv import load_dotenv
-load_dotenv()
-SEND_DATA_TOPIC = os.getenv("TOPICO_DADOS_PROCESSADOS")
-from apis import MGCAPI
-from treatments.factory import get_treatment_strategy
+from core.cluster import ClusterMembership
+from core.policy_plan import PolicyPlan, get_policy_plan
+from core.publisher import OutboundPublisher
+from core.windowing import WindowSpec
+from core.metrics import MESSAGES_OUT, POLICY_LOOKUP_LATENCY, SCHEDULER_LAG, STAGE_LATENCY, debug_sampled
+from core.config import settings
+SEND_DATA_TOPIC = settings.topico_dados_processados
+SCHEDULER_WORKERS = settings.scheduler_workers
+SCHEDULER_BATCH_SIZE = settings.scheduler_batch_size
+# Tempo máximo de espera entre consultas à fila; cobre tarefas agendadas por outras réplicas.
+SCHEDULER_MAX_SLEEP = settings.scheduler_max_sleep
+# Tempo que uma tarefa retirada da fila fica reservada para esta réplica; se ela cair antes de
+# reagendar a tarefa, outra réplica a assume depois desse prazo.
+SCHEDULER_TASK_LEASE = settings.scheduler_task_lease
+from apis import MGCAPI, MGCError
+
+logger = logging.getLogger(__name__)
+
+AGGREGATE_LATENCY = STAGE_LATENCY.labels("aggregate")
+PUBLISH_LATENCY = STAGE_LATENCY.labels("publish")
+MGC_LOOKUP_LATENCY = POLICY_LOOKUP_LATENCY.labels("mgc")
+
+Task = Tuple[str, str, float]
 
 class Scheduler(threading.Thread):
-    def __init__(self, mqtt_client: mqtt.Client):
+    def __init__(self, publisher: OutboundPublisher, mgc: MGCAPI, cluster: ClusterMembership):
         super().__init__()
         self.daemon = True
         self._stop_event = threading.Event()
-        self.mqtt_client = mqtt_client
-        print("Scheduler de agregação de dados iniciado.")\
-    
+        self._wake_event = threading.Event()
+        self._next_due: Optional[float] = None
+        self.publisher = publisher
+        self.mgc = mgc
+        # Em cluster, o scheduler só consome as filas dos slots desta réplica.
+        self.cluster = cluster
+        self._executor = ThreadPoolExecutor(SCHEDULER_WORKERS, thread_name_prefix="scheduler-worker")
+        self._lock = threading.Lock()
+        self._stats = {
+            "tasks": 0,
+            "batches": 0,
+            "published": 0,
+            "lag_total": 0.0,
+            "lag_max": 0.0,
+        }
+        # Acorda o scheduler mais cedo quando uma tarefa é agendada antes da próxima prevista.
+        cache_manager.add_schedule_listener(self._on_task_scheduled)
+        cluster.add_rebalance_listener(self._on_rebalance)
+        logger.info("Scheduler de agregação de dados iniciado.")
+
     def stop(self):
+        """ Encerra o laço e espera os lotes em andamento, para que nenhuma tarefa reservada fique sem reagendamento. """
         self._stop_event.set()
+        self._wake_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+        self._executor.shutdown(wait=True)
 
     def run(self):
         while not self._stop_event.is_set():
-            due_tasks = cache_manager.get_due_aggregation_tasks()
+            self._wake_event.clear()
+            lease_until = time.time() + SCHEDULER_TASK_LEASE
+            due_tasks = cache_manager.claim_due_aggregation_tasks(SCHEDULER_BATCH_SIZE * SCHEDULER_WORKERS, lease_until, self.cluster.owned_slots())
             if due_tasks:
-                for device_id, titular_id in due_tasks:
-                    self._process_aggregation_task(device_id, titular_id)
-            time.sleep(2)
-    
-    def _process_aggregation_task(self, device_id: str, titular_id: str):
-        """ Processa uma tarefa de agregação de dados para um dispositivo. """
-        policy = self._get_or_fetch_policy(device_id, titular_id)
-        if not policy:
-            print(f"Nenhuma política de privacidade encontrada para o dispositivo {device_id}.")
-            return
-        chave_politica = policy.get("opcao_tratamento", {}).get("chave_politica")
-        data_points = cache_manager.get_and_clear_data_points(device_id, titular_id)
-        if not data_points:
-            print(f"Nenhum ponto de dado encontrado para o dispositivo {device_id}.")
-            return
-        parsed_policy = parse_policy_key(chave_politica)
-        if not parsed_policy["action"]:
-            print(f"Erro: Dados do dispositivo não contêm ação de tratamento.")
-            return
-        strategy = get_treatment_strategy(parsed_policy["action"])
-        if not strategy:
-            print(f"Estratégia de tratamento não encontrada para a chave_politica '{policy.get('opcao_tratamento', {}).get('chave_politica')}'.")
-            return
-        aggregated_data = strategy.calculate_aggregated_data(data_points)
-        if not aggregated_data:
-            print(f"Erro ao calcular os dados agregados para o dispositivo {device_id}.")
+                batches = [due_tasks[i:i + SCHEDULER_BATCH_SIZE] for i in range(0, len(due_tasks), SCHEDULER_BATCH_SIZE)]
+                for future in [self._executor.submit(self._process_batch, batch, lease_until) for batch in batches]:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.exception("Erro ao processar lote de tarefas de agregação: %s", e)
+                if len(due_tasks) == SCHEDULER_BATCH_SIZE * SCHEDULER_WORKERS:
+                    # Ainda pode haver tarefas vencidas na fila.
+                    continue
+            self._sleep_until_next_due()
+
+    def stats(self) -> Dict[str, Any]:
+        """ Retorna as métricas do scheduler, incluindo o atraso (real - previsto) das tarefas. """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["lag_avg"] = stats["lag_total"] / stats["tasks"] if stats["tasks"] else 0.0
+        stats["next_due"] = self._next_due
+        return stats
+
+    def _sleep_until_next_due(self):
+        next_due = cache_manager.get_next_due_timestamp(self.cluster.owned_slots())
+        self._next_due = next_due
+        timeout = SCHEDULER_MAX_SLEEP
+        if next_due is not None:
+            timeout = min(max(next_due - time.time(), 0.0), SCHEDULER_MAX_SLEEP)
+        self._wake_event.wait(timeout)
+
+    def _on_task_scheduled(self, due_timestamp: float):
+        next_due = self._next_due
+        if next_due is None or due_timestamp < next_due:
+            self._next_due = due_timestamp
+            self._wake_event.set()
+
+    def _on_rebalance(self, owned_slots: FrozenSet[int]):
+        # Os slots mudaram: recalcula a próxima tarefa a partir das filas desta réplica.
+        self._next_due = None
+        self._wake_event.set()
+
+    def _process_batch(self, tasks: List[Task], lease_until: float):
+        """
+        Processa um lote de tarefas de agregação com um número limitado de idas ao Redis:
+        políticas (L1 + MGET), leitura dos panes das janelas (um pipeline por estratégia e
+        janela) e reagendamento (um ZADD por slot, no mesmo pipeline).
+        Cada tarefa emite a janela que terminou WINDOW_ALLOWED_LATENESS segundos antes do
+        horário previsto, então o resultado não depende do atraso do scheduler. A tarefa é
+        reagendada para a próxima janela que já tem pontos; sem nenhuma, ela é liberada e o
+        próximo ponto acumulado do par a agenda de novo.
+        """
+        now = time.time()
+        politicas = cache_manager.get_policies((device_id, titular_id) for device_id, titular_id, _ in tasks)
+        to_collect: Dict[Tuple[Any, WindowSpec, int], List[Tuple[str, str]]] = {}
+        plans: Dict[Tuple[str, str], PolicyPlan] = {}
+        reschedule: Dict[Tuple[str, str], float] = {}
+        release: List[Tuple[str, str]] = []
+        unavailable: Set[str] = set()
+        for device_id, titular_id, due in tasks:
+            pair = (device_id, titular_id)
+            if pair not in politicas:
+                if titular_id in unavailable:
+                    continue
+                try:
+                    politicas[pair] = self._get_or_fetch_policy(device_id, titular_id)
+                except MGCError as e:
+                    # MGC indisponível: a tarefa continua reservada e é tentada de novo quando a reserva expirar.
+                    logger.warning("Agregação adiada para o titular %s: %s", titular_id, e)
+                    unavailable.add(titular_id)
+                    continue
+            policy = politicas[pair]
+            if not policy:
+                debug_sampled(logger, "Nenhuma política de privacidade encontrada para o dispositivo %s.", device_id)
+                release.append(pair)
+                continue
+            plan = get_policy_plan(policy)
+            if plan.rejected:
+                debug_sampled(logger, "Erro: %s", plan.error)
+                release.append(pair)
+                continue
+            if not plan.accumulated:
+                debug_sampled(logger, "Estratégia de tratamento não é de agregação de dados para a chave_politica '%s'.", plan.chave_politica)
+                release.append(pair)
+                continue
+            plans[pair] = plan
+            window_end = plan.window_spec.window_end_for_due(due)
+            to_collect.setdefault((plan.strategy, plan.window_spec, window_end), []).append(pair)
+
+        for (strategy, window, window_end), pairs in to_collect.items():
+            for pair, (data_points, next_end) in zip(pairs, strategy.collect_pending(pairs, window, window_end)):
+                if data_points:
+                    self._publish_aggregation(pair[0], pair[1], plans[pair], data_points, window_end)
+                else:
+                    debug_sampled(logger, "Nenhum ponto de dado encontrado para o dispositivo %s.", pair[0])
+                if next_end is None:
+                    release.append(pair)
+                else:
+                    # Emissão alinhada ao relógio (o atraso não se acumula), pulando as janelas vazias.
+                    reschedule[pair] = window.next_emission(next_end - window.slide, now)
+
+        cache_manager.schedule_aggregation_tasks(reschedule)
+        cache_manager.release_aggregation_tasks(release, lease_until)
+        lags = [now - due for _, _, due in tasks]
+        for lag in lags:
+            SCHEDULER_LAG.observe(lag)
+        with self._lock:
+            self._stats["tasks"] += len(tasks)
+            self._stats["batches"] += 1
+            self._stats["lag_total"] += sum(lags)
+            self._stats["lag_max"] = max(self._stats["lag_max"], max(lags))
+
+    def _publish_aggregation(self, device_id: str, titular_id: str, plan: PolicyPlan, data_points: Any, window_end: int):
+        start = time.perf_counter()
+        aggregated_data = plan.strategy.calculate_aggregated_data(data_points)
+        AGGREGATE_LATENCY.observe(time.perf_counter() - start)
+        if aggregated_data is None:
+            logger.warning("Erro ao calcular os dados agregados para o dispositivo %s.", device_id)
             return
         result = {
             "dispositivo_id": device_id,
             "titular_id": titular_id,
-            "value": aggregated_data
+            "value": aggregated_data,
+            "janela": {"inicio": window_end - plan.window_spec.size, "fim": window_end},
         }
         topic = f"{SEND_DATA_TOPIC}/{device_id}"
-        self.mqtt_client.publish(topic, json.dumps(result))
-        print(f"Dados agregados encaminhados para o tópico de dados processados: {topic}")
-        self._reschedule_aggregation_task(device_id, titular_id, parsed_policy)
-    
-    def _reschedule_aggregation_task(self, device_id: str, titular_id: str, parsed_policy: Dict[str, Any]):
-        interval = parsed_policy["interval"]
-        if not interval:
-            print(f"Erro: Dados do dispositivo não contêm intervalo de agregação.")
-            return
-        interval_seconds = parse_time_string(interval)
-        if not interval_seconds:
-            print(f"Erro: Dados do dispositivo não contêm intervalo de agregação válido.")
-            return
-        due_timestamp = time.time() + interval_seconds
-        cache_manager.schedule_aggregation_task(device_id, titular_id, due_timestamp)
-        print(f"Tarefa de agregação agendada para o dispositivo {device_id} para o titular {titular_id}.")
+        start = time.perf_counter()
+        self.publisher.publish(topic, result, plan.action)
+        PUBLISH_LATENCY.observe(time.perf_counter() - start)
+        MESSAGES_OUT.labels(plan.action).inc()
+        with self._lock:
+            self._stats["published"] += 1
+        debug_sampled(logger, "Dados agregados encaminhados para o tópico de dados processados: %s", topic)
 
     def _get_or_fetch_policy(self, dispositivo_id: str, titular_id: str) -> Optional[Dict[str, Any]]:
-        """ Busca no cache ou no MGC uma política de privacidade para o dispositivo. """
+        """
+        Busca no cache ou no MGC uma política de privacidade para o dispositivo.
+        Raises:
+            MGCError: se o MGC não respondeu (a ausência só é cacheada quando confirmada pelo MGC).
+        """
+        if cache_manager.is_policy_absent(dispositivo_id, titular_id):
+            return None
         politica = cache_manager.get_policy(dispositivo_id, titular_id)
         if not politica:
-            mgc = MGCAPI()
-            politica = mgc.get_politica_privacidade(dispositivo_id, titular_id)
-            if politica:
-                cache_manager.set_policy(dispositivo_id, titular_id, politica)
-        return politica
\ No newline at end of file
+            start = time.perf_counter()
+            politica = self.mgc.get_politica_privacidade(titular_id=titular_id, dispositivo_id=dispositivo_id)
+            MGC_LOOKUP_LATENCY.observe(time.perf_counter() - start)
+            if not politica:
+                cache_manager.set_policy_absent(dispositivo_id, titular_id)
+        return politica
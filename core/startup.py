@@ -0,0 +1,54 @@
+import logging
+import threading
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """
+    Mede a duração de cada fase da inicialização do gateway. O relógio começa na importação
+    deste módulo (a primeira feita pelo main.py); cada mark() encerra uma fase, e a primeira
+    mensagem processada encerra a última e registra o relatório no log.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self._last = self.origin
+        self._phases: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.finished = False
+
+    def mark(self, phase: str):
+        """ Encerra a fase atual (desde o mark anterior) com o nome informado. """
+        now = time.perf_counter()
+        with self._lock:
+            self._phases[phase] = now - self._last
+            self._last = now
+
+    def first_message(self):
+        """ Encerra a inicialização na primeira mensagem processada (chamadas seguintes não fazem nada). """
+        if self.finished:
+            return
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+        self.mark("first_message")
+        report = self.report()
+        logger.info(
+            "Inicialização concluída em %.0f ms até a primeira mensagem processada (%s).",
+            report["total"] * 1000,
+            ", ".join(f"{phase}: {seconds * 1000:.0f} ms" for phase, seconds in report.items() if phase != "total"),
+        )
+
+    def report(self) -> Dict[str, float]:
+        """ Duração (segundos) de cada fase concluída e o total desde a origem. """
+        with self._lock:
+            report = dict(self._phases)
+            report["total"] = self._last - self.origin
+        return report
+
+
+startup = StartupTimer()
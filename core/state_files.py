@@ -0,0 +1,39 @@
+import os
+from core.config import settings
+# Diretório dos arquivos de estado do gateway (snapshots); caminhos relativos são resolvidos nele.
+DATA_DIR = settings.data_dir
+
+
+def state_path(path: str) -> str:
+    """ Caminho de um arquivo de estado: relativo a DATA_DIR, se não for absoluto (vazio continua vazio, desativado). """
+    if not path or os.path.isabs(path):
+        return path
+    return os.path.join(DATA_DIR, path)
+
+
+def write_state_file(path: str, data: bytes):
+    """
+    Grava um arquivo de estado de forma atômica (arquivo temporário + rename), legível só pelo
+    usuário do gateway: os snapshots contêm consentimentos (e dados) em claro.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def remove_state_file(path: str) -> bool:
+    """
+    Apaga um arquivo de estado.
+    Returns:
+        - True se o arquivo existia.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
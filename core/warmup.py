@@ -0,0 +1,241 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from apis import MGCAPI
+from core.cache_manager import CACHE_MAX_AGE, cache_manager
+from core.codecs import storage
+from core.config import settings
+from core.policy_plan import get_policy_plan
+from core.state_files import remove_state_file, state_path, write_state_file
+# Fontes do warm-up, na ordem em que são tentadas ("snapshot", "mgc"); vazio desativa o warm-up.
+WARMUP_SOURCES = [s.strip() for s in settings.warmup_sources.split(",") if s.strip()]
+# Com true, o gateway só passa a aceitar mensagens depois do warm-up.
+WARMUP_BLOCKING = settings.warmup_blocking
+WARMUP_PAGE_SIZE = settings.warmup_page_size
+# Snapshot das políticas (consentimentos em claro): caminhos relativos ficam no diretório de dados (DATA_DIR).
+WARMUP_SNAPSHOT_PATH = state_path(settings.warmup_snapshot_path)
+WARMUP_SNAPSHOT_INTERVAL = settings.warmup_snapshot_interval
+WARMUP_SNAPSHOT_MAX_AGE = settings.warmup_snapshot_max_age
+
+logger = logging.getLogger(__name__)
+
+Consentimentos = Dict[str, Dict[str, Dict[str, Any]]]
+
+
+def write_snapshot(path: str = WARMUP_SNAPSHOT_PATH) -> int:
+    """
+    Grava no arquivo todas as políticas cacheadas no Redis ({titular: {dispositivo: política}}).
+    A escrita é atômica (arquivo temporário + rename), então um snapshot parcial nunca é lido, e
+    o arquivo só é legível pelo usuário do gateway.
+    Returns:
+        - O número de políticas gravadas.
+    """
+    consentimentos = cache_manager.export_policies()
+    write_state_file(path, storage.dumps({"criado_em": time.time(), "consentimentos": consentimentos}))
+    return sum(len(policies) for policies in consentimentos.values())
+
+
+def read_snapshot(path: str = WARMUP_SNAPSHOT_PATH, max_age: float = WARMUP_SNAPSHOT_MAX_AGE) -> Optional[Tuple[float, Consentimentos]]:
+    """
+    Lê um snapshot de políticas.
+    Returns:
+        - (horário de criação, consentimentos), ou None se o arquivo não existir, for ilegível
+          ou for mais antigo que max_age (revogações feitas depois dele não estariam refletidas).
+    """
+    try:
+        with open(path, "rb") as f:
+            snapshot = storage.loads(f.read())
+        created_at = float(snapshot["criado_em"])
+        consentimentos = snapshot["consentimentos"]
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning("Snapshot de políticas ilegível (%s): %s", path, e)
+        return None
+    age = time.time() - created_at
+    if age > max_age:
+        logger.info("Snapshot de políticas ignorado: criado há %.0f s (máximo: %.0f s).", age, max_age)
+        return None
+    return created_at, consentimentos
+
+
+class PolicyWarmup(threading.Thread):
+    """
+    Pré-carrega as políticas ativas no Redis antes (ou enquanto) o gateway recebe mensagens,
+    evitando que cada primeira mensagem de um dispositivo vá ao MGC. As políticas vêm de um
+    snapshot local recente ou das páginas de consentimentos do MGC e são gravadas em grandes
+    pipelines, junto com o agendamento em lote das tarefas de agregação.
+    """
+
+    def __init__(self, mgc: MGCAPI):
+        super().__init__(name="policy-warmup")
+        self.daemon = True
+        self.mgc = mgc
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            "state": "pending",
+            "source": None,
+            "titulars": 0,
+            "policies": 0,
+            "tasks": 0,
+            "pages": 0,
+            "duration": 0.0,
+        }
+
+    def run(self):
+        start = time.perf_counter()
+        self._update(state="running")
+        logger.info("Warm-up de políticas iniciado (fontes: %s).", ", ".join(WARMUP_SOURCES) or "nenhuma")
+        try:
+            for source in WARMUP_SOURCES:
+                loader = {"snapshot": self._load_snapshot, "mgc": self._load_mgc}.get(source)
+                if loader is None:
+                    logger.warning("Fonte de warm-up desconhecida: %s", source)
+                    continue
+                if loader():
+                    self._update(source=source)
+                    break
+        except Exception as e:
+            logger.exception("Erro no warm-up de políticas: %s", e)
+        finally:
+            self._update(state="done", duration=time.perf_counter() - start)
+            self.done.set()
+        stats = self.stats()
+        logger.info(
+            "Warm-up concluído em %.2f s (fonte: %s): %d políticas de %d titulares, %d tarefas de agregação.",
+            stats["duration"], stats["source"] or "nenhuma", stats["policies"], stats["titulars"], stats["tasks"],
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["completed"] = int(self.done.is_set())
+        return stats
+
+    def _load_snapshot(self) -> bool:
+        if not WARMUP_SNAPSHOT_PATH:
+            return False
+        if cache_manager.has_policies():
+            # O backend já está aquecido (ex: outras réplicas no mesmo Redis): o snapshot local é
+            # mais antigo e poderia restaurar consentimentos revogados depois dele.
+            logger.info("Snapshot de políticas ignorado: o backend já tem políticas cacheadas.")
+            return False
+        snapshot = read_snapshot()
+        if snapshot is None:
+            return False
+        created_at, consentimentos = snapshot
+        # As políticas do snapshot expiram quando expirariam no cache de onde vieram.
+        ttl = max(int(CACHE_MAX_AGE - (time.time() - created_at)), 1)
+        titulares = list(consentimentos)
+        for i in range(0, len(titulares), WARMUP_PAGE_SIZE):
+            self._store({t: consentimentos[t] for t in titulares[i:i + WARMUP_PAGE_SIZE]}, ttl, only_if_absent=True)
+        return True
+
+    def _load_mgc(self) -> bool:
+        pagina = 1
+        while True:
+            itens = self.mgc.list_consentimentos(pagina, WARMUP_PAGE_SIZE)
+            if itens is None:
+                # Erro na primeira página: o MGC não oferece a listagem (ou está fora do ar).
+                return pagina > 1
+            consentimentos: Consentimentos = {}
+            for c in itens:
+                titular_id, dispositivo_id = c.get("titular_id"), c.get("dispositivo_id")
+                if titular_id and dispositivo_id:
+                    consentimentos.setdefault(str(titular_id), {}).setdefault(str(dispositivo_id), c)
+            self._store(consentimentos, CACHE_MAX_AGE)
+            with self._lock:
+                self._stats["pages"] += 1
+            if len(itens) < WARMUP_PAGE_SIZE:
+                return True
+            pagina += 1
+
+    def _store(self, consentimentos: Consentimentos, ttl: int, only_if_absent: bool = False):
+        """
+        Grava um lote de políticas e agenda, em lote, as agregações das políticas acumuladas.
+        Args:
+            only_if_absent: Se True, não sobrescreve as políticas já cacheadas (usado com o
+                            snapshot, que pode ser mais antigo que elas).
+        """
+        policies = cache_manager.set_policies_bulk(consentimentos, ttl, only_if_absent)
+        now = time.time()
+        tasks = {}
+        for titular_id, politicas in consentimentos.items():
+            for dispositivo_id, politica in politicas.items():
+                plan = get_policy_plan(politica)
+                if plan.accumulated and not plan.rejected:
+                    tasks[(dispositivo_id, titular_id)] = plan.window_spec.first_emission(now)
+        # Tarefas que sobreviveram no Redis mantêm o horário já agendado.
+        cache_manager.schedule_aggregation_tasks(tasks, only_if_absent=True)
+        with self._lock:
+            self._stats["titulars"] += len(consentimentos)
+            self._stats["policies"] += policies
+            self._stats["tasks"] += len(tasks)
+            loaded = self._stats["policies"]
+        logger.info("Warm-up: %d políticas carregadas.", loaded)
+
+    def _update(self, **values):
+        with self._lock:
+            self._stats.update(values)
+
+
+class SnapshotWriter(threading.Thread):
+    """
+    Grava periodicamente (e ao encerrar) o snapshot de políticas usado no warm-up. Uma revogação
+    apaga o snapshot atual na hora e antecipa a próxima gravação, para que um reinício nunca
+    restaure a política revogada.
+    """
+
+    # Espera após uma revogação antes de regravar, agrupando as revogações em rajada.
+    REFRESH_DELAY = 1.0
+
+    def __init__(self, path: str = WARMUP_SNAPSHOT_PATH, interval: float = WARMUP_SNAPSHOT_INTERVAL):
+        super().__init__(name="policy-snapshot")
+        self.daemon = True
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._refresh = threading.Event()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def stop(self):
+        self._stop_event.set()
+        self._refresh.set()
+        self.write()
+
+    def invalidate(self):
+        """ Descarta o snapshot gravado (anterior a uma revogação) e agenda um novo. """
+        with self._lock:
+            self._generation += 1
+            removed = remove_state_file(self.path)
+        if removed:
+            logger.info("Snapshot de políticas %s descartado após uma revogação.", self.path)
+        self._refresh.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            if self._refresh.wait(self.interval):
+                self._stop_event.wait(self.REFRESH_DELAY)
+            self._refresh.clear()
+            if self._stop_event.is_set():
+                break
+            self.write()
+
+    def write(self):
+        start = time.perf_counter()
+        with self._lock:
+            generation = self._generation
+        try:
+            count = write_snapshot(self.path)
+        except Exception as e:
+            logger.warning("Erro ao gravar o snapshot de políticas em %s: %s", self.path, e)
+            return
+        with self._lock:
+            if generation != self._generation:
+                # Uma revogação chegou durante a exportação: o arquivo recém-gravado pode contê-la.
+                remove_state_file(self.path)
+                return
+        logger.info("Snapshot com %d políticas gravado em %s (%.2f s).", count, self.path, time.perf_counter() - start)
@@ -0,0 +1,112 @@
+import math
+import time
+from datetime import datetime
+from typing import Any, Optional
+from core.config import settings
+# Atraso máximo (segundos) aceito para um ponto fora de ordem: cada janela só é emitida
+# esse tempo depois do seu fim, e pontos que chegam depois disso são descartados.
+WINDOW_ALLOWED_LATENESS = settings.window_allowed_lateness
+# Tempo extra (segundos) que os resumos parciais ficam no Redis, para recuperar as janelas
+# não emitidas após um atraso do scheduler ou um reinício do gateway.
+WINDOW_RETENTION = settings.window_retention
+# Número máximo de panes (resumos parciais) por janela; planos acima disso são rejeitados.
+WINDOW_MAX_PANES = settings.window_max_panes
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """ Converte um horário em epoch (segundos ou milissegundos) ou ISO 8601 para epoch em segundos. """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # Epochs em milissegundos (13 dígitos) são comuns em firmwares de dispositivos.
+        return value / 1000.0 if value > 1e11 else float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+class WindowSpec:
+    """
+    Janela de agregação de um plano: tamanho e passo (slide) em segundos, alinhados aos
+    múltiplos do passo no relógio de parede (epoch). Com tamanho igual ao passo a janela é
+    tumbling; com tamanho maior, deslizante.
+
+    Os pontos são acumulados em panes de `pane` segundos (mdc entre tamanho e passo), cada
+    um com seu resumo parcial, guardados em um anel de `ring` posições no Redis. Emitir uma
+    janela combina os resumos dos seus panes, sem reler pontos brutos, e avançar a janela
+    deslizante não altera o estado já acumulado.
+    """
+
+    __slots__ = ("size", "slide", "pane", "lateness", "ring")
+
+    def __init__(self, size: int, slide: int, lateness: int = WINDOW_ALLOWED_LATENESS, retention: int = WINDOW_RETENTION):
+        self.size = size
+        self.slide = slide
+        self.pane = math.gcd(size, slide)
+        self.lateness = lateness
+        # Panes que ainda podem receber pontos ou ser lidos por uma janela não emitida.
+        self.ring = -(-(size + slide + lateness + retention) // self.pane) + 1
+
+    @property
+    def panes(self) -> int:
+        """ Número de panes combinados em cada emissão. """
+        return self.size // self.pane
+
+    @property
+    def signature(self) -> str:
+        """ Identifica o layout do anel; um anel gravado com outro layout é descartado. """
+        return f"{self.size}:{self.slide}"
+
+    def pane_of(self, timestamp: float) -> int:
+        return int(timestamp // self.pane)
+
+    def window_end_of(self, pane: int) -> int:
+        """ Fim da primeira janela que contém o pane. """
+        return (pane * self.pane // self.slide + 1) * self.slide
+
+    def window_end_for_due(self, due: float) -> int:
+        """ Fim da janela emitida por uma tarefa agendada para `due`. """
+        return int((due - self.lateness) // self.slide) * self.slide
+
+    def emission_time(self, window_end: int) -> float:
+        return window_end + self.lateness
+
+    def first_emission(self, now: float) -> float:
+        """ Horário de emissão da primeira janela que termina depois de `now`. """
+        return self.emission_time((int(now // self.slide) + 1) * self.slide)
+
+    def next_emission(self, window_end: int, now: float) -> float:
+        """
+        Horário de emissão da janela seguinte à que termina em `window_end`. Depois de um
+        atraso longo, pula as janelas cujos panes já saíram do anel.
+        """
+        oldest_pane = self.pane_of(now) - self.ring + 2
+        oldest_end = -(-(oldest_pane * self.pane + self.size) // self.slide) * self.slide
+        return self.emission_time(max(window_end + self.slide, oldest_end))
+
+    def window_panes(self, window_end: int) -> range:
+        """ Panes que compõem a janela [window_end - size, window_end). """
+        return range((window_end - self.size) // self.pane, window_end // self.pane)
+
+    def accepts(self, pane: int, now: float) -> bool:
+        """
+        Indica se um ponto do pane ainda entra em alguma janela não emitida. Pontos de panes
+        que não pertencem a nenhuma janela (intervalo maior que a janela) também são recusados.
+        """
+        last_end = (pane * self.pane + self.size) // self.slide * self.slide
+        return last_end >= (pane + 1) * self.pane and now < self.emission_time(last_end)
+
+    def point_time(self, payload: Any, now: Optional[float] = None) -> float:
+        """
+        Horário do ponto pelo "timestamp" do dispositivo; sem ele (ou com o relógio do
+        dispositivo adiantado), vale o horário de chegada.
+        """
+        now = time.time() if now is None else now
+        timestamp = parse_timestamp(payload.get("timestamp"))
+        if timestamp is None or timestamp > now + self.pane:
+            return now
+        return timestamp
+
+    def __repr__(self) -> str:
+        return f"WindowSpec(size={self.size}, slide={self.slide}, pane={self.pane}, ring={self.ring})"
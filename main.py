@@ -1,4 +1,13 @@
+import logging
+from core.startup import startup
+from core.config import settings
+logging.basicConfig(
+    level=settings.log_level.upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+
 from core.gateway import PrivacyGateway
+startup.mark("imports")
 
 gateway = PrivacyGateway()
-gateway.start()
\ No newline at end of file
+gateway.start()
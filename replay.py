@@ -0,0 +1,59 @@
+import argparse
+import logging
+from core.config import settings
+logging.basicConfig(
+    level=settings.log_level.upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+
+from apis import MGCAPI
+from core.backends import StateBackendError
+from core.replay import REPLAY_CHUNK_SIZE, SEND_DATA_TOPIC, FileSink, MqttSink, PolicyResolver, ReplayEngine
+from core.warmup import read_snapshot
+
+logger = logging.getLogger("replay")
+
+parser = argparse.ArgumentParser(
+    description="Reprocessa mensagens gravadas de dispositivos (JSONL ou Parquet) com as políticas e estratégias do gateway.",
+)
+parser.add_argument("input", help="Arquivo de entrada (.jsonl, ou .parquet com pyarrow instalado).")
+destination = parser.add_mutually_exclusive_group(required=True)
+destination.add_argument("--output", help="Arquivo JSONL de saída.")
+destination.add_argument("--mqtt", action="store_true", help="Publica os resultados no broker MQTT do .env.")
+parser.add_argument("--topic", default=SEND_DATA_TOPIC, help="Prefixo do tópico de saída no MQTT (padrão: TOPICO_DADOS_PROCESSADOS).")
+parser.add_argument("--policies", help="Snapshot de políticas (formato do warm-up) usado no lugar do cache e do MGC.")
+parser.add_argument("--chunk-size", type=int, default=REPLAY_CHUNK_SIZE, help="Registros processados por bloco.")
+parser.add_argument("--time-field", default="timestamp", help="Campo com o horário de cada ponto agregado (epoch ou ISO 8601).")
+parser.add_argument(
+    "--start", type=float,
+    help="Início (epoch) do relógio sintético usado nos registros sem horário: o registro N vale em START + N * --interval.",
+)
+parser.add_argument("--interval", type=float, default=1.0, help="Segundos entre registros consecutivos no relógio sintético.")
+args = parser.parse_args()
+
+if args.policies:
+    snapshot = read_snapshot(args.policies, max_age=float("inf"))
+    if snapshot is None:
+        parser.error(f"Snapshot de políticas ilegível: {args.policies}")
+    resolver = PolicyResolver(consentimentos=snapshot[1])
+else:
+    resolver = PolicyResolver(mgc=MGCAPI())
+if args.mqtt:
+    sink = MqttSink(settings.mqtt_host, settings.mqtt_port, args.topic)
+else:
+    sink = FileSink(args.output)
+
+try:
+    engine = ReplayEngine(resolver, sink, args.chunk_size, args.time_field, args.start, args.interval)
+    stats = engine.run(args.input)
+except StateBackendError as e:
+    logger.error("Erro fatal: backend de estado indisponível para resolver as políticas (use --policies): %s", e)
+    raise SystemExit(1)
+finally:
+    sink.close()
+logger.info(
+    "Replay concluído em %.2f s: %d registros (%.0f/min), %d encaminhados, %d janelas agregadas, "
+    "%d sem política, %d com política rejeitada, %d atrasados, %d inválidos.",
+    stats["duration"], stats["records"], stats["records_per_minute"], stats["forwarded"], stats["windows"],
+    stats["no_policy"], stats["rejected"], stats["late"], stats["invalid"],
+)
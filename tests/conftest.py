@@ -0,0 +1,24 @@
+import os
+
+# Ambiente dos testes: estado em memória, sem Redis, MGC, broker, snapshots ou endpoint de métricas.
+# Precisa ser definido antes da primeira leitura da configuração (core.config.get_settings).
+for name, value in {
+    "STATE_BACKEND": "memory",
+    "MEMORY_SNAPSHOT_PATH": "",
+    "WARMUP_SOURCES": "",
+    "WARMUP_SNAPSHOT_PATH": "",
+    "METRICS_PORT": "0",
+    "PIPELINE_PROFILE_SAMPLE_RATE": "1",
+}.items():
+    os.environ.setdefault(name, value)
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def fresh_state():
+    """ Cada teste começa com um backend de estado em memória vazio e o cache L1 limpo. """
+    from core.cache_manager import cache_manager
+    yield
+    cache_manager.close()
+    cache_manager.local_policies.clear()
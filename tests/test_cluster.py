@@ -0,0 +1,127 @@
+import time
+import pytest
+from core import cluster
+from core.cluster import CLUSTER_NODE_TTL, ClusterMembership, HashRing
+
+
+class FakeMembers:
+    """ Registro de réplicas vivas compartilhado, no lugar do backend de estado. """
+
+    def __init__(self):
+        self.nodes = set()
+
+    def cluster_heartbeat(self, members_key, node_id, now, node_ttl):
+        self.nodes.add(node_id)
+        return sorted(self.nodes)
+
+    def cluster_leave(self, members_key, node_id):
+        self.nodes.discard(node_id)
+
+
+class FlakyCache:
+    """ Backend de cluster de uma réplica, cujos heartbeats podem falhar. """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.fail = False
+
+    def cluster_heartbeat(self, members_key, node_id, now, node_ttl):
+        if self.fail:
+            raise ConnectionError("backend indisponível")
+        return self.registry.cluster_heartbeat(members_key, node_id, now, node_ttl)
+
+    def cluster_leave(self, members_key, node_id):
+        self.registry.cluster_leave(members_key, node_id)
+
+
+@pytest.fixture(params=[1, 8, 64])
+def num_slots(request, monkeypatch):
+    monkeypatch.setattr(cluster, "CLUSTER_ENABLED", True)
+    monkeypatch.setattr(cluster, "CLUSTER_SLOTS", request.param)
+    return request.param
+
+
+@pytest.fixture
+def registry():
+    return FakeMembers()
+
+
+def join(registry, *node_ids):
+    replicas = [ClusterMembership(FlakyCache(registry), node_id=node_id) for node_id in node_ids]
+    # Cada réplica só enxerga as que entraram antes dela: uma segunda rodada converge.
+    for _ in range(2):
+        for replica in replicas:
+            replica.heartbeat()
+    return replicas
+
+
+def owners(replicas, num_slots):
+    """ Dono de cada slot; falha se um slot tiver mais de um dono. """
+    result = {}
+    for replica in replicas:
+        for slot in replica.owned_slots():
+            assert slot not in result, f"slot {slot} com dois donos"
+            result[slot] = replica.node_id
+    return result
+
+
+@pytest.mark.parametrize("num_members", [2, 3, 5])
+def test_each_slot_has_exactly_one_owner(num_slots, registry, num_members):
+    replicas = join(registry, *(f"replica-{i}" for i in range(num_members)))
+    by_slot = owners(replicas, num_slots)
+    assert sorted(by_slot) == list(range(num_slots))
+    ring = HashRing([replica.node_id for replica in replicas])
+    assert all(ring.owner(slot) == node for slot, node in by_slot.items())
+    assert all(replica.members() == tuple(sorted(registry.nodes)) for replica in replicas)
+
+
+def test_rebalance_moves_only_affected_slots(num_slots, registry):
+    replicas = join(registry, "replica-0", "replica-1", "replica-2")
+    before = owners(replicas, num_slots)
+    replicas += join(registry, "replica-3")
+    for replica in replicas:
+        replica.heartbeat()
+    after = owners(replicas, num_slots)
+    assert sorted(after) == list(range(num_slots))
+    # Na entrada de uma réplica, só os slots que ela assume mudam de dono.
+    assert all(after[slot] == "replica-3" for slot in range(num_slots) if after[slot] != before[slot])
+    replicas[1].stop()
+    remaining = [replica for replica in replicas if replica.node_id != "replica-1"]
+    for replica in remaining:
+        replica.heartbeat()
+    final = owners(remaining, num_slots)
+    assert sorted(final) == list(range(num_slots))
+    # Na saída, só os slots da réplica que saiu mudam de dono.
+    assert all(final[slot] == after[slot] for slot in range(num_slots) if after[slot] != "replica-1")
+
+
+def test_no_slots_before_first_heartbeat(num_slots, registry):
+    other, = join(registry, "replica-0")
+    membership = ClusterMembership(FlakyCache(registry), node_id="replica-1")
+    assert membership.owned_slots() == frozenset()
+    membership.cache.fail = True
+    membership.heartbeat()
+    assert membership.owned_slots() == frozenset()
+    membership.cache.fail = False
+    membership.heartbeat()
+    other.heartbeat()
+    assert membership.owned_slots() == HashRing(["replica-0", "replica-1"]).slots_of("replica-1", num_slots)
+    assert sorted(owners([membership, other], num_slots)) == list(range(num_slots))
+
+
+def test_slots_released_after_heartbeats_fail_for_node_ttl(num_slots, registry):
+    membership = ClusterMembership(FlakyCache(registry), node_id="replica-1")
+    rebalances = []
+    membership.add_rebalance_listener(rebalances.append)
+    membership.heartbeat()
+    all_slots = frozenset(range(num_slots))
+    membership.cache.fail = True
+    # Uma falha isolada não tira os slots da réplica.
+    membership.heartbeat()
+    assert membership.owned_slots() == all_slots
+    membership._last_heartbeat = time.time() - CLUSTER_NODE_TTL
+    membership.heartbeat()
+    assert membership.owned_slots() == frozenset()
+    membership.cache.fail = False
+    membership.heartbeat()
+    assert rebalances == [all_slots, frozenset(), all_slots]
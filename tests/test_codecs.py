@@ -0,0 +1,29 @@
+from core.backends.redis_backend import RedisBackend
+from core.codecs import get_codec, storage
+from core.metrics import STORAGE_DECODE_ERRORS
+
+
+def test_json_encodes_non_string_keys():
+    codec = get_codec("json")
+    assert codec.decode(codec.encode({1: "a", 2.5: "b", "c": {3: True}})) == {"1": "a", "2.5": "b", "c": {"3": True}}
+
+
+class _Client:
+    def __init__(self, values):
+        self.values = values
+
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+
+
+def test_unreadable_policy_is_a_miss():
+    backend = RedisBackend()
+    backend.binary_client = _Client({
+        "policy:dev1:tit1": storage.dumps({"ok": 1}),
+        # Prefixo de um codec conhecido com um corpo inválido (ex: réplica sem a dependência).
+        "policy:dev2:tit1": b"\x01\xc1",
+    })
+    errors = STORAGE_DECODE_ERRORS.labels("policy")
+    before = errors.value
+    assert backend.get_policies([("dev1", "tit1"), ("dev2", "tit1"), ("dev3", "tit1")]) == [{"ok": 1}, None, None]
+    assert errors.value == before + 1
@@ -0,0 +1,126 @@
+import json
+import threading
+import time
+import pytest
+from apis import MGCAPI, MGCError
+from benchmarks.standins import StubMGCServer
+from core.cache_manager import cache_manager
+from core.gateway import PrivacyGateway
+
+
+def consentimento(dispositivo_id, chave_politica="RAW"):
+    return {"dispositivo_id": dispositivo_id, "opcao_tratamento": {"chave_politica": chave_politica}}
+
+
+@pytest.fixture
+def stub_mgc():
+    server = StubMGCServer({"tit1": [consentimento("dev1")]})
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def mgc(stub_mgc):
+    received = []
+    mgc = MGCAPI(stub_mgc.base_url, on_consentimentos=lambda titular_id, consentimentos: received.append((titular_id, consentimentos)))
+    mgc.received = received
+    return mgc
+
+
+@pytest.fixture
+def gateway():
+    gateway = PrivacyGateway()
+    yield gateway
+    gateway.policy_fetcher.stop()
+    gateway.scheduler.stop()
+
+
+def test_explicit_no_consent_is_cached(gateway, stub_mgc):
+    gateway.mgc.base_url = stub_mgc.base_url
+    assert gateway._get_or_fetch_policy("dev2", "tit1") is None
+    assert cache_manager.is_policy_absent("dev2", "tit1")
+    assert gateway._get_or_fetch_policy("dev1", "tit1")["dispositivo_id"] == "dev1"
+
+
+def test_mgc_outage_is_not_cached(gateway, stub_mgc):
+    stub_mgc.stop()
+    gateway.mgc.base_url = stub_mgc.base_url
+    gateway.mgc.timeout = 0.5
+    assert gateway._get_or_fetch_policy("dev1", "tit1") is None
+    assert not cache_manager.is_policy_absent("dev1", "tit1")
+
+
+def test_policy_miss_waits_outside_the_batch(gateway, stub_mgc):
+    stub_mgc.latency = 0.3
+    gateway.mgc.base_url = stub_mgc.base_url
+    cache_manager.set_policies("tit2", {"dev3": consentimento("dev3")})
+    forwarded = []
+    gateway._forward_processed_data = lambda payload, processed, plan: forwarded.append(processed["seq"])
+
+    def message(dispositivo_id, titular_id, seq):
+        return f"dispositivos/{dispositivo_id}/dados", json.dumps({"titular_id": titular_id, "seq": seq}).encode(), None
+
+    start = time.perf_counter()
+    gateway.handle_received_batch([message("dev1", "tit1", 0), message("dev3", "tit2", 100), message("dev1", "tit1", 1)])
+    # O dispositivo com a política em cache não espera a busca do MGC.
+    assert time.perf_counter() - start < stub_mgc.latency
+    assert forwarded == [100]
+    # Mensagens que chegam durante a busca aguardam atrás das anteriores do mesmo par.
+    gateway.handle_received_batch([message("dev1", "tit1", 2)])
+    gateway.policy_fetcher.stop()
+    assert forwarded == [100, 0, 1, 2]
+    assert stub_mgc.requests == 1
+
+
+def test_concurrent_lookups_share_one_request(mgc, stub_mgc):
+    stub_mgc.latency = 0.2
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(mgc.get_politica_privacidade("tit1", "dev1")))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stub_mgc.requests == 1
+    assert mgc.get_stats()["coalesced"] == 4
+    assert [r["dispositivo_id"] for r in results] == ["dev1"] * 5
+    # O callback recebe todos os consentimentos do titular uma única vez por busca.
+    assert mgc.received == [("tit1", {"dev1": consentimento("dev1")})]
+
+
+def test_session_reuses_connection(mgc, stub_mgc):
+    session = mgc.session
+    for _ in range(3):
+        mgc.get_consentimentos_titular("tit1")
+    assert mgc.session is session
+    pools = session.get_adapter(stub_mgc.base_url).poolmanager.pools
+    assert stub_mgc.requests == 3
+    # As três requisições usaram a mesma conexão keep-alive.
+    assert [pools[key].num_connections for key in pools.keys()] == [1]
+
+
+def test_request_errors_are_not_cached(mgc, stub_mgc):
+    stub_mgc.stop()
+    mgc.timeout = 0.5
+    with pytest.raises(MGCError):
+        mgc.get_politica_privacidade("tit1", "dev1")
+    assert mgc.received == []
+    assert mgc.get_stats()["errors"] == 1
+    # A busca seguinte vai de novo ao MGC.
+    stub_mgc.start()
+    mgc.base_url = stub_mgc.base_url
+    assert mgc.get_politica_privacidade("tit1", "dev1")["dispositivo_id"] == "dev1"
+    assert mgc.get_politica_privacidade("tit1", "dev2") is None
+    assert stub_mgc.requests == 2
+
+
+def test_malformed_consents_are_skipped(mgc, stub_mgc):
+    stub_mgc.consentimentos["tit2"] = ["dev1", None, {"opcao_tratamento": {}}, consentimento("dev2")]
+    assert mgc.get_consentimentos_titular("tit2") == {"dev2": consentimento("dev2")}
+    assert mgc.get_stats()["errors"] == 0
+    stub_mgc.consentimentos["tit3"] = {"dispositivo_id": "dev1"}
+    with pytest.raises(MGCError):
+        mgc.get_politica_privacidade("tit3", "dev1")
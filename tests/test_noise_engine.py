@@ -0,0 +1,50 @@
+import copy
+import numpy as np
+from treatments import factory
+from treatments.noise_engine import NoiseEngine, noise_engine
+
+PAYLOADS = [
+    {"dispositivo_id": f"dev{i}", "titular_id": "tit1", "value": 20.0 + i, "ativo": True, "localizacao": {"lat": -23.5, "lon": -46.6}}
+    for i in range(5)
+]
+
+
+def draws(engine, sizes):
+    return np.concatenate([engine.standard_normal(size) for size in sizes])
+
+
+def test_same_seed_same_noise():
+    # Tamanhos que atravessam o fim do buffer e que são maiores que ele.
+    sizes = [3, 5, 7, 20, 2]
+    first = draws(NoiseEngine(42, buffer_size=16), sizes)
+    assert np.array_equal(first, draws(NoiseEngine(42, buffer_size=16), sizes))
+    assert not np.array_equal(first, draws(NoiseEngine(43, buffer_size=16), sizes))
+    engine = NoiseEngine(42, buffer_size=16)
+    engine.standard_normal(4)
+    engine.reseed(42)
+    assert np.array_equal(draws(engine, sizes), first)
+
+
+def test_noise_follows_sigma():
+    engine = NoiseEngine(1)
+    noise = engine.add_noise(np.zeros(20000), np.full(20000, 2.0))
+    assert abs(noise.mean()) < 0.1
+    assert abs(noise.std() - 2.0) < 0.1
+
+
+def test_execute_batch_matches_per_message_path():
+    strategy = factory.get_treatment_strategy("GNOISE")
+    params = {"sigma": 0.5, "sigma.localizacao.lat": 0.01}
+    noise_engine.reseed(7)
+    batch = strategy.execute_batch(copy.deepcopy(PAYLOADS), params)
+    noise_engine.reseed(7)
+    single = [strategy.execute(payload, params) for payload in copy.deepcopy(PAYLOADS)]
+    assert batch == single
+    assert all(result["ativo"] is True and result["value"] != payload["value"] for result, payload in zip(batch, PAYLOADS))
+
+
+def test_standalone_gnoise_keeps_protected_fields():
+    payload = {"dispositivo_id": 17, "titular_id": 42, "value": 1.0}
+    result = factory.get_treatment_strategy("GNOISE").execute(dict(payload), {"sigma": 5.0})
+    assert result["dispositivo_id"] == 17 and result["titular_id"] == 42
+    assert result["value"] != payload["value"]
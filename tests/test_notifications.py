@@ -0,0 +1,76 @@
+import json
+import time
+import pytest
+from core.cache_manager import cache_manager
+from core.gateway import PrivacyGateway
+from core.metrics import REVOKED_PAIRS
+
+PAIRS = [("dev1", "tit1"), ("dev2", "tit1"), ("dev1", "tit2"), ("dev3", "tit3")]
+
+
+@pytest.fixture
+def gateway():
+    gateway = PrivacyGateway()
+    for dispositivo_id, titular_id in PAIRS:
+        cache_manager.set_policies(titular_id, {dispositivo_id: {"dispositivo_id": dispositivo_id}})
+        cache_manager.schedule_aggregation_task(dispositivo_id, titular_id, time.time() - 1)
+    # Entrada negativa só no L1, fora dos índices do backend.
+    cache_manager.set_policy_absent("dev9", "tit1")
+    yield gateway
+    gateway.policy_fetcher.stop()
+    gateway.scheduler.stop()
+
+
+def notify(gateway, **notificacao):
+    gateway.handle_notification(json.dumps(notificacao).encode())
+
+
+def cached():
+    """ Pares com política no L1 e pares com política no backend em memória. """
+    in_l1 = {pair for pair in PAIRS + [("dev9", "tit1")] if cache_manager.local_policies.lookup(pair)[0]}
+    in_backend = {pair for pair, policy in zip(PAIRS, cache_manager.backend.get_policies(PAIRS)) if policy}
+    return in_l1, in_backend
+
+
+def scheduled():
+    return {(d, t) for d, t, _ in cache_manager.claim_due_aggregation_tasks(100, time.time() + 60)}
+
+
+@pytest.mark.parametrize("notificacao, invalidated, purged", [
+    ({"escopo": "titular", "titular_id": "tit1"}, {("dev1", "tit1"), ("dev2", "tit1")}, True),
+    ({"escopo": "dispositivo", "dispositivo_id": "dev1"}, {("dev1", "tit1"), ("dev1", "tit2")}, True),
+    ({"escopo": "lote", "pares": [
+        {"dispositivo_id": "dev2", "titular_id": "tit1"}, {"dispositivo_id": "dev3", "titular_id": "tit3"},
+        {"dispositivo_id": "dev1"}, "dev1",
+    ]}, {("dev2", "tit1"), ("dev3", "tit3")}, False),
+    ({"dispositivo_id": "dev1", "titular_id": "tit2"}, {("dev1", "tit2")}, False),
+    ({"dispositivo_id": "dev1", "titular_id": "tit2", "revogacao": True}, {("dev1", "tit2")}, True),
+])
+def test_notification_scopes(gateway, notificacao, invalidated, purged):
+    escopo = notificacao.get("escopo", "par")
+    before = REVOKED_PAIRS.labels(escopo).value
+    notify(gateway, **notificacao)
+    remaining = set(PAIRS) - invalidated
+    in_l1, in_backend = cached()
+    assert in_l1 - {("dev9", "tit1")} == remaining
+    assert in_backend == remaining
+    # O escopo titular também descarta as entradas negativas do titular no L1.
+    assert (("dev9", "tit1") in in_l1) == (escopo != "titular")
+    assert scheduled() == (remaining if purged else set(PAIRS))
+    assert REVOKED_PAIRS.labels(escopo).value == before + len(invalidated)
+
+
+@pytest.mark.parametrize("payload", [
+    b"{nao e json",
+    json.dumps(["dev1", "tit1"]).encode(),
+    json.dumps({"escopo": "titular"}).encode(),
+    json.dumps({"escopo": "dispositivo", "titular_id": "tit1"}).encode(),
+    json.dumps({"titular_id": "tit1"}).encode(),
+    json.dumps({"escopo": "desconhecido", "dispositivo_id": "dev1", "titular_id": "tit1"}).encode(),
+])
+def test_malformed_notification_changes_nothing(gateway, payload):
+    gateway.handle_notification(payload)
+    in_l1, in_backend = cached()
+    assert in_l1 == set(PAIRS) | {("dev9", "tit1")}
+    assert in_backend == set(PAIRS)
+    assert scheduled() == set(PAIRS)
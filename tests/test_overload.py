@@ -0,0 +1,157 @@
+import json
+import types
+import pytest
+from core.cache_manager import cache_manager
+from core.gateway import PrivacyGateway
+from core.ingestion import IngestionPipeline
+from core.metrics import FAILED_CLOSED, SHED_MESSAGES, THROTTLED
+from core.overload import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, PrioritySelector, RateLimiter, TokenBuckets
+from core.policy_plan import get_policy_plan
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ListPublisher:
+    def __init__(self):
+        self.results = []
+
+    def publish(self, topic, result, strategy):
+        self.results.append(result)
+
+
+def test_token_bucket_refill_and_burst():
+    buckets = TokenBuckets(rate=4, burst=3)
+    assert [buckets.acquire("dev1", 0.0) for _ in range(4)] == [True, True, True, False]
+    # Meio token em 0,125 s; o primeiro token inteiro só em 0,25 s.
+    assert not buckets.acquire("dev1", 0.125)
+    assert buckets.acquire("dev1", 0.25)
+    assert not buckets.acquire("dev1", 0.25)
+    # O reabastecimento para na rajada.
+    assert [buckets.acquire("dev1", 100.0) for _ in range(4)] == [True, True, True, False]
+    # Buckets de outras chaves são independentes.
+    assert buckets.acquire("dev2", 100.0)
+
+
+def test_evicted_bucket_comes_back_full():
+    buckets = TokenBuckets(rate=1, burst=1, max_keys=1)
+    assert buckets.acquire("dev1", 0.0) and not buckets.acquire("dev1", 0.0)
+    assert buckets.acquire("dev2", 0.0)
+    assert len(buckets) == 1
+    assert buckets.acquire("dev1", 0.0)
+
+
+def test_rate_limiter_with_injected_clock():
+    clock = FakeClock()
+    limiter = RateLimiter(device_rate=1, device_burst=2, titular_rate=1, titular_burst=3, clock=clock)
+    assert [limiter.admit("dev1", "tit1") for _ in range(3)] == ["", "", "device"]
+    # Mensagens limitadas pelo dispositivo não consomem o bucket do titular.
+    assert [limiter.admit("dev2", "tit1") for _ in range(2)] == ["", "titular"]
+    clock.now = 1.0
+    assert limiter.admit("dev1", "tit1") == ""
+    assert limiter.admit("dev1", "tit1") == "device"
+    stats = limiter.stats()
+    assert stats["throttled_device"] == 2 and stats["throttled_titular"] == 1
+    assert stats["device_buckets"] == 2 and stats["titular_buckets"] == 1
+
+
+def test_disabled_rate_limiter_admits_everything():
+    limiter = RateLimiter(device_rate=0, device_burst=0, titular_rate=0, titular_burst=0, clock=FakeClock())
+    assert all(limiter.admit("dev1", "tit1") == "" for _ in range(1000))
+    assert limiter.stats()["device_buckets"] == 0
+
+
+def test_priority_selection():
+    selector = PrioritySelector("dispositivos/+/alarme=alta, dispositivos/sensor9/#=baixa, dispositivos/#=normal", default=PRIORITY_LOW)
+    assert selector.select("dispositivos/dev1/alarme") == PRIORITY_HIGH
+    # A primeira regra que casa com o tópico vence.
+    assert selector.select("dispositivos/sensor9/alarme") == PRIORITY_HIGH
+    assert selector.select("dispositivos/sensor9/dados") == PRIORITY_LOW
+    assert selector.select("dispositivos/dev1/dados") == PRIORITY_NORMAL
+    assert selector.select("outros/dev1") == PRIORITY_LOW
+    assert PrioritySelector("").select("dispositivos/dev1/alarme") == PRIORITY_NORMAL
+    with pytest.raises(KeyError):
+        PrioritySelector("dispositivos/#=urgente")
+
+
+def test_shedding_by_priority_watermark():
+    handled = []
+    # Workers parados: a fila só enche. Marcas d'água padrão: baixa 0,5 e normal 0,9.
+    ingestion = IngestionPipeline(handled.extend, num_workers=1, queue_size=10, enqueue_timeout=0.01)
+    shed = {priority: SHED_MESSAGES.labels(label).value for priority, label in (
+        (PRIORITY_LOW, "baixa"), (PRIORITY_NORMAL, "normal"), (PRIORITY_HIGH, "alta"))}
+
+    def submit(priority, count):
+        return [ingestion.submit(f"dispositivos/dev1/{priority}", str(i).encode(), None, priority) for i in range(count)]
+
+    assert submit(PRIORITY_LOW, 7) == [True] * 5 + [False] * 2
+    assert submit(PRIORITY_NORMAL, 6) == [True] * 4 + [False] * 2
+    # Acima da marca d'água de normal, baixa continua descartada e alta ainda entra.
+    assert submit(PRIORITY_LOW, 1) == [False]
+    assert submit(PRIORITY_HIGH, 2) == [True, False]
+    stats = ingestion.stats()
+    assert stats["queue_depth"] == 10 and stats["enqueued"] == 10 and stats["dropped"] == 6
+    assert (stats["shed_baixa"], stats["shed_normal"], stats["shed_alta"]) == (3, 2, 1)
+    assert SHED_MESSAGES.labels("baixa").value == shed[PRIORITY_LOW] + 3
+    assert SHED_MESSAGES.labels("alta").value == shed[PRIORITY_HIGH] + 1
+    ingestion.start()
+    ingestion.stop()
+    # Só as mensagens aceitas chegam ao processamento.
+    assert [topic.rsplit("/", 1)[1] for topic, _, _ in handled] == ["0"] * 5 + ["1"] * 4 + ["2"]
+
+
+@pytest.fixture
+def gateway():
+    gateway = PrivacyGateway()
+    gateway.publisher = ListPublisher()
+    yield gateway
+    gateway.policy_fetcher.stop()
+    gateway.scheduler.stop()
+
+
+def mqtt_message(topic, seq):
+    payload = json.dumps({"titular_id": "tit1", "value": 10.0, "seq": seq}).encode()
+    return types.SimpleNamespace(topic=topic, payload=payload, properties=None)
+
+
+def test_shed_and_throttled_messages_are_never_published(gateway):
+    cache_manager.set_policies("tit1", {"dev1": {"opcao_tratamento": {"chave_politica": "RAW"}}})
+    gateway.ingestion = IngestionPipeline(gateway.handle_received_batch, num_workers=1, queue_size=4, enqueue_timeout=0.01)
+    gateway.priorities = PrioritySelector("dispositivos/+/alarme=alta")
+    clock = FakeClock()
+    gateway.rate_limiter = RateLimiter(device_rate=1, device_burst=3, titular_rate=0, titular_burst=0, clock=clock)
+    throttled = THROTTLED.labels("device").value
+    for seq in range(5):
+        gateway.on_message(None, None, mqtt_message("dispositivos/dev1/dados", seq))
+    gateway.on_message(None, None, mqtt_message("dispositivos/dev1/alarme", 100))
+    gateway.on_message(None, None, mqtt_message("dispositivos/dev1/alarme", 101))
+    # Normal descarta a partir de 3 mensagens na fila (0,9 * 4); alta só com a fila cheia.
+    assert gateway.ingestion.stats()["dropped"] == 3
+    gateway.ingestion.start()
+    gateway.ingestion.stop()
+    # A rajada do dispositivo (3) esgota antes da mensagem 100, que é limitada.
+    assert [r["seq"] for r in gateway.publisher.results] == [0, 1, 2]
+    assert THROTTLED.labels("device").value == throttled + 1
+    clock.now = 1.0
+    gateway.handle_received_batch([("dispositivos/dev1/dados", mqtt_message("", 200).payload, None)])
+    assert [r["seq"] for r in gateway.publisher.results] == [0, 1, 2, 200]
+
+
+def test_strategy_error_fails_closed(gateway, monkeypatch):
+    policy = {"opcao_tratamento": {"chave_politica": "GNOISE"}}
+    cache_manager.set_policies("tit1", {"dev1": policy})
+    plan = get_policy_plan(policy)
+
+    def broken(payloads, params):
+        raise RuntimeError("falha na estratégia")
+
+    monkeypatch.setattr(plan.strategy, "execute_batch", broken)
+    failed = FAILED_CLOSED.labels(plan.action).value
+    gateway.handle_received_batch([("dispositivos/dev1/dados", mqtt_message("", seq).payload, None) for seq in range(3)])
+    assert gateway.publisher.results == []
+    assert FAILED_CLOSED.labels(plan.action).value == failed + 3
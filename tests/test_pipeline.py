@@ -0,0 +1,66 @@
+import copy
+from core.policy_plan import compile_policy_plan
+from treatments import factory
+from treatments.noise_engine import noise_engine
+
+PAYLOAD = {
+    "dispositivo_id": "dev1",
+    "titular_id": "tit1",
+    "value": 23.74,
+    "nome": "Maria Silva",
+    "cpf": "12345678900",
+    "ativo": True,
+    "localizacao": {"lat": -23.55, "lon": -46.63, "historico": [1, 2.5, {"z": 3}]},
+}
+
+
+def run(chave_politica, payloads=None):
+    plan = compile_policy_plan(chave_politica)
+    assert not plan.rejected, plan.error
+    return plan.strategy.execute_batch(copy.deepcopy(payloads or [PAYLOAD]), plan.params)
+
+
+def test_hash_after_noise_treats_text_fields():
+    result = run("GNOISE:sigma=0.1|HASH:campos=nome;cpf")[0]
+    assert result["nome"] != PAYLOAD["nome"] and len(result["nome"]) == 16
+    assert result["cpf"] != PAYLOAD["cpf"] and len(result["cpf"]) == 16
+    assert result["value"] != PAYLOAD["value"]
+    # A ordem das etapas não muda o pseudônimo dos campos de texto.
+    assert run("HASH:campos=nome;cpf|GNOISE:sigma=0.1")[0]["nome"] == result["nome"]
+
+
+def test_round_after_noise_and_values_before_noise():
+    result = run("GNOISE:sigma=0.001|ROUND:casas=1")[0]
+    assert result["value"] == 23.7
+    assert result["localizacao"]["historico"] == [1.0, 2.5, {"z": 3.0}]
+    assert result["nome"] == PAYLOAD["nome"] and result["ativo"] is True
+
+
+def test_noise_pipeline_matches_gnoise_strategy():
+    params = compile_policy_plan("GNOISE:sigma=0.5,sigma.localizacao.lat=0.01").params
+    noise_engine.reseed(7)
+    expected = factory.get_treatment_strategy("GNOISE").execute_batch(copy.deepcopy([PAYLOAD] * 3), params)
+    noise_engine.reseed(7)
+    assert factory.compile_pipeline([("GNOISE", params)]).execute_batch(copy.deepcopy([PAYLOAD] * 3), {}) == expected
+
+
+def test_filters_and_protected_fields():
+    allowed = run("ALLOW:campos=value;localizacao.lat")[0]
+    assert allowed == {"dispositivo_id": "dev1", "titular_id": "tit1", "value": 23.74, "localizacao": {"lat": -23.55}}
+    denied = run("DENY:campos=cpf;localizacao.historico|HASH:campos=nome")[0]
+    assert "cpf" not in denied and "historico" not in denied["localizacao"]
+    assert compile_policy_plan("DENY:campos=dispositivo_id").rejected
+
+
+def test_accumulated_step_moves_to_end():
+    plan = compile_policy_plan("AVG:none:10S:10S|ROUND:campos=value,passo=10")
+    assert plan.action == "ROUND|AVG" and plan.accumulated
+    assert plan.strategy.transform([PAYLOAD])[0]["value"] == 20
+    assert compile_policy_plan("AVG::10S:10S|SUM::10S:10S").rejected
+
+
+def test_input_is_not_modified():
+    payloads = [copy.deepcopy(PAYLOAD)]
+    plan = compile_policy_plan("DENY:campos=cpf|ROUND:casas=0|GNOISE:sigma=1|HASH:campos=nome")
+    plan.strategy.execute_batch(payloads, plan.params)
+    assert payloads == [PAYLOAD]
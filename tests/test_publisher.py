@@ -0,0 +1,18 @@
+from core import publisher
+from core.metrics import PUBLISH_FAILED
+from core.publisher import OutboundPublisher
+
+
+def test_overflow_is_bounded(monkeypatch):
+    monkeypatch.setattr(publisher, "PUBLISHER_ENQUEUE_TIMEOUT", 0.01)
+    monkeypatch.setattr(publisher, "PUBLISHER_OVERFLOW_SIZE", 2)
+    # Thread do publicador parada: só a fila (1) e o buffer de excedentes (2) recebem resultados.
+    outbound = OutboundPublisher(None, queue_size=1)
+    failed = PUBLISH_FAILED.labels("overflow")
+    before = failed.value
+    for i in range(5):
+        outbound.publish("dados_processados/dev1", {"titular_id": "tit1", "seq": i}, "RAW")
+    stats = outbound.stats()
+    assert stats["queue_depth"] == 3
+    assert stats["dropped"] == 2 and stats["submitted"] == 5
+    assert failed.value == before + 2
@@ -0,0 +1,92 @@
+import json
+import time
+import pytest
+from core.policy_plan import compile_policy_plan
+from core.replay import PolicyResolver, ReplayEngine
+
+CHAVE = "AVG:none:60S:60S"
+DEVICES = [("dev1", "tit1"), ("dev2", "tit1"), ("dev3", "tit2")]
+
+
+class ListSink:
+    def __init__(self):
+        self.results = []
+
+    def write(self, results):
+        self.results.extend(results)
+
+
+def records(start, interval, with_time=True):
+    rows = []
+    for i in range(60):
+        dispositivo_id, titular_id = DEVICES[i % len(DEVICES)]
+        row = {"dispositivo_id": dispositivo_id, "titular_id": titular_id, "value": float(i % 7) * 1.5}
+        if with_time:
+            row["timestamp"] = start + i * interval
+        rows.append(row)
+    return rows
+
+
+def replay(tmp_path, rows, **options):
+    path = tmp_path / "gravacao.jsonl"
+    path.write_text("\n".join(json.dumps(row) for row in rows) + "\n")
+    consentimentos = {}
+    for dispositivo_id, titular_id in DEVICES:
+        consentimentos.setdefault(titular_id, {})[dispositivo_id] = {"opcao_tratamento": {"chave_politica": CHAVE}}
+    sink = ListSink()
+    stats = ReplayEngine(PolicyResolver(consentimentos), sink, chunk_size=16, **options).run(str(path))
+    return stats, {(r["dispositivo_id"], r["titular_id"], r["janela"]["fim"]): r["value"] for r in sink.results}
+
+
+def live(rows, window_end):
+    """ Agrega os mesmos pontos pelo caminho do gateway (backend de estado + collect_many). """
+    plan = compile_policy_plan(CHAVE)
+    assert plan.strategy.accumulate(rows, plan.window_spec) == 0
+    summaries = plan.strategy.collect_many(DEVICES, plan.window_spec, window_end)
+    return {(d, t, window_end): plan.strategy.calculate_aggregated_data(s) for (d, t), s in zip(DEVICES, summaries)}
+
+
+def current_window():
+    return int(time.time()) // 60 * 60
+
+
+def test_replay_matches_live_aggregation(tmp_path):
+    start = current_window()
+    rows = records(start, 0.5)
+    stats, replayed = replay(tmp_path, rows)
+    assert stats["windows"] == len(DEVICES) and stats["invalid"] == 0
+    assert replayed == pytest.approx(live(rows, start + 60))
+
+
+def test_replay_without_timestamps_uses_synthetic_clock(tmp_path):
+    start = current_window()
+    stats, replayed = replay(tmp_path, records(start, 0.5, with_time=False), start=start, interval=0.5)
+    assert stats["windows"] == len(DEVICES) and stats["invalid"] == 0
+    assert replayed == pytest.approx(live(records(start, 0.5), start + 60))
+
+
+def test_replay_custom_time_field(tmp_path):
+    start = current_window()
+    rows = [dict(row, medido_em=row.pop("timestamp")) for row in records(start, 0.5)]
+    stats, replayed = replay(tmp_path, rows, time_field="medido_em")
+    assert stats["windows"] == len(DEVICES)
+    assert replayed == pytest.approx(live(records(start, 0.5), start + 60))
+
+
+def test_replay_without_any_time_counts_invalid(tmp_path, caplog):
+    stats, replayed = replay(tmp_path, records(0, 1, with_time=False))
+    assert stats["invalid"] == 60 and replayed == {}
+    assert "sem horário" in caplog.text
+
+
+def test_record_without_time_after_timed_record_in_same_chunk(tmp_path):
+    start = current_window()
+    rows = [
+        {"dispositivo_id": "dev1", "titular_id": "tit1", "value": 1.0, "timestamp": start},
+        {"dispositivo_id": "dev1", "titular_id": "tit1", "value": 3.0},
+        {"dispositivo_id": "dev1", "titular_id": "tit1", "value": 5.0, "timestamp": start + 30},
+    ]
+    stats, replayed = replay(tmp_path, rows)
+    assert stats["invalid"] == 0
+    # O registro sem horário vale no horário do anterior.
+    assert replayed == {("dev1", "tit1", start + 60): pytest.approx(3.0)}
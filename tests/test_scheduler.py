@@ -0,0 +1,95 @@
+import time
+import pytest
+from core.cache_manager import cache_manager
+from core.cluster import ClusterMembership
+from core.metrics import LATE_POINTS
+from core.policy_plan import compile_policy_plan
+from core.scheduler import Scheduler
+
+
+class ListPublisher:
+    def __init__(self):
+        self.results = []
+
+    def publish(self, topic, result, strategy):
+        self.results.append(result)
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = Scheduler(ListPublisher(), mgc=None, cluster=ClusterMembership(cache_manager))
+    yield scheduler
+    scheduler.stop()
+
+
+def accumulate(chave, points):
+    plan = compile_policy_plan(chave)
+    cache_manager.set_policies("tit1", {"dev1": {"opcao_tratamento": {"chave_politica": chave}}})
+    payloads = [{"dispositivo_id": "dev1", "titular_id": "tit1", "value": v, "timestamp": t} for t, v in points]
+    assert plan.strategy.accumulate(payloads, plan.window_spec) == 0
+    return plan.window_spec
+
+
+def run_due_task(scheduler):
+    due = cache_manager.get_next_due_timestamp()
+    lease_until = time.time() + 60
+    cache_manager.backend.schedule_tasks({("dev1", "tit1"): lease_until})
+    scheduler._process_batch([("dev1", "tit1", due)], lease_until)
+    return due
+
+
+def test_ingest_schedules_first_window_with_points(scheduler):
+    now = time.time()
+    window = accumulate("AVG:none:60S:60S", [(now, 1.0), (now - 1, 3.0)])
+    assert cache_manager.get_next_due_timestamp() == window.emission_time(window.window_end_of(window.pane_of(now - 1)))
+
+
+def test_task_released_after_window_without_later_points(scheduler):
+    now = time.time()
+    accumulate("AVG:none:60S:60S", [(now, 1.0), (now, 3.0)])
+    run_due_task(scheduler)
+    assert [r["value"] for r in scheduler.publisher.results] == [2.0]
+    # Sem pontos para as próximas janelas, a tarefa sai da fila até o próximo ponto.
+    assert cache_manager.get_next_due_timestamp() is None
+    window = accumulate("AVG:none:60S:60S", [(now, 5.0)])
+    assert cache_manager.get_next_due_timestamp() == window.emission_time(window.window_end_of(window.pane_of(now)))
+
+
+def test_sliding_window_rescheduled_while_panes_remain(scheduler):
+    now = time.time()
+    window = accumulate("AVG:none:120S:60S", [(now, 4.0)])
+    due = run_due_task(scheduler)
+    # O pane ainda entra na janela seguinte da janela deslizante.
+    assert cache_manager.get_next_due_timestamp() == due + window.slide
+    run_due_task(scheduler)
+    assert [r["value"] for r in scheduler.publisher.results] == [4.0, 4.0]
+    assert cache_manager.get_next_due_timestamp() is None
+
+
+def test_non_finite_and_bool_values_are_rejected(scheduler):
+    now = time.time()
+    window = accumulate("AVG:none:60S:60S", [(now, True), (now, float("nan")), (now, float("inf")), (now, 10 ** 400), (now, 2.0)])
+    summary = compile_policy_plan("AVG:none:60S:60S").strategy.collect_many([("dev1", "tit1")], window, window.window_end_of(window.pane_of(now)))[0]
+    assert summary.count == 1 and summary.mean == 2.0
+
+
+def test_evicted_pane_counts_as_late():
+    plan = compile_policy_plan("AVG:none:60S:60S")
+    window = plan.window_spec
+    pane = window.pane_of(time.time())
+    late = LATE_POINTS.labels("AVG")
+    before = late.value
+    cache_manager.update_window_pane("dev1", "tit1", window, pane, 1.0, strategy="AVG")
+    # Mesma posição do anel, pane mais antigo: já foi despejado.
+    cache_manager.update_window_pane("dev1", "tit1", window, pane - window.ring, 2.0, strategy="AVG")
+    assert late.value == before + 1
+    summary = plan.strategy.collect_many([("dev1", "tit1")], window, window.window_end_of(pane))[0]
+    assert summary.count == 1
+
+
+def test_stop_waits_for_running_loop(scheduler):
+    scheduler.start()
+    scheduler.stop()
+    assert not scheduler.is_alive()
+    with pytest.raises(RuntimeError):
+        scheduler._executor.submit(print)
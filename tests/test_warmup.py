@@ -0,0 +1,54 @@
+import os
+import stat
+import pytest
+from core import warmup
+from core.cache_manager import cache_manager
+
+
+def politica(chave_politica):
+    return {"opcao_tratamento": {"chave_politica": chave_politica}}
+
+
+@pytest.fixture
+def snapshot_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "dados" / "policy_snapshot.bin")
+    monkeypatch.setattr(warmup, "WARMUP_SNAPSHOT_PATH", path)
+    return path
+
+
+def test_snapshot_is_private_file(snapshot_path):
+    cache_manager.set_policies_bulk({"tit1": {"dev1": politica("RAW")}})
+    assert warmup.write_snapshot(snapshot_path) == 1
+    assert stat.S_IMODE(os.stat(snapshot_path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(os.path.dirname(snapshot_path)).st_mode) == 0o700
+
+
+def test_snapshot_skipped_when_backend_is_warm(snapshot_path):
+    cache_manager.set_policies_bulk({"tit1": {"dev1": politica("RAW")}})
+    warmup.write_snapshot(snapshot_path)
+    cache_manager.set_policies_bulk({"tit1": {"dev1": politica("DENY:campos=value")}})
+    assert warmup.PolicyWarmup(mgc=None)._load_snapshot() is False
+    assert cache_manager.get_policy("dev1", "tit1") == politica("DENY:campos=value")
+
+
+def test_snapshot_never_overwrites_cached_policies(snapshot_path):
+    cache_manager.set_policies_bulk({"tit1": {"dev1": politica("RAW"), "dev2": politica("RAW")}})
+    warmup.write_snapshot(snapshot_path)
+    cache_manager.close()
+    cache_manager.set_policies_bulk({"tit1": {"dev1": politica("DENY:campos=value")}})
+    written = cache_manager.set_policies_bulk(warmup.read_snapshot(snapshot_path)[1], 60, only_if_absent=True)
+    assert written == 1
+    assert cache_manager.get_policy("dev1", "tit1") == politica("DENY:campos=value")
+    assert cache_manager.get_policy("dev2", "tit1") == politica("RAW")
+
+
+def test_revocation_discards_snapshot(snapshot_path):
+    cache_manager.set_policies_bulk({"tit1": {"dev1": politica("RAW")}})
+    writer = warmup.SnapshotWriter(snapshot_path)
+    writer.write()
+    assert os.path.exists(snapshot_path)
+    writer.invalidate()
+    assert not os.path.exists(snapshot_path)
+    cache_manager.invalidate_policies(titulares=["tit1"], purge=True)
+    writer.write()
+    assert warmup.read_snapshot(snapshot_path)[1] == {}
@@ -1,17 +1,56 @@
 from abc import abstractmethod
-from typing import List, Any
+from typing import List, Any, Dict, Optional, Tuple
 from .base_strategy import TreatmentStrategy
+from core.windowing import WindowSpec
 
 class AccumulatedStrategy(TreatmentStrategy):
-    """ Class abstrata para todas as estratégias de tratamento que acumulam dados. """
+    """ 
+    Class abstrata para todas as estratégias de tratamento que acumulam dados. Os pontos são
+    acumulados por janela (accumulate) e a agregação de cada janela é feita pelo Scheduler.
+    """
+
+    # Nome da ação na chave_politica (ex: AVG), definido pela factory; rótulo das métricas.
+    name = ""
+
+    def execute(self, payload: Dict[str, Any], policy_params: Dict[str, Any]) -> None:
+        raise NotImplementedError("Estratégias de agregação são executadas por accumulate(), com a janela do plano.")
+
+    @abstractmethod
+    def accumulate(self, payloads: List[Dict[str, Any]], window: WindowSpec) -> int:
+        """ 
+        Acumula um lote de pontos de dado nas janelas a que pertencem (pelo horário do dispositivo).
+        Returns:
+            - O número de pontos descartados por chegarem depois do fechamento da janela.
+        """
+        pass
+
+    def collect(self, device_id: str, titular_id: str, window: WindowSpec, window_end: int) -> Any:
+        """ 
+        Busca o estado acumulado do dispositivo na janela que termina em window_end.
+        Returns:
+            - O estado acumulado, ou um valor vazio/None se nada foi acumulado.
+        """
+        return self.collect_many([(device_id, titular_id)], window, window_end)[0]
+
+    @abstractmethod
+    def collect_many(self, pairs: List[Tuple[str, str]], window: WindowSpec, window_end: int) -> List[Any]:
+        """ Versão em lote de collect, com uma única ida ao Redis para todos os pares. """
+        pass
+
+    def collect_pending(self, pairs: List[Tuple[str, str]], window: WindowSpec, window_end: int) -> List[Tuple[Any, Optional[int]]]:
+        """
+        Como collect_many, acompanhado do fim da próxima janela (depois de window_end) que já
+        tem pontos acumulados, ou None se não houver nenhuma (a tarefa do par pode ser liberada).
+        """
+        return [(state, window_end + window.slide if state else None) for state in self.collect_many(pairs, window, window_end)]
 
     @abstractmethod
-    def calculate_aggregated_data(self, data_points: List[Any]) -> Any:
+    def calculate_aggregated_data(self, data_points: Any) -> Any:
         """ 
         Calcula os dados agregados a partir dos pontos de dado.
         Args:
-            data_points: Uma lista de pontos de dado.
+            data_points: O estado acumulado da janela.
         Returns:
             - Um dicionário com os dados agregados.
         """
-        pass
\ No newline at end of file
+        pass
@@ -0,0 +1,79 @@
+from abc import abstractmethod
+from typing import Any, Dict, FrozenSet, List, Optional
+from .base_strategy import TreatmentStrategy
+from .pipeline import PROTECTED_FIELDS, PipelineStep, TreatmentPipeline
+
+class FieldStrategy(TreatmentStrategy):
+    """
+    Class abstrata para as estratégias que tratam campos do payload (filtros, arredondamento,
+    pseudonimização...). Elas são compiladas como etapas de um TreatmentPipeline, sozinhas ou
+    combinadas na chave_politica com outras estratégias (ex: DENY:campos=senha|ROUND|AVG:none:10M:10M).
+    """
+
+    name = ""
+
+    def execute(self, payload: Dict[str, Any], policy_params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return self.execute_batch([payload], policy_params)[0]
+
+    def execute_batch(self, payloads: List[Dict[str, Any]], policy_params: Dict[str, Any]) -> List[Optional[Dict[str, Any]]]:
+        return TreatmentPipeline([self.compile_step(policy_params)]).execute_batch(payloads, {})
+
+    @abstractmethod
+    def compile_step(self, policy_params: Dict[str, Any]) -> PipelineStep:
+        """
+        Compila a etapa com os parâmetros da chave_politica.
+        Raises:
+            ValueError: se os parâmetros forem inválidos.
+        """
+        pass
+
+
+class ScopedValueStep(PipelineStep):
+    """ Etapa de valor aplicada aos campos de `campos` e aos seus subcampos (sem `campos`, a todos os campos). """
+
+    kind = "value"
+
+    def __init__(self, name: str, fields: FrozenSet[str]):
+        super().__init__(name)
+        self.fields = fields
+        self.scoped = bool(fields)
+        self.root = not fields
+
+    def enter(self, path: str, ctx: Any) -> Any:
+        return True if path in self.fields else ctx
+
+    def apply(self, value: Any, ctx: Any) -> Any:
+        return self.transform(value) if ctx else value
+
+    def transform(self, value: Any) -> Any:
+        return value
+
+
+def parse_fields(policy_params: Dict[str, Any], required: bool = False) -> FrozenSet[str]:
+    """
+    Lê o parâmetro `campos`: caminhos com pontos separados por ";" (ex: campos=senha;localizacao.lat).
+    Raises:
+        ValueError: se `campos` for obrigatório e estiver ausente, ou se citar dispositivo_id/titular_id.
+    """
+    raw = policy_params.get("campos")
+    if isinstance(raw, float) and raw.is_integer():
+        raw = int(raw)
+    fields = frozenset(field.strip() for field in str(raw or "").split(";") if field.strip())
+    if required and not fields:
+        raise ValueError("o parâmetro 'campos' é obrigatório.")
+    protected = fields & PROTECTED_FIELDS
+    if protected:
+        raise ValueError(f"os campos {', '.join(sorted(protected))} não podem ser tratados.")
+    return fields
+
+
+def number_param(policy_params: Dict[str, Any], key: str, default: Optional[float] = None) -> Optional[float]:
+    """ Lê um parâmetro numérico da chave_politica (ValueError se não for um número). """
+    value = policy_params.get(key, default)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"o parâmetro '{key}' deve ser numérico: {value!r}.") from None
+
@@ -0,0 +1,101 @@
+import logging
+import math
+import time
+from abc import abstractmethod
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from .base_accumulated_strategy import AccumulatedStrategy
+from .running_summary import RunningSummary, sketch_bucket
+from core.cache_manager import cache_manager
+from core.metrics import debug_sampled
+from core.windowing import WindowSpec
+
+logger = logging.getLogger(__name__)
+
+class IncrementalAccumulatedStrategy(AccumulatedStrategy):
+    """ 
+    Class abstrata para estratégias de acumulação que mantêm no Redis apenas resumos
+    incrementais (contagem/soma/mín/máx/média/M2 e, opcionalmente, um sketch de quantis)
+    por pane da janela, em vez de guardar todos os pontos de dado brutos.
+    """
+
+    # Estratégias baseadas em quantis precisam que o sketch seja mantido.
+    uses_sketch = False
+
+    def accumulate(self, payloads: List[Dict[str, Any]], window: WindowSpec) -> int:
+        now = time.time()
+        late = 0
+        # Emissão da primeira janela com pontos deste lote, por par: as tarefas liberadas
+        # depois de uma janela vazia voltam a ser agendadas aqui.
+        tasks: Dict[Tuple[str, str], float] = {}
+        for payload in payloads:
+            device_id = payload.get("dispositivo_id")
+            data_point_value = payload.get("value")
+            if not _is_finite_number(data_point_value):
+                debug_sampled(logger, "Erro: Valor do ponto de dado não é um número finito para o dispositivo %s.", device_id)
+                continue
+            pane = window.pane_of(window.point_time(payload, now))
+            if not window.accepts(pane, now):
+                debug_sampled(logger, "Ponto de dado atrasado descartado para o dispositivo %s.", device_id)
+                late += 1
+                continue
+            bucket = sketch_bucket(data_point_value) if self.uses_sketch else None
+            titular_id = payload.get("titular_id")
+            cache_manager.update_window_pane(device_id, titular_id, window, pane, data_point_value, bucket, self.name)
+            due = window.emission_time(window.window_end_of(pane))
+            if due < tasks.get((device_id, titular_id), due + 1):
+                tasks[(device_id, titular_id)] = due
+        cache_manager.schedule_aggregation_tasks(tasks, only_if_earlier=True)
+        return late
+
+    def collect_many(self, pairs: List[Tuple[str, str]], window: WindowSpec, window_end: int) -> List[Optional[RunningSummary]]:
+        return [summary for summary, _ in self.collect_pending(pairs, window, window_end)]
+
+    def collect_pending(self, pairs: List[Tuple[str, str]], window: WindowSpec, window_end: int) -> List[Tuple[Optional[RunningSummary], Optional[int]]]:
+        return [window_state(fields, window, window_end) for fields in cache_manager.get_window_states(pairs)]
+
+    @abstractmethod
+    def calculate_aggregated_data(self, data_points: RunningSummary) -> Any:
+        """ 
+        Calcula os dados agregados a partir do resumo incremental.
+        Args:
+            data_points: O resumo (RunningSummary) dos pontos da janela.
+        """
+        pass
+
+
+def window_state(fields: Dict[str, str], window: WindowSpec, window_end: int) -> Tuple[Optional[RunningSummary], Optional[int]]:
+    """
+    Combina os resumos parciais dos panes da janela que termina em window_end (lidos do anel
+    no Redis).
+    Returns:
+        - (resumo da janela ou None se ela estiver vazia, fim da próxima janela com pontos no
+          anel ou None se não houver nenhuma).
+    """
+    if fields.get("spec") != window.signature:
+        return None, None
+    by_slot: Dict[str, Dict[str, str]] = defaultdict(dict)
+    for field, value in fields.items():
+        slot, sep, name = field.partition("|")
+        if sep:
+            by_slot[slot][name] = value
+    panes = {int(f["pane"]): f for f in by_slot.values() if "pane" in f and float(f.get("count") or 0) > 0}
+    summary = RunningSummary()
+    for pane in window.window_panes(window_end):
+        if pane in panes:
+            summary = summary.merge(RunningSummary.from_hash(panes[pane]))
+    # Panes que ainda entram em alguma janela seguinte (na deslizante, inclusive os desta).
+    first_next = (window_end + window.slide - window.size) // window.pane
+    later = [pane for pane in panes if pane >= first_next]
+    next_end = max(window_end + window.slide, window.window_end_of(min(later))) if later else None
+    return (summary if summary.count else None), next_end
+
+
+def _is_finite_number(value: Any) -> bool:
+    # bool é subclasse de int, mas não é um ponto de dado; NaN e infinito corromperiam o resumo do pane.
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    try:
+        return math.isfinite(value)
+    except OverflowError:
+        return False
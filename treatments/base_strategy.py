@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 class TreatmentStrategy(ABC):
     """ Class abstrata para todas as estratégias de tratamento. """
@@ -15,4 +15,21 @@ class TreatmentStrategy(ABC):
             - Um dicionário com os dados processados, se os dados devem ser encaminhados.
             - None, se os dados devem ser bloqueados ou estão sendo acumulados para processamento posterior.
         """
-        pass
\ No newline at end of file
+        pass
+
+    def execute_batch(self, payloads: List[Dict[str, Any]], policy_params: Dict[str, Any]) -> List[Optional[Dict[str, Any]]]:
+        """ 
+        Executa o tratamento sobre um lote de payloads que compartilham a mesma política.
+        Estratégias que se beneficiam de vetorização sobrescrevem este método.
+        Returns:
+            - Uma lista com o resultado de execute() para cada payload, na mesma ordem.
+        """
+        return [self.execute(payload, policy_params) for payload in payloads]
+
+    def compile_step(self, policy_params: Dict[str, Any]) -> Any:
+        """ 
+        Compila a estratégia como etapa de um pipeline (treatments.pipeline.PipelineStep).
+        Raises:
+            ValueError: se a estratégia não puder ser combinada com outras na chave_politica.
+        """
+        raise ValueError(f"a estratégia {type(self).__name__} não pode ser usada em um pipeline.")
@@ -0,0 +1,47 @@
+import math
+from typing import Any, Dict, FrozenSet
+from .base_field_strategy import FieldStrategy, ScopedValueStep, number_param, parse_fields
+from .pipeline import PipelineStep, is_number
+
+class BucketStrategy(FieldStrategy):
+    """
+    Estratégia de tratamento que generaliza valores numéricos em k faixas de mesma largura
+    (k-bucketing): cada valor é substituído pelo limite inferior da sua faixa. Valores fora
+    do intervalo ficam na primeira ou na última faixa.
+    Parâmetros da chave_politica:
+        k: Número de faixas.
+        min, max: Intervalo dividido em faixas (ex: BUCKET:k=10,min=0,max=100 gera 0, 10, ..., 90).
+        campos: Campos tratados, separados por ";" (padrão: todos os campos numéricos).
+    """
+
+    name = "BUCKET"
+
+    def compile_step(self, policy_params: Dict[str, Any]) -> PipelineStep:
+        buckets = number_param(policy_params, "k")
+        low = number_param(policy_params, "min")
+        high = number_param(policy_params, "max")
+        if buckets is None or low is None or high is None:
+            raise ValueError("os parâmetros 'k', 'min' e 'max' são obrigatórios.")
+        if not buckets.is_integer() or buckets < 1:
+            raise ValueError("o parâmetro 'k' deve ser um inteiro positivo.")
+        if high <= low:
+            raise ValueError("o parâmetro 'max' deve ser maior que 'min'.")
+        return BucketStep(parse_fields(policy_params), int(buckets), low, high)
+
+
+class BucketStep(ScopedValueStep):
+    def __init__(self, fields: FrozenSet[str], buckets: int, low: float, high: float):
+        super().__init__("BUCKET", fields)
+        self.buckets = buckets
+        self.low = low
+        self.width = (high - low) / buckets
+        # Limites inferiores das faixas, calculados uma vez (inteiros quando possível).
+        bounds = [low + index * self.width for index in range(buckets)]
+        integral = low.is_integer() and self.width.is_integer()
+        self.bounds = [int(bound) if integral else round(bound, 9) for bound in bounds]
+
+    def transform(self, value: Any) -> Any:
+        if not is_number(value) or not math.isfinite(value):
+            return value
+        index = int((value - self.low) // self.width)
+        return self.bounds[min(max(index, 0), self.buckets - 1)]
@@ -0,0 +1,9 @@
+from typing import Any
+from .base_incremental_strategy import IncrementalAccumulatedStrategy
+from .running_summary import RunningSummary
+
+class CountStrategy(IncrementalAccumulatedStrategy):
+    """ Estratégia de tratamento que calcula a quantidade dos dados. """
+
+    def calculate_aggregated_data(self, data_points: RunningSummary) -> Any:
+        return data_points.count
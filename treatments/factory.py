@@ -1,25 +1,91 @@
-from typing import Optional, Union
+import importlib
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
 from .base_strategy import TreatmentStrategy
-from .raw_strategy import RawStrategy
-from .gaussian_noise_strategy import GaussianNoiseStrategy
-from .average_strategy import AverageStrategy
 from .base_accumulated_strategy import AccumulatedStrategy
+from .pipeline import TreatmentPipeline
 
+# Estratégias disponíveis: nome -> (módulo, classe, argumentos). O módulo só é importado
+# quando uma política usa a estratégia, então dependências pesadas (ex: NumPy no GNOISE)
+# não são carregadas em gateways que não as usam.
 STRATEGY_MAP = {
-    "RAW": RawStrategy,
-    "GNOISE": GaussianNoiseStrategy,
-    "AVG": AverageStrategy,
+    "RAW": ("treatments.raw_strategy", "RawStrategy", ()),
+    "GNOISE": ("treatments.gaussian_noise_strategy", "GaussianNoiseStrategy", ()),
+    "AVG": ("treatments.average_strategy", "AverageStrategy", ()),
+    "MIN": ("treatments.min_strategy", "MinStrategy", ()),
+    "MAX": ("treatments.max_strategy", "MaxStrategy", ()),
+    "COUNT": ("treatments.count_strategy", "CountStrategy", ()),
+    "SUM": ("treatments.sum_strategy", "SumStrategy", ()),
+    "VAR": ("treatments.variance_strategy", "VarianceStrategy", ()),
+    "STDDEV": ("treatments.stddev_strategy", "StdDevStrategy", ()),
+    "P50": ("treatments.quantile_strategy", "QuantileStrategy", (0.50,)),
+    "P90": ("treatments.quantile_strategy", "QuantileStrategy", (0.90,)),
+    "P95": ("treatments.quantile_strategy", "QuantileStrategy", (0.95,)),
+    "P99": ("treatments.quantile_strategy", "QuantileStrategy", (0.99,)),
+    "ALLOW": ("treatments.field_filter_strategy", "FieldFilterStrategy", (True,)),
+    "DENY": ("treatments.field_filter_strategy", "FieldFilterStrategy", (False,)),
+    "ROUND": ("treatments.round_strategy", "RoundStrategy", ()),
+    "BUCKET": ("treatments.bucket_strategy", "BucketStrategy", ()),
+    "HASH": ("treatments.hash_strategy", "HashStrategy", ()),
 }
 
-ACCUMULATED_STRATEGY_LIST = ["AVG"]
+ACCUMULATED_STRATEGY_LIST = ["AVG", "MIN", "MAX", "COUNT", "SUM", "VAR", "STDDEV", "P50", "P90", "P95", "P99"]
+
+# Estratégias que tratam campos do payload: sempre compiladas como pipeline, mesmo sozinhas.
+FIELD_STRATEGY_LIST = ["ALLOW", "DENY", "ROUND", "BUCKET", "HASH"]
+
+# As estratégias não guardam estado por mensagem, então uma única instância de cada é reaproveitada.
+_strategy_instances: Dict[str, TreatmentStrategy] = {}
+_instances_lock = threading.Lock()
 
 def get_treatment_strategy(strategy_name: str) -> Optional[Union[TreatmentStrategy | AccumulatedStrategy]]:
     """ Retorna a estratégia de tratamento correspondente ao nome fornecido. """
-    strategy_class = STRATEGY_MAP.get(strategy_name.upper())
-    if strategy_class:
-        return strategy_class()
-    return None
+    strategy_name = strategy_name.upper()
+    strategy = _strategy_instances.get(strategy_name)
+    if strategy:
+        return strategy
+    spec = STRATEGY_MAP.get(strategy_name)
+    if not spec:
+        return None
+    module_name, class_name, args = spec
+    with _instances_lock:
+        strategy = _strategy_instances.get(strategy_name)
+        if not strategy:
+            strategy_class = getattr(importlib.import_module(module_name), class_name)
+            strategy = _strategy_instances[strategy_name] = strategy_class(*args)
+            if isinstance(strategy, AccumulatedStrategy):
+                strategy.name = strategy_name
+    return strategy
 
 def is_accumulated_strategy(strategy_name: str) -> bool:
     """ Verifica se a estratégia é de agregação de dados. """
-    return strategy_name.upper() in ACCUMULATED_STRATEGY_LIST
\ No newline at end of file
+    return strategy_name.upper() in ACCUMULATED_STRATEGY_LIST
+
+def is_field_strategy(strategy_name: str) -> bool:
+    """ Verifica se a estratégia trata campos do payload (e só pode ser executada como pipeline). """
+    return strategy_name.upper() in FIELD_STRATEGY_LIST
+
+def compile_pipeline(steps: List[Tuple[str, Dict[str, Any]]]) -> TreatmentPipeline:
+    """ 
+    Compila uma sequência de tratamentos (nome, parâmetros) em um único TreatmentPipeline, que
+    percorre cada payload uma só vez. A estratégia de agregação, se houver, é movida para o fim.
+    Raises:
+        ValueError: estratégia inexistente ou que não pode ser combinada, parâmetros inválidos ou
+            mais de uma estratégia de agregação.
+    """
+    compiled = []
+    final = None
+    for strategy_name, params in steps:
+        strategy = get_treatment_strategy(strategy_name)
+        if not strategy:
+            raise ValueError(f"estratégia de tratamento '{strategy_name}' não encontrada.")
+        if is_accumulated_strategy(strategy_name):
+            if final is not None:
+                raise ValueError("um pipeline pode ter no máximo uma estratégia de agregação.")
+            final = (strategy_name.upper(), strategy)
+            continue
+        try:
+            compiled.append(strategy.compile_step(params))
+        except ValueError as e:
+            raise ValueError(f"{strategy_name.upper()}: {e}") from None
+    return TreatmentPipeline(compiled, final)
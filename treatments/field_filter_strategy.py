@@ -0,0 +1,40 @@
+from typing import Any, Dict, FrozenSet
+from .base_field_strategy import FieldStrategy, parse_fields
+from .pipeline import DROP, PipelineStep
+
+class FieldFilterStrategy(FieldStrategy):
+    """
+    Estratégia de tratamento que mantém (ALLOW) ou remove (DENY) campos do payload.
+    Parâmetros da chave_politica:
+        campos: Caminhos com pontos separados por ";" (ex: ALLOW:campos=value;localizacao.lat).
+    No ALLOW, os campos listados são mantidos com todos os seus subcampos, junto com os campos
+    pais necessários para alcançá-los. dispositivo_id e titular_id são sempre mantidos.
+    """
+
+    def __init__(self, allow: bool):
+        self.allow = allow
+        self.name = "ALLOW" if allow else "DENY"
+
+    def compile_step(self, policy_params: Dict[str, Any]) -> PipelineStep:
+        return FieldFilterStep(self.name, parse_fields(policy_params, required=True), self.allow)
+
+
+class FieldFilterStep(PipelineStep):
+    """ Contexto no ALLOW: True dentro de um campo listado, False nos seus campos pais. """
+
+    kind = "filter"
+    scoped = True
+
+    def __init__(self, name: str, fields: FrozenSet[str], allow: bool):
+        super().__init__(name)
+        self.fields = fields
+        self.allow = allow
+        self.root = False
+        self.ancestors = frozenset(field.rsplit(".", depth)[0] for field in fields for depth in range(1, field.count(".") + 1))
+
+    def enter(self, path: str, ctx: Any) -> Any:
+        if not self.allow:
+            return DROP if path in self.fields else ctx
+        if ctx or path in self.fields:
+            return True
+        return ctx if path in self.ancestors else DROP
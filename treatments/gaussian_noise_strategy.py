@@ -1,21 +1,58 @@
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import numpy as np
 from .base_strategy import TreatmentStrategy
+from .noise_engine import noise_engine
+from .pipeline import PipelineStep, TreatmentPipeline
 
 class GaussianNoiseStrategy(TreatmentStrategy):
-    """ Estratégia de tratamento que adiciona ruído gaussiano aos dados. """
+    """ 
+    Estratégia de tratamento que adiciona ruído gaussiano aos dados.
+    Parâmetros da chave_politica:
+        sigma: Desvio padrão do ruído (padrão 1.0).
+        sigma.<campo>: Desvio padrão específico de um campo; campos aninhados usam o caminho
+            com pontos (ex: sigma.localizacao.lat=0.001). Subcampos herdam o sigma do campo pai.
+    Campos numéricos em dicionários aninhados e em listas também recebem ruído.
+    """
 
     def execute(self, payload: Dict[str, Any], policy_params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return self.execute_batch([payload], policy_params)[0]
+
+    def execute_batch(self, payloads: List[Dict[str, Any]], policy_params: Dict[str, Any]) -> List[Optional[Dict[str, Any]]]:
+        """ Adiciona ruído a todo o lote com uma única operação vetorizada (pipeline de uma etapa). """
+        return TreatmentPipeline([self.compile_step(policy_params)]).execute_batch(payloads, {})
+
+    def compile_step(self, policy_params: Dict[str, Any]) -> PipelineStep:
+        return NoiseStep(*self._parse_sigmas(policy_params))
+
+    def _parse_sigmas(self, policy_params: Dict[str, Any]) -> Tuple[float, Dict[str, float]]:
         try:
             sigma = float(policy_params.get("sigma", 1.0))
-        except:
+        except (TypeError, ValueError):
             sigma = 1.0
+        field_sigmas = {}
+        for key, value in policy_params.items():
+            if key.startswith("sigma."):
+                try:
+                    field_sigmas[key[len("sigma."):]] = float(value)
+                except (TypeError, ValueError):
+                    continue
+        return sigma, field_sigmas
+
+
+class NoiseStep(PipelineStep):
+    """ Etapa de pipeline do GNOISE: o contexto de cada campo é o seu sigma, herdado pelos subcampos. """
+
+    kind = "noise"
+
+    def __init__(self, sigma: float, field_sigmas: Dict[str, float]):
+        super().__init__("GNOISE")
+        self.root = sigma
+        self.field_sigmas = field_sigmas
+        self.scoped = bool(field_sigmas)
+
+    def enter(self, path: str, ctx: Any) -> Any:
+        return self.field_sigmas.get(path, ctx)
+
+    def apply_batch(self, values: List[Any], ctxs: List[Any]) -> List[Any]:
+        return noise_engine.add_noise(np.asarray(values, dtype=float), np.asarray(ctxs, dtype=float)).tolist()
 
-        processed_payload = {}
-        for key, value in payload.items():
-            if isinstance(value, (int, float)):
-                noise = np.random.normal(0, sigma)
-                processed_payload[key] = value + noise
-            else:
-                processed_payload[key] = value
-        return processed_payload
\ No newline at end of file
@@ -0,0 +1,49 @@
+import hashlib
+import hmac
+import logging
+from typing import Any, Dict, FrozenSet, Optional
+from .base_field_strategy import FieldStrategy, ScopedValueStep, number_param, parse_fields
+from .pipeline import PipelineStep
+from core.config import settings
+# Chave do HMAC: sem ela, o pseudônimo é um SHA-256 simples, que pode ser revertido por força bruta em campos com poucos valores possíveis.
+PSEUDONYM_KEY = settings.pseudonym_key
+
+logger = logging.getLogger(__name__)
+
+class HashStrategy(FieldStrategy):
+    """
+    Estratégia de tratamento que pseudonimiza campos: cada valor é substituído por um HMAC-SHA256
+    (com a chave PSEUDONYM_KEY) em hexadecimal. O mesmo valor sempre gera o mesmo pseudônimo,
+    então os dados continuam relacionáveis sem expor o valor original.
+    Parâmetros da chave_politica:
+        campos: Campos pseudonimizados, separados por ";" (obrigatório).
+        tamanho: Caracteres hexadecimais mantidos (padrão 16, de 8 a 64).
+    """
+
+    name = "HASH"
+
+    def __init__(self, key: str = PSEUDONYM_KEY):
+        self.key = key.encode() if key else None
+        if self.key is None:
+            logger.warning("PSEUDONYM_KEY não configurada: o HASH usará SHA-256 sem chave.")
+
+    def compile_step(self, policy_params: Dict[str, Any]) -> PipelineStep:
+        fields = parse_fields(policy_params, required=True)
+        size = number_param(policy_params, "tamanho", 16)
+        if not size.is_integer() or not 8 <= size <= 64:
+            raise ValueError("o parâmetro 'tamanho' deve ser um inteiro entre 8 e 64.")
+        return HashStep(fields, int(size), self.key)
+
+
+class HashStep(ScopedValueStep):
+    def __init__(self, fields: FrozenSet[str], size: int, key: Optional[bytes]):
+        super().__init__("HASH", fields)
+        self.size = size
+        self.key = key
+
+    def transform(self, value: Any) -> Any:
+        if value is None:
+            return value
+        data = str(value).encode()
+        digest = hmac.new(self.key, data, hashlib.sha256) if self.key else hashlib.sha256(data)
+        return digest.hexdigest()[:self.size]
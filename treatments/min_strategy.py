@@ -0,0 +1,9 @@
+from typing import Any
+from .base_incremental_strategy import IncrementalAccumulatedStrategy
+from .running_summary import RunningSummary
+
+class MinStrategy(IncrementalAccumulatedStrategy):
+    """ Estratégia de tratamento que calcula o valor mínimo dos dados. """
+
+    def calculate_aggregated_data(self, data_points: RunningSummary) -> Any:
+        return data_points.min
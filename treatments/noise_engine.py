@@ -0,0 +1,46 @@
+import threading
+from typing import Optional
+import numpy as np
+from core.config import settings
+GNOISE_SEED = settings.gnoise_seed
+GNOISE_BUFFER_SIZE = settings.gnoise_buffer_size
+
+
+class NoiseEngine:
+    """
+    Gerador de ruído gaussiano baseado em um `numpy.random.Generator` semeável.
+    As amostras da normal padrão são geradas em blocos e servidas a partir de um buffer,
+    evitando o custo de uma chamada ao NumPy por valor.
+    """
+
+    def __init__(self, seed: Optional[int] = None, buffer_size: int = GNOISE_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self.reseed(seed)
+
+    def reseed(self, seed: Optional[int]):
+        """ Reinicia o gerador (e descarta o buffer), tornando a sequência de ruído reproduzível. """
+        with self._lock:
+            self._rng = np.random.default_rng(seed)
+            self._buffer = np.empty(0)
+            self._position = 0
+
+    def standard_normal(self, size: int) -> np.ndarray:
+        """ Retorna `size` amostras da normal padrão N(0, 1). """
+        with self._lock:
+            if size > self.buffer_size:
+                return self._rng.standard_normal(size)
+            if self._position + size > len(self._buffer):
+                self._buffer = self._rng.standard_normal(self.buffer_size)
+                self._position = 0
+            samples = self._buffer[self._position:self._position + size]
+            self._position += size
+            return samples
+
+    def add_noise(self, values: np.ndarray, sigmas: np.ndarray) -> np.ndarray:
+        """ Soma a cada valor um ruído N(0, sigma), com um sigma por valor, em uma única operação vetorizada. """
+        return values + self.standard_normal(len(values)) * sigmas
+
+
+# Singleton
+noise_engine = NoiseEngine(GNOISE_SEED)
@@ -0,0 +1,229 @@
+import random
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .base_strategy import TreatmentStrategy
+from .base_accumulated_strategy import AccumulatedStrategy
+from core.config import settings
+from core.metrics import PIPELINE_STEP_LATENCY
+from core.windowing import WindowSpec
+PIPELINE_PROFILE_SAMPLE_RATE = settings.pipeline_profile_sample_rate
+
+# Campos que identificam a origem da mensagem (roteamento e janelas): nenhuma etapa os altera ou remove.
+PROTECTED_FIELDS = frozenset(("dispositivo_id", "titular_id"))
+
+# Contexto retornado por uma etapa de filtro para o campo que deve ser removido.
+DROP = object()
+
+
+class PipelineStep:
+    """
+    Etapa compilada de um pipeline de tratamentos. Cada etapa mantém um contexto por campo,
+    herdado pelos subcampos e pelos elementos de listas: `enter()` calcula o contexto de um
+    campo a partir do seu caminho com pontos (ex: localizacao.lat) e do contexto do campo pai.
+    Tipos de etapa:
+        filter: decide só pelo caminho se o campo é mantido (`enter()` retorna DROP para removê-lo).
+        value: trata cada valor escalar com `apply()`.
+        noise: trata de uma vez todos os valores numéricos do lote com `apply_batch()`.
+        noop: não altera nada (ex: RAW).
+    """
+
+    kind = "noop"
+    # Contexto da raiz do payload e se `enter()` depende do caminho (senão, o contexto da raiz vale para todos os campos).
+    root: Any = None
+    scoped = False
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def enter(self, path: str, ctx: Any) -> Any:
+        return ctx
+
+    def apply(self, value: Any, ctx: Any) -> Any:
+        return value
+
+    def apply_batch(self, values: List[Any], ctxs: List[Any]) -> List[Any]:
+        return [self.apply(value, ctx) for value, ctx in zip(values, ctxs)]
+
+
+class TreatmentPipeline(TreatmentStrategy):
+    """
+    Sequência de tratamentos de uma chave_politica (ex: DENY|ROUND|GNOISE|AVG), compilada uma
+    única vez. Cada payload é percorrido em uma única passada, que monta a única cópia do
+    resultado: os filtros removem campos durante a cópia (eles só dependem do caminho, então
+    valem em qualquer posição do pipeline) e as etapas de valor são encadeadas em cada campo,
+    na ordem da chave. Etapas de ruído são aplicadas ao lote inteiro de uma vez, seguidas das
+    etapas de valor posteriores a elas, sobre os valores escalares registrados na passada. A
+    estratégia de agregação, se houver, é a última etapa e recebe os payloads tratados.
+    """
+
+    def __init__(self, steps: List[PipelineStep], final: Optional[Tuple[str, AccumulatedStrategy]] = None):
+        self.steps = steps
+        self.final = final[1] if final else None
+        names = [step.name for step in steps] + ([final[0]] if final else [])
+        self.name = "|".join(names)
+        self._roots = tuple(step.root for step in steps)
+        self._scoped = [index for index, step in enumerate(steps) if step.scoped]
+        # Etapas de valor agrupadas nos trechos entre as etapas de ruído; o primeiro trecho é aplicado na passada.
+        self._noise: List[int] = []
+        self._segments: List[List[int]] = [[]]
+        for index, step in enumerate(steps):
+            if step.kind == "noise":
+                self._noise.append(index)
+                self._segments.append([])
+            elif step.kind == "value":
+                self._segments[-1].append(index)
+        self._inline = self._segments[0]
+        # Com etapas de valor depois de um ruído, todos os valores escalares (não só os numéricos) são registrados na passada.
+        self._all_slots = any(self._segments[1:])
+        # Latência de cada etapa (na ordem de execução, ex: "0:DENY") e do pipeline inteiro ("total").
+        labels = [f"{index}:{name}" for index, name in enumerate(names)] + ["total"]
+        self._latency = [PIPELINE_STEP_LATENCY.labels(self.name, label) for label in labels]
+
+    @property
+    def uses_sketch(self) -> bool:
+        return getattr(self.final, "uses_sketch", False)
+
+    def execute(self, payload: Dict[str, Any], policy_params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self.final is not None:
+            raise NotImplementedError("Pipelines com agregação são executados por accumulate(), com a janela do plano.")
+        return self.execute_batch([payload], policy_params)[0]
+
+    def execute_batch(self, payloads: List[Dict[str, Any]], policy_params: Dict[str, Any]) -> List[Optional[Dict[str, Any]]]:
+        timer = self._start_timer()
+        processed = self.transform(payloads, timer)
+        if timer is not None:
+            self._observe(timer, len(payloads))
+        return processed
+
+    def accumulate(self, payloads: List[Dict[str, Any]], window: WindowSpec) -> int:
+        timer = self._start_timer()
+        processed = self.transform(payloads, timer)
+        start = time.perf_counter()
+        late = self.final.accumulate(processed, window)
+        if timer is not None:
+            elapsed = time.perf_counter() - start
+            timer[len(self.steps)] += elapsed
+            timer[-1] += elapsed
+            self._observe(timer, len(payloads))
+        return late
+
+    def collect_many(self, pairs: List[Tuple[str, str]], window: WindowSpec, window_end: int) -> List[Any]:
+        return self.final.collect_many(pairs, window, window_end)
+
+    def collect_pending(self, pairs: List[Tuple[str, str]], window: WindowSpec, window_end: int) -> List[Tuple[Any, Optional[int]]]:
+        return self.final.collect_pending(pairs, window, window_end)
+
+    def calculate_aggregated_data(self, data_points: Any) -> Any:
+        return self.final.calculate_aggregated_data(data_points)
+
+    def transform(self, payloads: List[Dict[str, Any]], timer: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Aplica as etapas de campo (todas, exceto a agregação) ao lote.
+        Args:
+            timer: Se informado, acumula nele o tempo gasto em cada etapa (perfilamento amostrado).
+        Returns:
+            - Uma cópia tratada de cada payload, na mesma ordem.
+        """
+        start = time.perf_counter() if timer is not None else 0.0
+        slots: List[Tuple[Any, Any, Sequence[Any]]] = []
+        processed = [self._copy(payload, "", self._roots, slots, timer) for payload in payloads]
+        for position, index in enumerate(self._noise):
+            self._apply_noise(index, self._segments[position + 1], slots, timer)
+        if timer is not None:
+            timer[-1] += time.perf_counter() - start
+        return processed
+
+    def _copy(self, node: Any, path: str, ctxs: Sequence[Any], slots, timer) -> Any:
+        """ Copia o dicionário (ou lista), removendo os campos filtrados e tratando os valores escalares. """
+        if isinstance(node, dict):
+            copy = {}
+            for key, value in node.items():
+                if not path and key in PROTECTED_FIELDS:
+                    copy[key] = value
+                    continue
+                child_path = f"{path}.{key}" if path else str(key)
+                child_ctxs = self._enter(child_path, ctxs, timer) if self._scoped else ctxs
+                if child_ctxs is not None:
+                    copy[key] = self._visit(copy, key, value, child_path, child_ctxs, slots, timer)
+            return copy
+        copy = list(node)
+        for index, value in enumerate(node):
+            copy[index] = self._visit(copy, index, value, path, ctxs, slots, timer)
+        return copy
+
+    def _visit(self, container: Any, key: Any, value: Any, path: str, ctxs: Sequence[Any], slots, timer) -> Any:
+        if isinstance(value, (dict, list)):
+            return self._copy(value, path, ctxs, slots, timer)
+        if self._inline:
+            value = self._chain(value, self._inline, ctxs, timer)
+        if self._noise and (self._all_slots or is_number(value)):
+            # A posição é registrada para que o ruído (e as etapas seguintes) sejam aplicados depois, ao lote inteiro.
+            slots.append((container, key, ctxs))
+        return value
+
+    def _enter(self, path: str, ctxs: Sequence[Any], timer) -> Optional[Sequence[Any]]:
+        """ Contextos das etapas para o campo, ou None se algum filtro o remove. """
+        child = None
+        for index in self._scoped:
+            step = self.steps[index]
+            if timer is None:
+                ctx = step.enter(path, ctxs[index])
+            else:
+                start = time.perf_counter()
+                ctx = step.enter(path, ctxs[index])
+                timer[index] += time.perf_counter() - start
+            if ctx is DROP:
+                return None
+            if ctx is not ctxs[index]:
+                if child is None:
+                    child = list(ctxs)
+                child[index] = ctx
+        return ctxs if child is None else child
+
+    def _chain(self, value: Any, indices: List[int], ctxs: Sequence[Any], timer) -> Any:
+        steps = self.steps
+        if timer is None:
+            for index in indices:
+                value = steps[index].apply(value, ctxs[index])
+            return value
+        for index in indices:
+            start = time.perf_counter()
+            value = steps[index].apply(value, ctxs[index])
+            timer[index] += time.perf_counter() - start
+        return value
+
+    def _apply_noise(self, index: int, after: List[int], slots, timer):
+        """
+        Aplica a etapa de ruído aos valores numéricos do lote e, em seguida, as etapas de valor
+        seguintes a todos os valores registrados (ex: o HASH de GNOISE|HASH também trata os textos).
+        """
+        numeric = [slot for slot in slots if is_number(slot[0][slot[1]])]
+        if numeric:
+            start = time.perf_counter() if timer is not None else 0.0
+            noisy = self.steps[index].apply_batch([container[key] for container, key, _ in numeric], [ctxs[index] for _, _, ctxs in numeric])
+            if timer is not None:
+                timer[index] += time.perf_counter() - start
+            for (container, key, _), value in zip(numeric, noisy):
+                container[key] = value
+        if after:
+            for container, key, ctxs in slots:
+                container[key] = self._chain(container[key], after, ctxs, timer)
+
+    def _start_timer(self) -> Optional[List[float]]:
+        if PIPELINE_PROFILE_SAMPLE_RATE >= 1.0 or (PIPELINE_PROFILE_SAMPLE_RATE > 0.0 and random.random() < PIPELINE_PROFILE_SAMPLE_RATE):
+            return [0.0] * len(self._latency)
+        return None
+
+    def _observe(self, timer: List[float], count: int):
+        if not count:
+            return
+        for histogram, seconds in zip(self._latency, timer):
+            histogram.observe(seconds / count, count)
+
+    def __repr__(self) -> str:
+        return f"TreatmentPipeline({self.name!r})"
+
+
+def is_number(value: Any) -> bool:
+    # bool é subclasse de int, mas não é tratado como número.
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
@@ -0,0 +1,17 @@
+from typing import Any
+from .base_incremental_strategy import IncrementalAccumulatedStrategy
+from .running_summary import RunningSummary
+
+class QuantileStrategy(IncrementalAccumulatedStrategy):
+    """ 
+    Estratégia de tratamento que calcula um quantil aproximado dos dados (ex: P50, P95),
+    a partir de um sketch mergeable com erro relativo limitado.
+    """
+
+    uses_sketch = True
+
+    def __init__(self, quantile: float):
+        self.quantile = quantile
+
+    def calculate_aggregated_data(self, data_points: RunningSummary) -> Any:
+        return data_points.quantile(self.quantile)
@@ -1,8 +1,13 @@
 from typing import Dict, Any, Optional
 from .base_strategy import TreatmentStrategy
+from .pipeline import PipelineStep
 
 class RawStrategy(TreatmentStrategy):
     """ Estratégia de tratamento que permite o encaminhamento dos dados brutos. """
 
     def execute(self, payload: Dict[str, Any], policy_params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        return payload
\ No newline at end of file
+        return payload
+
+    def compile_step(self, policy_params: Dict[str, Any]) -> PipelineStep:
+        # Em um pipeline, RAW não altera nada.
+        return PipelineStep("RAW")
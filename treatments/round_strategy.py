@@ -0,0 +1,43 @@
+from decimal import Decimal
+from typing import Any, Dict, FrozenSet, Optional
+from .base_field_strategy import FieldStrategy, ScopedValueStep, number_param, parse_fields
+from .pipeline import PipelineStep, is_number
+
+class RoundStrategy(FieldStrategy):
+    """
+    Estratégia de tratamento que generaliza valores numéricos por arredondamento.
+    Parâmetros da chave_politica:
+        casas: Casas decimais mantidas (padrão 0, que gera inteiros; negativas arredondam para dezenas, centenas...).
+        passo: Arredonda para o múltiplo mais próximo do passo (ex: passo=5 ou passo=0.25).
+        campos: Campos tratados, separados por ";" (padrão: todos os campos numéricos).
+    """
+
+    name = "ROUND"
+
+    def compile_step(self, policy_params: Dict[str, Any]) -> PipelineStep:
+        step = number_param(policy_params, "passo")
+        if step is not None and step <= 0:
+            raise ValueError("o parâmetro 'passo' deve ser positivo.")
+        places = number_param(policy_params, "casas")
+        if places is not None and not places.is_integer():
+            raise ValueError("o parâmetro 'casas' deve ser inteiro.")
+        if places is None and step is not None and not step.is_integer():
+            # Sem `casas`, o resultado fica com as casas do passo (evita 0.30000000000000004).
+            places = -Decimal(str(step)).as_tuple().exponent
+        elif places is None:
+            places = 0
+        return RoundStep(parse_fields(policy_params), int(places), step)
+
+
+class RoundStep(ScopedValueStep):
+    def __init__(self, fields: FrozenSet[str], places: int, step: Optional[float]):
+        super().__init__("ROUND", fields)
+        self.places = places
+        self.step = int(step) if step is not None and step.is_integer() else step
+
+    def transform(self, value: Any) -> Any:
+        if not is_number(value) or value != value:
+            return value
+        if self.step is not None:
+            value = round(value / self.step) * self.step
+        return round(value, self.places) if self.places else round(value)
@@ -0,0 +1,151 @@
+import math
+from typing import TYPE_CHECKING, Dict, Optional
+from core.config import settings
+if TYPE_CHECKING:
+    import numpy as np
+SKETCH_RELATIVE_ACCURACY = settings.sketch_relative_accuracy
+
+# Sketch de quantis com erro relativo limitado (no estilo DDSketch): cada valor cai em um
+# bucket logarítmico; buckets de sketches diferentes podem ser somados (mergeable).
+_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+_MIN_INDEXABLE = 1e-9
+
+
+def sketch_bucket(value: float) -> str:
+    """ Retorna o nome do campo (no hash do Redis) do bucket do sketch em que o valor cai. """
+    if abs(value) < _MIN_INDEXABLE:
+        return "z"
+    index = math.ceil(math.log(abs(value)) / _LOG_GAMMA)
+    return f"p:{index}" if value > 0 else f"n:{index}"
+
+
+def sketch_bucket_codes(values: "np.ndarray") -> "np.ndarray":
+    """
+    Versão vetorizada de sketch_bucket: um código inteiro por valor (índice * 4 + 1 para
+    buckets positivos, índice * 4 + 2 para negativos e 0 para "z"), convertido no nome do
+    campo por sketch_bucket_name. Usada só pelo replay: o NumPy é importado aqui.
+    """
+    import numpy as np
+    magnitudes = np.abs(values)
+    indexable = magnitudes >= _MIN_INDEXABLE
+    indexes = np.ceil(np.log(np.where(indexable, magnitudes, 1.0)) / _LOG_GAMMA).astype(np.int64)
+    codes = indexes * 4 + np.where(values > 0, 1, 2)
+    return np.where(indexable, codes, 0)
+
+
+def sketch_bucket_name(code: int) -> str:
+    kind = code % 4
+    if kind == 0:
+        return "z"
+    return f"p:{(code - 1) // 4}" if kind == 1 else f"n:{(code - 2) // 4}"
+
+
+def _bucket_value(index: int) -> float:
+    """ Valor representativo de um bucket (ponto médio com erro relativo limitado). """
+    return 2 * _GAMMA ** index / (_GAMMA + 1)
+
+
+class RunningSummary:
+    """
+    Resumo incremental de uma série de valores: contagem, soma, mínimo, máximo,
+    média e M2 (algoritmo de Welford) e, opcionalmente, os buckets do sketch de quantis.
+    """
+
+    def __init__(
+        self,
+        count: int = 0,
+        total: float = 0.0,
+        minimum: Optional[float] = None,
+        maximum: Optional[float] = None,
+        mean: float = 0.0,
+        m2: float = 0.0,
+        buckets: Optional[Dict[str, int]] = None,
+    ):
+        self.count = count
+        self.sum = total
+        self.min = minimum
+        self.max = maximum
+        self.mean = mean
+        self.m2 = m2
+        self.buckets = buckets or {}
+
+    @classmethod
+    def from_hash(cls, fields: Dict[str, str]) -> Optional["RunningSummary"]:
+        """ Reconstrói o resumo a partir do hash armazenado no Redis. """
+        if not fields or not int(fields.get("count", 0)):
+            return None
+        return cls(
+            count=int(fields["count"]),
+            total=float(fields.get("sum", 0)),
+            minimum=float(fields["min"]) if "min" in fields else None,
+            maximum=float(fields["max"]) if "max" in fields else None,
+            mean=float(fields.get("mean", 0)),
+            m2=float(fields.get("m2", 0)),
+            buckets={k: int(v) for k, v in fields.items() if k == "z" or k[:2] in ("p:", "n:")},
+        )
+
+    def add(self, value: float, with_sketch: bool = False):
+        """ Incorpora um valor ao resumo (mesma lógica do script executado no Redis). """
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if with_sketch:
+            bucket = sketch_bucket(value)
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def merge(self, other: "RunningSummary") -> "RunningSummary":
+        """ Combina dois resumos (algoritmo paralelo de Chan et al. para média/M2). """
+        if not other or not other.count:
+            return self
+        if not self.count:
+            return RunningSummary(other.count, other.sum, other.min, other.max, other.mean, other.m2, dict(other.buckets))
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        buckets = dict(self.buckets)
+        for bucket, n in other.buckets.items():
+            buckets[bucket] = buckets.get(bucket, 0) + n
+        return RunningSummary(
+            count=count,
+            total=self.sum + other.sum,
+            minimum=min(self.min, other.min),
+            maximum=max(self.max, other.max),
+            mean=self.mean + delta * other.count / count,
+            m2=self.m2 + other.m2 + delta * delta * self.count * other.count / count,
+            buckets=buckets,
+        )
+
+    @property
+    def variance(self) -> float:
+        """ Variância populacional. """
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def stddev(self) -> float:
+        return math.sqrt(max(self.variance, 0.0))
+
+    def quantile(self, q: float) -> Optional[float]:
+        """ Quantil aproximado (erro relativo de SKETCH_RELATIVE_ACCURACY) a partir do sketch. """
+        if not self.buckets:
+            return None
+        ordered = []
+        for bucket, n in self.buckets.items():
+            if bucket == "z":
+                ordered.append((0.0, n))
+            else:
+                value = _bucket_value(int(bucket[2:]))
+                ordered.append((value if bucket[0] == "p" else -value, n))
+        ordered.sort()
+        rank = q * (sum(n for _, n in ordered) - 1)
+        seen = 0
+        for value, n in ordered:
+            seen += n
+            if seen > rank:
+                # Mantém o resultado dentro dos limites observados.
+                return min(max(value, self.min), self.max)
+        return self.max
+
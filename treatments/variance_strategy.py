@@ -0,0 +1,9 @@
+from typing import Any
+from .base_incremental_strategy import IncrementalAccumulatedStrategy
+from .running_summary import RunningSummary
+
+class VarianceStrategy(IncrementalAccumulatedStrategy):
+    """ Estratégia de tratamento que calcula a variância (populacional) dos dados. """
+
+    def calculate_aggregated_data(self, data_points: RunningSummary) -> Any:
+        return data_points.variance